@@ -0,0 +1,40 @@
+"""add rating aggregates in Photo
+
+Revision ID: 5d1c0f3e9a27
+Revises: b25c92a26661
+Create Date: 2023-05-24 10:12:41.318205
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = '5d1c0f3e9a27'
+down_revision = 'b25c92a26661'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.add_column('photos', sa.Column('rate_count', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('photos', sa.Column('rate_sum', sa.Integer(), server_default='0', nullable=False))
+    op.add_column('photos', sa.Column('avg_rating', sa.Float(), nullable=True))
+    op.create_index(op.f('ix_photos_avg_rating'), 'photos', ['avg_rating'], unique=False)
+    # backfill from existing rates
+    op.execute("""
+        UPDATE photos
+        SET rate_count = agg.rate_count,
+            rate_sum = agg.rate_sum,
+            avg_rating = agg.rate_sum::float / agg.rate_count
+        FROM (SELECT photo_id, count(*) AS rate_count, sum(rate) AS rate_sum
+              FROM rates GROUP BY photo_id) AS agg
+        WHERE photos.id = agg.photo_id
+    """)
+
+
+def downgrade() -> None:
+    op.drop_index(op.f('ix_photos_avg_rating'), table_name='photos')
+    op.drop_column('photos', 'avg_rating')
+    op.drop_column('photos', 'rate_sum')
+    op.drop_column('photos', 'rate_count')
@@ -0,0 +1,26 @@
+"""add created_at indexes in Photo
+
+Revision ID: a8e4b6d21c53
+Revises: 5d1c0f3e9a27
+Create Date: 2023-05-24 16:05:12.904417
+
+"""
+from alembic import op
+import sqlalchemy as sa
+
+
+# revision identifiers, used by Alembic.
+revision = 'a8e4b6d21c53'
+down_revision = '5d1c0f3e9a27'
+branch_labels = None
+depends_on = None
+
+
+def upgrade() -> None:
+    op.create_index(op.f('ix_photos_created_at'), 'photos', ['created_at'], unique=False)
+    op.create_index('ix_photos_user_id_created_at', 'photos', ['user_id', 'created_at'], unique=False)
+
+
+def downgrade() -> None:
+    op.drop_index('ix_photos_user_id_created_at', table_name='photos')
+    op.drop_index(op.f('ix_photos_created_at'), table_name='photos')
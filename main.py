@@ -1,9 +1,10 @@
+import asyncio
 import pathlib
 import time
+from urllib.parse import urlparse
 #from ipaddress import ip_address
 #from typing import Callable
 import uvicorn
-import redis.asyncio as redis
 
 from fastapi import Depends, FastAPI, HTTPException, Request#, status
 from fastapi.responses import HTMLResponse#, JSONResponse
@@ -16,8 +17,15 @@ from sqlalchemy.orm import Session
 from sqlalchemy import text
 #from starlette.middleware.authentication import AuthenticationMiddleware
 
-from src.database.db import get_db#, client_redis_for_main
-from src.routes import photos, auth, users, comments, tags, photo_transformations, rates, photo_filters
+from src.database.db import get_db, engine, async_engine, read_engine, async_read_engine, pool_metrics, \
+    mark_recent_write, client_redis
+from src.routes import photos, auth, users, comments, tags, photo_transformations, rates, photo_filters, jobs
+from src.services.auth import auth_service
+from src.services.executor import executor
+from src.services.invalidation import bus
+from src.services.revocation import revocations
+from src.services.jobs import queue
+from src.services.limiter import local_limiter, rate_limit_headers_middleware
 
 from src.conf.config import settings
 
@@ -28,16 +36,30 @@ favicon_path = 'static/images/favicon.ico'
 
 @app.on_event("startup")
 async def startup():
-    
-    redis_cache = await redis.Redis(
-        host=settings.redis_host,
-        port=settings.redis_port,
-        password=settings.redis_password,
-        db=0,
-        encoding="utf-8",
-        decode_responses=True
-    )
-    await FastAPILimiter.init(redis_cache)
+    # the limiter shares the app's pooled async client, see src.database.db
+    await FastAPILimiter.init(client_redis)
+    # new password hashes take settings.bcrypt_target_ms on this machine
+    await auth_service.calibrate_password_hash()
+    # evictions published by the other workers, see src.services.invalidation
+    app.state.invalidation_listener = asyncio.create_task(bus.listen())
+    # the local Bloom filter of revoked tokens, rebuilt from redis now and then, see src.services.revocation
+    app.state.revocation_sync = asyncio.create_task(revocations.sync_forever())
+    if settings.job_backend == 'memory':
+        # no separate worker processes, the jobs run in this one
+        app.state.job_worker = asyncio.create_task(queue.work())
+    if settings.rate_limit_sync_seconds > 0:
+        # the local rate limits approximately cluster-wide, see src.services.limiter
+        app.state.rate_limit_sync = asyncio.create_task(local_limiter.sync_forever())
+
+
+@app.on_event("shutdown")
+async def shutdown():
+    app.state.invalidation_listener.cancel()
+    app.state.revocation_sync.cancel()
+    for task in (getattr(app.state, 'job_worker', None), getattr(app.state, 'rate_limit_sync', None)):
+        if task is not None:
+            task.cancel()
+    executor.shutdown()
     
     
 app.add_middleware(
@@ -46,6 +68,8 @@ app.add_middleware(
     allow_credentials=True,
     allow_methods=["*"],
     allow_headers=["*"],
+    expose_headers=["X-Next-Cursor", "X-RateLimit-Limit", "X-RateLimit-Remaining", "X-RateLimit-Reset",
+                    "Retry-After"],
 )    
    
     
@@ -85,9 +109,31 @@ async def custom_middleware(request: Request, call_next):
     response.headers['performance'] = str(during)
     return response
 
+@app.middleware('http')
+async def read_your_writes_middleware(request: Request, call_next):
+    """
+    The read_your_writes_middleware function marks callers that have just changed data,
+    so their following reads are served by the primary database instead of the read replica.
+
+    :param request: Request: Get the request object
+    :param call_next: Call the next middleware in the chain
+    :return: A response object
+    """
+    response = await call_next(request)
+    if request.method not in ('GET', 'HEAD', 'OPTIONS') and response.status_code < 400:
+        mark_recent_write(request)
+    return response
+
+# the X-RateLimit-* headers of src.services.limiter.UserRateLimit
+app.middleware('http')(rate_limit_headers_middleware)
+
 templates = Jinja2Templates(directory='templates')
 BASE_DIR = pathlib.Path(__file__).parent
 app.mount("/static", StaticFiles(directory=BASE_DIR / "static"), name="static")
+if settings.storage_backend == 'local':
+    # photos kept by src.services.storage.LocalStorage
+    app.mount(urlparse(settings.local_storage_url).path, StaticFiles(directory=settings.local_storage_path),
+              name="media")
 
 
 @app.get('/favicon.ico', include_in_schema=False)
@@ -134,6 +180,35 @@ def healthchecker(db: Session = Depends(get_db)):
         raise HTTPException(status_code=500, detail="Error connecting to the database")
 
 
+@app.get("/api/healthchecker/pool")
+def pool_checker():
+    """
+    The pool_checker function returns the connection pool state of the database engines:
+    pool size, checked-in and checked-out connections, overflow and the time spent waiting for a connection.
+
+    :return: A dictionary with the pool metrics per engine
+    """
+    metrics = {'primary': pool_metrics(engine)}
+    if async_engine is not None:
+        metrics['async'] = pool_metrics(async_engine.sync_engine)
+    if read_engine is not None:
+        metrics['read'] = pool_metrics(read_engine)
+    if async_read_engine is not None:
+        metrics['async_read'] = pool_metrics(async_read_engine.sync_engine)
+    return metrics
+
+
+@app.get("/api/healthchecker/executor")
+def executor_checker():
+    """
+    The executor_checker function returns the state of the cpu executor:
+    its kind and size, the tasks running or waiting for a worker and the average task time.
+
+    :return: A dictionary with the executor metrics
+    """
+    return executor.metrics()
+
+
 app.include_router(auth.router, prefix='/api')
 app.include_router(users.router, prefix='/api')
 app.include_router(photos.router, prefix='/api')
@@ -142,6 +217,7 @@ app.include_router(photo_filters.router, prefix='/api')
 app.include_router(comments.router, prefix='/api')
 app.include_router(tags.router, prefix='/api')
 app.include_router(rates.router, prefix='/api')
+app.include_router(jobs.router, prefix='/api')
 
 
 
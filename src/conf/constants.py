@@ -28,3 +28,14 @@ MIN_LEN_PHOTO_FILTER_NAME = 3
 MAX_LEN_PHOTO_FILTER_NAME = 128
 MAX_LEN_PHOTO_FILTER_DESC = 128
 
+#-->schemas/photo_transformations
+MAX_BATCH_TRANSFORMATIONS = 500
+
+
+#-->services/limiter, requests per minute by operation and role
+RATE_LIMITS = {
+    'read': {'admin': 600, 'moderator': 300, 'user': 300},
+    'upload': {'admin': 60, 'moderator': 10, 'user': 10},
+    'transform': {'admin': 120, 'moderator': 20, 'user': 20},
+    'qrcode': {'admin': 120, 'moderator': 30, 'user': 30},
+}
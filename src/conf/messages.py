@@ -15,6 +15,7 @@ NOT_FOUND = "Not Found"
 INVALID_SCOPE_FOR_TOKEN = "Invalid scope for token"
 INVALID_TOKEN_FOR_EMAIL_VERIFICATION = "Invalid token for email verification"
 COULD_NOT_VALIDATE_CREDENTIALS = "Could not validate credentials"
+TOKEN_REVOKED = "Token has been revoked"
 FORBIDDEN = "Operation forbidden"
 USER_NOT_FOUND = 'User not found'
 PHOTO_NOT_FOUND = "Photo not found"
@@ -23,8 +24,14 @@ TAGS_NOT_FOUND = "Tags not found"
 COULD_NOT_FIND_FOTO = "Could not find photo"
 COULD_NOT_FIND_FOTO_TRANSFORMATION = "Could not find photo transformation"
 COULD_NOT_FIND_FOTO_FILTER = "Could not find photo filter"
+COULD_NOT_FIND_FOTOS = "Could not find photos"
 DUPLICATE_RATING = "You have already rated this photo"
 BAD_REQUEST = "Bad request"
+INVALID_CURSOR = "Invalid cursor"
+INVALID_PRESET = "Invalid transformation preset"
+INVALID_IMAGE = "The file is not a jpeg, png, webp or gif image"
+JOB_NOT_FOUND = "Job not found"
+TOO_MANY_REQUESTS = "Too many requests"
 EXIT_COMPLETED_SUCCESSFULLY = "Exit completed successfully"
 TOO_MANY_TAGS = "Too many tags. Max quantity tags must be 5"
 TOO_MANY_TAGS_UNDER_THE_PHOTO = "Many tags under the photo. Delete any old ones first"
\ No newline at end of file
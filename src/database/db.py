@@ -1,16 +1,98 @@
+import hashlib
+import time
+from contextlib import asynccontextmanager
+
 from sqlalchemy import create_engine
-from sqlalchemy.orm import sessionmaker
-from sqlalchemy.exc import SQLAlchemyError
-from fastapi import HTTPException, status
-#import redis.asyncio as redis
+from sqlalchemy.engine import Engine, make_url
+from sqlalchemy.ext.asyncio import AsyncSession, async_sessionmaker, create_async_engine
+from sqlalchemy.orm import Session, sessionmaker
+from sqlalchemy.pool import AsyncAdaptedQueuePool, QueuePool
+from sqlalchemy.exc import DBAPIError, SQLAlchemyError
+from fastapi import HTTPException, Request, status
+import redis.asyncio as redis
 
 from src.conf.config import settings
+from src.conf.logger import get_logger
+
+logger = get_logger(__name__)
+
+
+def async_database_url(url: str) -> str:
+    return make_url(url).set(drivername='postgresql+asyncpg').render_as_string(hide_password=False)
+
 
 SQLALCHEMY_DATABASE_URL = settings.sqlalchemy_database_url
+SQLALCHEMY_ASYNC_DATABASE_URL = settings.sqlalchemy_async_database_url or async_database_url(SQLALCHEMY_DATABASE_URL)
+SQLALCHEMY_READ_DATABASE_URL = settings.sqlalchemy_read_database_url
+
+
+class TimedPoolMixin:
+    """Records how long checkouts wait for a connection, exposed by pool_metrics."""
+    wait_count = 0
+    wait_total = 0.0
+    wait_max = 0.0
+
+    def _do_get(self):
+        start = time.perf_counter()
+        try:
+            return super()._do_get()
+        finally:
+            waited = time.perf_counter() - start
+            self.wait_count += 1
+            self.wait_total += waited
+            self.wait_max = max(self.wait_max, waited)
+
+
+class TimedQueuePool(TimedPoolMixin, QueuePool):
+    pass
+
+
+class TimedAsyncQueuePool(TimedPoolMixin, AsyncAdaptedQueuePool):
+    pass
 
-engine = create_engine(SQLALCHEMY_DATABASE_URL, echo=True)
+
+def engine_options() -> dict:
+    return {'echo': settings.sqlalchemy_echo,
+            'pool_size': settings.sqlalchemy_pool_size,
+            'max_overflow': settings.sqlalchemy_max_overflow,
+            'pool_timeout': settings.sqlalchemy_pool_timeout,
+            'pool_pre_ping': settings.sqlalchemy_pool_pre_ping,
+            'pool_recycle': settings.sqlalchemy_pool_recycle}
+
+
+def pool_metrics(db_engine: Engine) -> dict:
+    pool = db_engine.pool
+    return {'size': pool.size(),
+            'checked_in': pool.checkedin(),
+            'checked_out': pool.checkedout(),
+            'overflow': pool.overflow(),
+            'wait_count': pool.wait_count,
+            'wait_avg_ms': round(pool.wait_total / pool.wait_count * 1000, 3) if pool.wait_count else 0,
+            'wait_max_ms': round(pool.wait_max * 1000, 3)}
+
+
+engine = create_engine(SQLALCHEMY_DATABASE_URL, poolclass=TimedQueuePool, **engine_options())
 SessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=engine)
 
+# asyncpg engine, only created when the async session path is switched on in settings, used by get_read_db
+async_engine = create_async_engine(SQLALCHEMY_ASYNC_DATABASE_URL, poolclass=TimedAsyncQueuePool,
+                                   **engine_options()) if settings.sqlalchemy_async else None
+AsyncSessionLocal = async_sessionmaker(async_engine, autoflush=False, expire_on_commit=False) \
+    if settings.sqlalchemy_async else None
+
+# optional read replica for the read-heavy GET routes, see get_read_db
+read_engine = create_engine(SQLALCHEMY_READ_DATABASE_URL, poolclass=TimedQueuePool, **engine_options()) \
+    if SQLALCHEMY_READ_DATABASE_URL and not settings.sqlalchemy_async else None
+ReadSessionLocal = sessionmaker(autocommit=False, autoflush=False, bind=read_engine) if read_engine else None
+async_read_engine = create_async_engine(async_database_url(SQLALCHEMY_READ_DATABASE_URL),
+                                        poolclass=TimedAsyncQueuePool, **engine_options()) \
+    if SQLALCHEMY_READ_DATABASE_URL and settings.sqlalchemy_async else None
+AsyncReadSessionLocal = async_sessionmaker(async_read_engine, autoflush=False, expire_on_commit=False) \
+    if async_read_engine else None
+
+replica_down_until = 0.0
+recent_writers: dict[str, float] = {}
+
 
 def get_db():
     db = SessionLocal()
@@ -23,12 +105,122 @@ def get_db():
         db.close()
 
 
-# client_redis = redis.Redis(
-#     host=settings.redis_host,
-#     port=settings.redis_port,
-#     #password=settings.redis_password,
-#     db=0,
-# )
+@asynccontextmanager
+async def session_scope(db: Session | AsyncSession):
+    if not isinstance(db, AsyncSession):
+        try:
+            yield db
+        except SQLAlchemyError as err:
+            db.rollback()
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+        finally:
+            db.close()
+        return
+
+    async with db:
+        try:
+            yield db
+        except SQLAlchemyError as err:
+            await db.rollback()
+            raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=str(err))
+
+
+def writer_key(request: Request) -> str | None:
+    authorization = request.headers.get('authorization')
+    return hashlib.sha256(authorization.encode()).hexdigest() if authorization else None
+
+
+def mark_recent_write(request: Request) -> None:
+    """
+    The mark_recent_write function remembers that the caller has just written to the primary,
+    so get_read_db keeps its reads on the primary for settings.read_your_writes_seconds.
+    The window is kept per worker process.
+
+    :param request: Request: The request that wrote to the database
+    :return: None
+    """
+    key = writer_key(request)
+    if key is None:
+        return
+    now = time.monotonic()
+    for expired in [k for k, until in recent_writers.items() if until <= now]:
+        del recent_writers[expired]
+    recent_writers[key] = now + settings.read_your_writes_seconds
+
+
+def wrote_recently(request: Request) -> bool:
+    key = writer_key(request)
+    return key is not None and recent_writers.get(key, 0) > time.monotonic()
+
+
+async def connect_replica(db: Session | AsyncSession) -> bool:
+    global replica_down_until
+    try:
+        if isinstance(db, AsyncSession):
+            await db.connection()
+        else:
+            db.connection()
+        return True
+    except DBAPIError as err:
+        logger.warning(f'read replica unavailable, falling back to primary: {err}')
+        replica_down_until = time.monotonic() + settings.sqlalchemy_read_retry_seconds
+        if isinstance(db, AsyncSession):
+            await db.close()
+        else:
+            db.close()
+        return False
+
+
+async def get_read_db(request: Request):
+    """
+    The get_read_db function is a dependency for the read-only GET routes.
+    It yields a session on the read replica when one is configured, and falls back to the primary
+    when the replica is unreachable or the caller has written within the read-your-writes window.
+
+    :param request: Request: Get the caller's authorization header
+    :return: An AsyncSession or a Session
+    """
+    read_session = AsyncReadSessionLocal or ReadSessionLocal
+    db = None
+    if read_session and not wrote_recently(request) and time.monotonic() >= replica_down_until:
+        db = read_session()
+        if not await connect_replica(db):
+            db = None
+    async with session_scope(db or (AsyncSessionLocal or SessionLocal)()) as db:
+        yield db
+
+
+async def execute(db: Session | AsyncSession, statement):
+    """
+    The execute function runs a select() statement on either kind of session,
+    so one repository function serves both the sync and the async path.
+
+    :param db: Session | AsyncSession: The database session
+    :param statement: The statement to execute
+    :return: A Result object
+    """
+    if isinstance(db, AsyncSession):
+        return await db.execute(statement)
+    return db.execute(statement)
+
+
+# shared async client, connects lazily on the first command
+client_redis = redis.Redis(
+    host=settings.redis_host,
+    port=settings.redis_port,
+    password=settings.redis_password,
+    db=0,
+    encoding="utf-8",
+    decode_responses=True
+)
+
+# same server, for the caches that keep binary values
+client_redis_bytes = redis.Redis(
+    host=settings.redis_host,
+    port=settings.redis_port,
+    password=settings.redis_password,
+    db=0,
+)
 
 # client_redis_for_main = redis.Redis(
 #     host=settings.redis_host,
@@ -1,7 +1,7 @@
 import enum
 from sqlalchemy import Enum
 
-from sqlalchemy import Boolean, Column, Date, Integer, String, UniqueConstraint, func
+from sqlalchemy import Boolean, Column, Date, Float, Index, Integer, String, UniqueConstraint, func
 from sqlalchemy.dialects.postgresql import JSONB
 from sqlalchemy.orm import declarative_base, relationship
 from sqlalchemy.sql.schema import ForeignKey, Table
@@ -52,8 +52,13 @@ class Photo(Base):
     description = Column(String(255), nullable=True)
     transformations = relationship('PhotoTransformation', cascade='all, delete-orphan', back_populates='original_photo')
     tags = relationship('Tag', secondary=photo_m2m_tag, back_populates='photos')
-    created_at = Column(DateTime, default=func.now())
+    # rating aggregates maintained by src.repository.rates, avoids GROUP BY over rates on listing
+    rate_count = Column(Integer, nullable=False, default=0, server_default='0')
+    rate_sum = Column(Integer, nullable=False, default=0, server_default='0')
+    avg_rating = Column(Float, nullable=True, index=True)
+    created_at = Column(DateTime, default=func.now(), index=True)
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    __table_args__ = (Index('ix_photos_user_id_created_at', 'user_id', 'created_at'),)
 
 
 class Tag(Base):
@@ -94,9 +99,11 @@ class PhotoTransformation(Base):
     photo_id = Column(ForeignKey('photos.id', ondelete='CASCADE'), nullable=False)
     transformed_url = Column(String(255), nullable=False)
     description = Column(String(255), nullable=True)
+    preset_hash = Column(String(64), nullable=True)  # sha256 of the canonical preset, NULL for older rows
     original_photo = relationship('Photo', back_populates='transformations')
     created_at = Column(DateTime, default=func.now())
     updated_at = Column(DateTime, default=func.now(), onupdate=func.now())
+    __table_args__ = (UniqueConstraint('photo_id', 'preset_hash', name='unique_photo_preset'),)
 
 
 class Rate(Base):
@@ -1,5 +1,8 @@
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from src.database.db import execute
 from src.database.models import Comment, User
 
 from src.schemas.comments import CommentModel, CommentUpdateModel
@@ -18,8 +21,8 @@ async def get_comment_by_id(comment_id: int, db: Session):
     return comment
 
 
-async def get_comments_by_photo(photo_id: int, db: Session):
-    comments = db.query(Comment).filter(Comment.photo_id == photo_id).all()
+async def get_comments_by_photo(photo_id: int, db: Session | AsyncSession):
+    comments = (await execute(db, select(Comment).filter(Comment.photo_id == photo_id))).scalars().all()
     return comments
 
 
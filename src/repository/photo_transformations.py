@@ -1,7 +1,9 @@
 from typing import Optional, Type, List
 
 from fastapi import HTTPException, status
+from pydantic import ValidationError
 
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 
 import src.conf.messages as message
@@ -9,8 +11,9 @@ from src.database.models import PhotoTransformation, Photo, Role
 from src.repository.photo_filters import get_filter_preset_by_id, create_photo_filter
 from src.schemas.photo_filters import PhotoFilterModel
 from src.schemas.photo_transformations import (
-    PhotoTransformationModel, NewDescTransformationModel, TransformationModel)
-from src.services.photo_transformations import build_transformed_url
+    PhotoTransformationModel, NewDescTransformationModel, TransformationModel, BatchTransformationModel)
+from src.services.image_engine import preset_hash
+from src.services.photo_transformations import build_transformed_url, schedule_render
 
 advanced_roles_create = []
 advanced_roles_read = []
@@ -30,6 +33,66 @@ async def get_photo_public_id(photo_id: int, db: Session) -> str:  # waiting_for
     return db.query(Photo.cloud_public_id).filter_by(id=photo_id).one()[0]
 
 
+async def get_transformation_by_preset(photo_id: int, preset_hash_: str,
+                                       db: Session) -> Optional[PhotoTransformation]:
+    return db.query(PhotoTransformation).filter_by(photo_id=photo_id, preset_hash=preset_hash_).first()
+
+
+async def get_photos_owners(photo_ids: List[int], db: Session) -> List[tuple[int, int, str]]:
+    return db.query(Photo.id, Photo.user_id, Photo.cloud_public_id).filter(Photo.id.in_(photo_ids)).all()
+
+
+async def get_transformations_by_preset(photo_ids: List[int], preset_hash_: str,
+                                        db: Session) -> List[PhotoTransformation]:
+    return db.query(PhotoTransformation) \
+        .filter(PhotoTransformation.photo_id.in_(photo_ids), PhotoTransformation.preset_hash == preset_hash_) \
+        .order_by(PhotoTransformation.photo_id).all()
+
+
+async def save_transformation(photo_id: int, transformation: TransformationModel, description: Optional[str],
+                              db: Session, render: bool = True) -> PhotoTransformation:
+    # the same preset applied twice to one photo returns the existing row, nothing is rebuilt
+    preset_hash_ = preset_hash(transformation.preset)
+    existing = await get_transformation_by_preset(photo_id, preset_hash_, db)
+    if existing:
+        return existing
+    # None when a concurrent request has just inserted the same preset
+    return await insert_transformation(photo_id, transformation, description, db, render) or \
+        await get_transformation_by_preset(photo_id, preset_hash_, db)
+
+
+async def insert_transformation(photo_id: int, transformation: TransformationModel, description: Optional[str],
+                                db: Session, render: bool = True) -> Optional[PhotoTransformation]:
+    """
+    The insert_transformation function adds the transformation of the photo and schedules its rendering.
+
+    :param photo_id: int: The id of the photo
+    :param transformation: TransformationModel: The preset to apply
+    :param description: Optional[str]: The description of the transformation
+    :param db: Session: Access the database
+    :param render: bool: Schedule the rendering, the caller does it when False
+    :return: The new transformation, None if the photo has one with this preset already
+    """
+    public_id = await get_photo_public_id(photo_id, db)
+    new_transformation = PhotoTransformation()
+    new_transformation.photo_id = photo_id
+    new_transformation.preset_hash = preset_hash(transformation.preset)
+    new_transformation.transformed_url = build_transformed_url(public_id, transformation)
+    new_transformation.description = description
+
+    db.add(new_transformation)
+    try:
+        db.commit()
+    except IntegrityError:
+        db.rollback()
+        return None
+    db.refresh(new_transformation)
+    if render:
+        await schedule_render(public_id, transformation)
+
+    return new_transformation
+
+
 async def advanced_rights_check(photo_id: int,
                                 cur_user_id: int,
                                 cur_user_role: Role,
@@ -47,25 +110,30 @@ async def get_transformed_photos(photo_id: int, user_id: int, user_role: Role,
     return db.query(PhotoTransformation).filter_by(photo_id=photo_id).order_by(PhotoTransformation.description).all()
 
 
+async def get_filter_transformation(filter_id: int, db: Session) -> TransformationModel:
+    """
+    The get_filter_transformation function returns the preset of a saved filter, validated.
+
+    :param filter_id: int: The id of the filter
+    :param db: Session: Access the database
+    :return: The transformation of the filter
+    """
+    try:
+        return TransformationModel(preset=await get_filter_preset_by_id(filter_id, db))
+    except ValidationError:
+        # saved before the presets were validated
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=message.INVALID_PRESET)
+
+
 async def create_transformation_from_preset(filter_id: int, photo_id: int, description: NewDescTransformationModel,
                                             user_id: int,
                                             user_role: Role, db: Session) -> Optional[PhotoTransformation]:
     await advanced_rights_check(photo_id, user_id, user_role, advanced_roles_create, db)
 
-    transformation = TransformationModel(preset=await get_filter_preset_by_id(filter_id, db))
+    transformation = await get_filter_transformation(filter_id, db)
 
-    public_id = await get_photo_public_id(photo_id, db)
-    new_transformation = PhotoTransformation()
-    new_transformation.photo_id = photo_id
-    new_transformation.transformed_url = build_transformed_url(public_id, transformation)
-    if description is not None:
-        new_transformation.description = description.description
-
-    db.add(new_transformation)
-    db.commit()
-    db.refresh(new_transformation)
-
-    return new_transformation
+    return await save_transformation(photo_id, transformation,
+                                     description.description if description is not None else None, db)
 
 
 async def create_transformation(data: PhotoTransformationModel,
@@ -83,17 +151,64 @@ async def create_transformation(data: PhotoTransformationModel,
                                      preset=data.transformation.preset)
         await create_photo_filter(ph_filter, user_id, db)
 
-    public_id = await get_photo_public_id(data.photo_id, db)
-    new_transformation = PhotoTransformation()
-    new_transformation.photo_id = data.photo_id
-    new_transformation.transformed_url = build_transformed_url(public_id, data.transformation)
-    new_transformation.description = data.description
+    return await save_transformation(data.photo_id, data.transformation, data.description, db)
 
-    db.add(new_transformation)
-    db.commit()
-    db.refresh(new_transformation)
 
-    return new_transformation
+async def check_batch_access(photo_ids: List[int], user_id: int, user_role: Role,
+                             db: Session) -> List[tuple[int, int, str]]:
+    photos = await get_photos_owners(photo_ids, db)
+    if len(photos) != len(photo_ids):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=message.COULD_NOT_FIND_FOTOS)
+    if user_role not in advanced_roles_create and any(owner_id != user_id for _, owner_id, _ in photos):
+        raise HTTPException(status_code=status.HTTP_403_FORBIDDEN, detail=message.FORBIDDEN)
+    return photos
+
+
+async def create_transformations_batch(data: BatchTransformationModel, user_id: int, user_role: Role,
+                                       db: Session, render: bool = True) -> tuple[int, List[PhotoTransformation]]:
+    """
+    The create_transformations_batch function applies one saved filter to many photos at once.
+    Ownership of all the photos is checked with a single query, the preset is fetched once,
+    and the missing transformations are inserted in one transaction.
+    Photos that already have a transformation with this preset keep their existing row.
+
+    :param data: BatchTransformationModel: The filter id, the photo ids and an optional description
+    :param user_id: int: The id of the current user
+    :param user_role: Role: The role of the current user
+    :param db: Session: Access the database
+    :param render: bool: Schedule the rendering of the new transformations, the caller does it when False
+    :return: The number of created rows and the transformations of all the requested photos
+    """
+    photo_ids = list(dict.fromkeys(data.photo_ids))
+    photos = await check_batch_access(photo_ids, user_id, user_role, db)
+
+    transformation = await get_filter_transformation(data.filter_id, db)
+    preset_hash_ = preset_hash(transformation.preset)
+    done = {row.photo_id for row in await get_transformations_by_preset(photo_ids, preset_hash_, db)}
+
+    new_transformations = [PhotoTransformation(photo_id=photo_id,
+                                               preset_hash=preset_hash_,
+                                               transformed_url=build_transformed_url(public_id, transformation),
+                                               description=data.description)
+                           for photo_id, _, public_id in photos if photo_id not in done]
+    db.add_all(new_transformations)
+    try:
+        db.commit()
+    except IntegrityError:
+        # another request has inserted some of them meanwhile, fall back to the one-by-one path
+        # and count only the rows inserted here
+        db.rollback()
+        created = 0
+        for new_transformation in new_transformations:
+            if await insert_transformation(new_transformation.photo_id, transformation, data.description, db, render):
+                created += 1
+    else:
+        created = len(new_transformations)
+        for photo_id, _, public_id in photos:
+            if render and photo_id not in done:
+                await schedule_render(public_id, transformation)
+
+    return created, await get_transformations_by_preset(photo_ids, preset_hash_, db)
 
 
 async def change_description(trans_id: int, data: NewDescTransformationModel,
@@ -1,20 +1,26 @@
-from datetime import date
-#import base64
-import io
-from typing import Optional, List, Tuple
+from datetime import date, datetime, time, timedelta
+import base64
+import binascii
+import json
+from typing import Optional, List, Tuple, Dict
 
 from fastapi import HTTPException, Query, status
+from fastapi.concurrency import run_in_threadpool
 from src.conf import messages
+from src.conf.config import settings
 from fastapi.responses import Response
-import qrcode as qrcode
-from sqlalchemy import func#, or_
+from sqlalchemy import Select, select, func, or_, and_
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
-from sqlalchemy.orm.query import Query
 
-from src.database.models import User, Photo, Tag, Role, Rate
+from src.database.db import execute
+from src.database.models import User, Photo, Tag, Role, photo_m2m_tag
 from src.repository import tags as repository_tags
 from src.repository.tags import handler_tags
 from src.schemas.photos import PhotoResponse
+from src.schemas.tags import TagResponse
+from src.services.qr_codes import get_qrcode, qrcode_etag
+from src.services.storage import storage
 #from src.schemas.tags import TagModel
 
 
@@ -28,24 +34,68 @@ class PhotoFilteringOptions:
         self.created_at_max = created_at_max
 
 
-async def filter_for_photo_query(photo_query: Query, filter_options: PhotoFilteringOptions) -> Query:
+async def filter_for_photo_query(photo_query: Select, filter_options: PhotoFilteringOptions) -> Select:
     if filter_options.user_id:
         photo_query = photo_query.filter(Photo.user_id == filter_options.user_id)
     if filter_options.created_at_min and filter_options.created_at_max:
-        photo_query = photo_query.filter(func.DATE(Photo.created_at) >= filter_options.created_at_min).\
-            filter(func.DATE(Photo.created_at) <= filter_options.created_at_max)
+        # half-open range on the bare column so the created_at indexes can be used
+        photo_query = photo_query.filter(Photo.created_at >= datetime.combine(filter_options.created_at_min, time.min)).\
+            filter(Photo.created_at < datetime.combine(filter_options.created_at_max + timedelta(days=1), time.min))
     if filter_options.rate_min and filter_options.rate_max:
-        photo_query = photo_query.having(func.avg(Rate.rate).between(filter_options.rate_min, filter_options.rate_max))
+        photo_query = photo_query.filter(Photo.avg_rating.between(filter_options.rate_min, filter_options.rate_max))
     return photo_query
 
 
-async def foto_response_create(photos: List[Tuple], db: Session) -> Optional[List[PhotoResponse]]:
+def encode_cursor(created_at: Optional[datetime], photo_id: int) -> str:
+    payload = json.dumps([created_at.isoformat() if created_at else None, photo_id], separators=(',', ':'))
+    return base64.urlsafe_b64encode(payload.encode()).decode()
+
+
+def decode_cursor(cursor: str) -> Tuple[Optional[datetime], int]:
+    try:
+        created_at, photo_id = json.loads(base64.urlsafe_b64decode(cursor.encode()))
+        return (datetime.fromisoformat(created_at) if created_at else None), int(photo_id)
+    except (binascii.Error, UnicodeDecodeError, TypeError, ValueError):
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.INVALID_CURSOR)
+
+
+def next_cursor(photos: List[PhotoResponse], limit: int) -> Optional[str]:
+    # a short page means there is nothing left to read
+    if len(photos) < limit:
+        return None
+    return encode_cursor(photos[-1].created_at, photos[-1].id)
+
+
+async def filter_by_cursor(photo_query: Select, cursor: str) -> Select:
+    # keyset condition matching ORDER BY created_at DESC NULLS LAST, id DESC
+    created_at, photo_id = decode_cursor(cursor)
+    if created_at is None:
+        return photo_query.filter(Photo.created_at.is_(None), Photo.id < photo_id)
+    return photo_query.filter(or_(Photo.created_at < created_at,
+                                  and_(Photo.created_at == created_at, Photo.id < photo_id),
+                                  Photo.created_at.is_(None)))
+
+
+async def get_tags_by_photo_ids(photo_ids: List[int], db: Session | AsyncSession) -> Dict[int, List[TagResponse]]:
+    # one query for the whole page instead of one query per photo
+    tags_by_photo = {photo_id: [] for photo_id in photo_ids}
+    if photo_ids:
+        tags = select(photo_m2m_tag.c.photo_id, Tag.id, Tag.tag_name) \
+            .join(Tag, Tag.id == photo_m2m_tag.c.tag_id) \
+            .filter(photo_m2m_tag.c.photo_id.in_(photo_ids))
+        rows = (await execute(db, tags)).all()
+        for photo_id, tag_id, tag_name in rows:
+            tags_by_photo[photo_id].append(TagResponse(id=tag_id, tag_name=tag_name))
+    return tags_by_photo
+
+
+async def foto_response_create(photos: List[Tuple], db: Session | AsyncSession) -> Optional[List[PhotoResponse]]:
     result = []
     if photos:
+        tags_by_photo = await get_tags_by_photo_ids([row[0] for row in photos], db)
         for row in photos:
-            ph = PhotoResponse(id=row[0], url_photo=row[1], description=row[2], rating=row[3])
-            ph.tags = db.query(Tag.id, Tag.tag_name).select_from(Photo).join(Tag.photos)\
-                .filter(Photo.id == row[0]).all()
+            ph = PhotoResponse(id=row[0], url_photo=row[1], description=row[2], rating=row[3], created_at=row[4])
+            ph.tags = tags_by_photo[row[0]]
             result.append(ph)
     return result
 
@@ -72,7 +122,8 @@ async def get_photos(user_id: int,
                      rate_max: float,
                      created_at_min: date,
                      created_at_max: date,
-                     limit: int, offset: int, db: Session) -> Optional[List[PhotoResponse]]:
+                     limit: int, offset: int, db: Session | AsyncSession,
+                     cursor: str = None) -> Optional[List[PhotoResponse]]:
     if user_id:
         allowed = cur_user_role in [Role.admin, Role.moderator] or user_id == cur_user_id
 
@@ -82,26 +133,32 @@ async def get_photos(user_id: int,
     filter_options = PhotoFilteringOptions(user_id, rate_min, rate_max, created_at_min, created_at_max)
 
     if tag_name is None:
-        photos = db.query(Photo.id,
-                          Photo.url_photo,
-                          Photo.description,
-                          func.avg(Rate.rate)) \
-            .outerjoin(Rate) \
-            .group_by(Photo.id, Photo.url_photo, Photo.description)
+        photos = select(Photo.id,
+                        Photo.url_photo,
+                        Photo.description,
+                        Photo.avg_rating,
+                        Photo.created_at)
     else:
         tag_name = handler_tags(tag_name)[0]
 
-        photos = db.query(Photo.id,
-                          Photo.url_photo,
-                          Photo.description,
-                          func.avg(Rate.rate)) \
-            .join(Tag.photos).outerjoin(Rate) \
-            .filter(func.lower(Tag.tag_name) == tag_name) \
-            .group_by(Photo.id, Photo.url_photo, Photo.description)
+        photos = select(Photo.id,
+                        Photo.url_photo,
+                        Photo.description,
+                        Photo.avg_rating,
+                        Photo.created_at) \
+            .join(Photo.tags) \
+            .filter(func.lower(Tag.tag_name) == tag_name)
 
     photos = await(filter_for_photo_query(photos, filter_options))
+    photos = photos.order_by(Photo.created_at.desc().nulls_last(), Photo.id.desc())
+
+    # cursor mode replaces offset: the keyset condition seeks straight to the next page
+    if cursor:
+        photos = await filter_by_cursor(photos, cursor)
+    else:
+        photos = photos.offset(offset)
 
-    return await foto_response_create(photos.limit(limit).offset(offset).all(), db)
+    return await foto_response_create((await execute(db, photos.limit(limit))).all(), db)
 
 
 async def get_photo_by_id(photo_id: int, db: Session, user: User):
@@ -127,11 +184,30 @@ async def delete_photo(photo_id: int,
     return None
 
 
-async def generate_qrcode(photo_url: str):
-    img = qrcode.make(photo_url)
-    buffer = io.BytesIO()
-    img.save(buffer)    
-    return Response(content=buffer.getvalue(), media_type="image/png")
+async def delete_unreferenced_file(public_id: str, db: Session, deleted_at: Optional[float] = None) -> bool:
+    """
+    The delete_unreferenced_file function deletes the stored file of a removed photo, and its transformed copies,
+    unless another photo or an avatar still uses it: local storage keeps one file per content.
+    Run by the delete_file job, see src.services.tasks.schedule_delete_file.
+
+    :param public_id: str: The public_id of the file in the storage backend
+    :param db: Session: Pass the database session to the function
+    :param deleted_at: Optional[float]: When the photo was deleted, a file uploaded again since is kept
+    :return: True when the file was deleted
+    """
+    in_use = db.query(Photo.id).filter(Photo.cloud_public_id == public_id).first() or \
+        db.query(User.id).filter(User.avatar == storage.url(public_id)).first()
+    if in_use:
+        return False
+    return await run_in_threadpool(storage.delete, public_id, deleted_at)
+
+
+async def generate_qrcode(photo_url: str, if_none_match: Optional[str] = None):
+    etag = qrcode_etag(photo_url)
+    headers = {'ETag': etag, 'Cache-Control': f'public, max-age={settings.qrcode_max_age}'}
+    if if_none_match and (if_none_match.strip() == '*' or etag in map(str.strip, if_none_match.split(','))):
+        return Response(status_code=status.HTTP_304_NOT_MODIFIED, headers=headers)
+    return Response(content=await get_qrcode(photo_url), media_type="image/png", headers=headers)
 
 
 async def update_tags_descriptions_for_photo(photo_id: int,
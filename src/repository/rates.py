@@ -1,14 +1,47 @@
-from sqlalchemy import func
+from typing import Optional
+
+from sqlalchemy import Float, case, cast, func, select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from src.database.models import Rate, User
+from src.database.db import execute
+from src.database.models import Photo, Rate, User
 
 from src.schemas.rates import RateModel
 
 
+async def refresh_photo_rating(db: Session, photo_id: Optional[int] = None) -> int:
+    # recompute photos.rate_count/rate_sum/avg_rating from rates, for one photo or for all of them.
+    # Only for rebuilds: concurrent rates would each see their own row only, use adjust_photo_rating for those
+    rate_count = select(func.count(Rate.user_id)).where(Rate.photo_id == Photo.id).scalar_subquery()
+    rate_sum = select(func.coalesce(func.sum(Rate.rate), 0)).where(Rate.photo_id == Photo.id).scalar_subquery()
+    avg_rating = select(func.avg(cast(Rate.rate, Float))).where(Rate.photo_id == Photo.id).scalar_subquery()
+    photos = db.query(Photo)
+    if photo_id is not None:
+        photos = photos.filter(Photo.id == photo_id)
+    # keep updated_at as is, a new rate is not an edit of the photo
+    return photos.update({'rate_count': rate_count, 'rate_sum': rate_sum, 'avg_rating': avg_rating,
+                          'updated_at': Photo.updated_at},
+                         synchronize_session=False)
+
+
+async def adjust_photo_rating(db: Session, photo_id: int, count_delta: int, sum_delta: int) -> int:
+    # atomic increments, each concurrent rate adds its own vote to whatever the others have committed.
+    # The SET expressions all read the old row, so avg_rating is computed from the new count and sum here
+    new_count = Photo.rate_count + count_delta
+    new_sum = Photo.rate_sum + sum_delta
+    return db.query(Photo).filter(Photo.id == photo_id).update(
+        {'rate_count': new_count, 'rate_sum': new_sum,
+         'avg_rating': case((new_count > 0, cast(new_sum, Float) / new_count), else_=None),
+         'updated_at': Photo.updated_at},
+        synchronize_session=False)
+
+
 async def add_rate(body: RateModel, db: Session, user: User):
     rate = Rate(**body.dict(), user_id=user.id)
     db.add(rate)
+    db.flush()
+    await adjust_photo_rating(db, body.photo_id, 1, body.rate)
     db.commit()
     db.refresh(rate)
     return rate
@@ -24,12 +57,15 @@ async def get_rating_by_photo_id(photo_id: int, db: Session):
     return {'average_rate': result[1] or 0, 'rate_count': result[0]}
 
 
-async def get_detail_rating_by_photo(photo_id: int, db: Session):
-    rates = db.query(Rate).filter(Rate.photo_id == photo_id).all()
+async def get_detail_rating_by_photo(photo_id: int, db: Session | AsyncSession):
+    rates = (await execute(db, select(Rate).filter(Rate.photo_id == photo_id))).scalars().all()
     return rates
 
 
 async def remove_rating(photo_id: int, user_id: int, db: Session):
+    rate = db.query(Rate.rate).filter(Rate.photo_id == photo_id, Rate.user_id == user_id).scalar()
     count = db.query(Rate).filter(Rate.photo_id == photo_id, Rate.user_id == user_id).delete()
+    if count:
+        await adjust_photo_rating(db, photo_id, -1, -rate)
     db.commit()
     return count
@@ -1,15 +1,18 @@
 from fastapi import status, HTTPException
 from typing import Type, List
 
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
+from src.database.db import execute
 from src.database.models import Tag, User
 from src.conf import messages
 from src.repository import photos as repository_photos
 
 
-async def get_tags(db: Session) -> List[Type[Tag]]:
-    return db.query(Tag).all()
+async def get_tags(db: Session | AsyncSession) -> List[Type[Tag]]:
+    return (await execute(db, select(Tag))).scalars().all()
 
 
 def handler_tags(tags: str) -> List[Type[Tag]]:
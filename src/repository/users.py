@@ -1,23 +1,26 @@
 from datetime import datetime
 
+from sqlalchemy import select
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from typing import List, Optional
 
 #from src.database.db import client_redis
+from src.database.db import execute
 from src.database.models import User, Photo
 from src.schemas.users import UserModel, UserUpdateModel
 import src.services.auth as auth
 
-async def get_users(dict_values: dict, limit: int, offset: int, db: Session) -> Optional[List[User]]:
+async def get_users(dict_values: dict, limit: int, offset: int, db: Session | AsyncSession) -> Optional[List[User]]:
 
     # if not input params - returned all list users
     # else - search by parametrs: first_name, username, email, created_at, updated_at, avatar, roles, birthday - returned list contacts
-    users = db.query(User)
+    users = select(User)
     for key, value in dict_values.items():
         if value != None:
             attr = getattr(User, key)
             users = users.filter(attr.contains(value))
-    users = users.limit(limit).offset(offset).all()
+    users = (await execute(db, users.limit(limit).offset(offset))).scalars().all()
     return users
 
 
@@ -67,6 +70,7 @@ The update_token function updates the refresh token for a user.
 """
     user.refresh_token = token
     db.commit()
+    await auth.auth_service.invalidate_user(user.email)
 
 
 async def confirmed_email(email: str, db: Session) -> None:
@@ -83,6 +87,7 @@ and sets the confirmed field of the user with that email to True.
     user = await get_user_by_email(email, db)
     user.confirmed = True
     db.commit()
+    await auth.auth_service.invalidate_user(email)
 
 
 async def update_avatar(email, url: str, db: Session) -> User:
@@ -99,6 +104,7 @@ The update_avatar function updates the avatar of a user.
     user.avatar = url
     db.commit()
     db.refresh(user)
+    await auth.auth_service.invalidate_user(email)
     return user
 
 
@@ -110,27 +116,31 @@ async def quantity_photo_by_users(user: User, db: Session):
 async def update_user(body: UserUpdateModel, user_id: int, user: User, db: Session):
     user = db.query(User).filter(User.id == user_id).first()
     if user:
-        count = db.query(User).filter(User.id == user_id).update({
+        old_email = user.email
+        values = {
             'first_name': body.first_name,
             'username': body.username,
             'birthday': body.birthday,
             'email' : body.email,
-            'password': auth.auth_service.get_password_hash(body.password)
-        })
+        }
+        # bcrypt is slow on purpose, only a new password is hashed
+        if body.password is not None:
+            values['password'] = await auth.auth_service.get_password_hash(body.password)
+        count = db.query(User).filter(User.id == user_id).update(values)
         db.commit()
         db.refresh(user)
+        for email in {old_email, user.email}:
+            await auth.auth_service.invalidate_user(email)
         if count == 1:
             return user
     return None
 
 
 async def block_token(token: str, db: Session):
-    email = auth.auth_service.verify_access_token(token)
+    # the access token is revoked, the refresh token dropped
+    email = await auth.auth_service.revoke_access_token(token)
     user = await get_user_by_email(email, db)
     await update_token(user, None, db)
-    #expire = auth.auth_service.get_exp_by_access_token(token)
-    #timedelta = expire - int(datetime.now().timestamp())
-    #await client_redis.set(f'user_token:{email}', token, timedelta)
 
 
 async def ban_user(user_id: int, db: Session) -> Optional[User]:
@@ -140,5 +150,5 @@ async def ban_user(user_id: int, db: Session) -> Optional[User]:
         user.refresh_token = None
         db.commit()
         db.refresh(user)
-        #await client_redis.delete(f'user:{user.email}')
+        await auth.auth_service.invalidate_user(user.email)
     return user
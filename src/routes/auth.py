@@ -1,5 +1,6 @@
 from fastapi import APIRouter, HTTPException, Depends, status, Security, BackgroundTasks, Request
 from fastapi.security import OAuth2PasswordRequestForm, HTTPAuthorizationCredentials, HTTPBearer
+from redis.exceptions import RedisError
 from sqlalchemy.orm import Session
 
 from src.database.db import get_db
@@ -9,15 +10,37 @@ from src.schemas.email import RequestEmail
 from src.repository import users as repository_users
 from src.services.auth import auth_service
 from src.services.roles import RoleAccess
-from src.services.email import send_email
+from src.services import email as email_service
+from src.services.tasks import send_email
 from src.conf import messages
+from src.conf.logger import get_logger
 
 
+logger = get_logger(__name__)
 router = APIRouter(prefix='/auth', tags=['auth'])
 security = HTTPBearer()
 allowed_read = RoleAccess([Role.admin, Role.moderator, Role.user])
 
 
+async def queue_confirmation_email(background_tasks: BackgroundTasks, email: str, username: str, host: str) -> None:
+    """
+    The queue_confirmation_email function hands the confirmation email to the job queue.
+    Without the queue it is sent after the response, in this process: the user is saved already
+    and must not be left with a failed request and no email.
+
+    :param background_tasks: BackgroundTasks: The fallback when the queue is unavailable
+    :param email: str: The address of the user
+    :param username: str: The name of the user
+    :param host: str: The base url of the api, for the confirmation link
+    :return: None
+    """
+    try:
+        await send_email.delay(email=email, username=username, host=host)
+    except RedisError as err:
+        logger.warning(f'job queue unavailable, sending the email to {email} from the api: {err}')
+        background_tasks.add_task(email_service.send_email, email, username, host)
+
+
 @router.post('/login', name="Login", response_model=TokenModel)
 async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depends(get_db)) -> dict:
     """
@@ -35,15 +58,20 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_EMAIL)
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.EMAIL_NOT_CONFIRMED)
-    if not auth_service.verify_password(body.password, user.password):
+    verified, new_hash = await auth_service.verify_and_update(body.password, user.password)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_PASSWORD)
+    if new_hash:
+        # hashed with fewer rounds than the current ones, saved by update_token below
+        user.password = new_hash
     if not user.active:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.FORBIDDEN)
 
     access_token: str = await auth_service.create_access_token(data={'sub': user.email})
     refresh_token: str = await auth_service.create_refresh_token(data={'sub': user.email})
-    await auth_service.get_current_user(access_token, db)
     await repository_users.update_token(user, refresh_token, db)
+    # warm the user cache after update_token has invalidated it
+    await auth_service.get_current_user(access_token, db)
     return {'access_token': access_token, 'refresh_token': refresh_token, 'token_type': 'bearer'}
 
 
@@ -55,15 +83,20 @@ async def login(body: OAuth2PasswordRequestForm = Depends(), db: Session = Depen
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_EMAIL)
     if not user.confirmed:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.EMAIL_NOT_CONFIRMED)
-    if not auth_service.verify_password(body.password, user.password):
+    verified, new_hash = await auth_service.verify_and_update(body.password, user.password)
+    if not verified:
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.INVALID_PASSWORD)
+    if new_hash:
+        # hashed with fewer rounds than the current ones, saved by update_token below
+        user.password = new_hash
     if not (user.active and (user.roles == Role.admin)):
         raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.FORBIDDEN)
 
     access_token: str = await auth_service.create_access_token(data={'sub': user.email})
     refresh_token: str = await auth_service.create_refresh_token(data={'sub': user.email})
-    await auth_service.get_current_user(access_token, db)
     await repository_users.update_token(user, refresh_token, db)
+    # warm the user cache after update_token has invalidated it
+    await auth_service.get_current_user(access_token, db)
     return {'access_token': access_token, 'refresh_token': refresh_token, 'token_type': 'bearer'}
 
 
@@ -78,7 +111,7 @@ async def request_email(body: RequestEmail,
         address. If the user does not exist, it returns an error message.
 
     :param body: RequestEmail: Validate the request body
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
+    :param background_tasks: BackgroundTasks: Send the email when the job queue is unavailable
     :param request: Request: Get the base_url of the application
     :param db: Session: Pass the database session to the repository functions
     :return: A message to the user if they are already confirmed
@@ -91,9 +124,7 @@ async def request_email(body: RequestEmail,
     if user.confirmed:
         return {'message': messages.YOUR_EMAIL_IS_ALREADY_CONFIRMED}
 
-    background_tasks.add_task(send_email, email=user.email,
-                              username=user.username,
-                              host=request.base_url)
+    await queue_confirmation_email(background_tasks, user.email, user.username, str(request.base_url))
     return {'message': messages.CHECK_YOUR_EMAIL_FOR_CONFIRMATION}
 
 
@@ -108,7 +139,7 @@ async def singup(body: UserModel,
         The function returns a JSON object with the newly created user's information.
 
     :param body: UserModel: Validate the data sent by the user
-    :param background_tasks: BackgroundTasks: Add a task to the background tasks queue
+    :param background_tasks: BackgroundTasks: Send the email when the job queue is unavailable
     :param request: Request: Get the host url to send in the email
     :param db: Session: Get the database session
     :return: A dictionary with the user and a message
@@ -116,12 +147,10 @@ async def singup(body: UserModel,
     exist_user = await repository_users.get_user_by_email(body.email, db)
     if exist_user:
         raise HTTPException(status_code=status.HTTP_409_CONFLICT, detail=messages.ACCOUNT_ALREADY_EXISTS)
-    body.password = auth_service.get_password_hash(body.password)
+    body.password = await auth_service.get_password_hash(body.password)
     new_user = await repository_users.create_user(body, db)
 
-    background_tasks.add_task(send_email, new_user.email,
-                              new_user.username,
-                              request.base_url)
+    await queue_confirmation_email(background_tasks, new_user.email, new_user.username, str(request.base_url))
     return {'user': new_user, 'detail': messages.USER_SUCCESSFULLY_CREATED}
 
 
@@ -1,9 +1,10 @@
 from typing import List
 
 from fastapi import Depends, HTTPException, status, Path, APIRouter
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.database.models import User, Role
 from src.conf import messages
 from src.repository import comments as repository_comments
@@ -44,7 +45,7 @@ async def get_comment(comment_id: int = Path(ge=1), db: Session = Depends(get_db
 @router.get("/", name="Return All Comments For Photo",
             response_model=List[CommentResponse],
             dependencies=[Depends(allowed_read)])
-async def get_comments_by_photo(photo_id: int, db: Session = Depends(get_db),
+async def get_comments_by_photo(photo_id: int, db: Session | AsyncSession = Depends(get_read_db),
                                 _: User = Depends(auth_service.get_current_user)):
     comments = await repository_comments.get_comments_by_photo(photo_id, db)
     if comments is None:
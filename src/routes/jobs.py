@@ -0,0 +1,29 @@
+from fastapi import APIRouter, Depends, HTTPException, status
+
+from src.conf import messages
+from src.database.models import User, Role
+from src.schemas.jobs import JobResponse
+from src.services.auth import auth_service
+from src.services.jobs import queue
+from src.services.roles import RoleAccess
+
+router = APIRouter(prefix="/jobs", tags=['jobs'])
+
+allowed_read = RoleAccess([Role.admin, Role.moderator, Role.user])
+
+
+@router.get("/{job_id}", name="Get Job Status", response_model=JobResponse, dependencies=[Depends(allowed_read)])
+async def get_job(job_id: str, user: User = Depends(auth_service.get_current_user)):
+    """
+    The get_job function returns the state of a background job started by the current user:
+    queued, running, done or failed, with the number of attempts and the result or the last error.
+    Admins can see any job.
+
+    :param job_id: str: The id returned when the job was queued
+    :param user: User: The current user
+    :return: The job record
+    """
+    record = await queue.get(job_id)
+    if record is None or (record.owner_id != user.id and user.roles != Role.admin):
+        raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.JOB_NOT_FOUND)
+    return record
@@ -1,17 +1,22 @@
 from typing import List, Optional
 
-from fastapi import APIRouter, Depends, HTTPException, status, Query
+from fastapi import APIRouter, Depends, HTTPException, status, Query, Response
 from sqlalchemy.orm import Session
 
 import src.conf.messages as messages
+from src.conf.config import settings
 from src.database.db import get_db
 from src.database.models import User, Role
 from src.repository import photo_transformations as repository_transformations
 from src.schemas.photo_transformations import (
     PhotoTransformationModelDb,
     PhotoTransformationModel,
-    NewDescTransformationModel)
+    NewDescTransformationModel,
+    BatchTransformationModel,
+    BatchTransformationResponse)
 from src.services.auth import auth_service
+from src.services import tasks
+from src.services.limiter import UserRateLimit
 from src.services.roles import RoleAccess
 
 router = APIRouter(prefix="/transformations", tags=['photo transformations'])
@@ -22,11 +27,15 @@ allowed_read = RoleAccess([Role.admin, Role.moderator, Role.user])
 allowed_update = RoleAccess([Role.admin, Role.moderator, Role.user])
 allowed_delete = RoleAccess([Role.admin, Role.moderator, Role.user])
 
+# budgets per user, see src.conf.constants.RATE_LIMITS
+read_limit = UserRateLimit('read')
+transform_limit = UserRateLimit('transform')
+
 
 @router.get('/{photo_id}', 
             name='Get Transformations By Photo Id',
             response_model=List[PhotoTransformationModelDb],
-            dependencies=[Depends(allowed_read)])
+            dependencies=[Depends(allowed_read), Depends(read_limit)])
 async def get_transformed_photos(photo_id: int,
                                  db: Session = Depends(get_db),
                                  user: User = Depends(auth_service.get_current_user)):
@@ -41,7 +50,7 @@ async def get_transformed_photos(photo_id: int,
              name='Create Photo Transformation', 
              response_model=PhotoTransformationModelDb,
              status_code=status.HTTP_201_CREATED,
-             dependencies=[Depends(allowed_create)])
+             dependencies=[Depends(allowed_create), Depends(transform_limit)])
 async def create_transformation(transformation: PhotoTransformationModel,
                                 save_filter: bool = Query(default=False),
                                 filter_name: Optional[str] = Query(default=None),
@@ -58,11 +67,34 @@ async def create_transformation(transformation: PhotoTransformationModel,
     return transformation
 
 
+@router.post('/filter_by/batch',
+             response_model=BatchTransformationResponse,
+             name='Create Photo Transformations From Filter For Many Photos',
+             status_code=status.HTTP_201_CREATED,
+             dependencies=[Depends(allowed_create), Depends(transform_limit)])
+async def create_transformations_batch(response: Response,
+                                       data: BatchTransformationModel,
+                                       db: Session = Depends(get_db),
+                                       user: User = Depends(auth_service.get_current_user)):
+    if len(data.photo_ids) > settings.job_inline_batch_size:
+        # large batches run on a worker, the caller polls /api/jobs/{job_id}
+        await repository_transformations.check_batch_access(list(set(data.photo_ids)), user.id, user.roles, db)
+        await repository_transformations.get_filter_transformation(data.filter_id, db)
+        job_id = await tasks.create_transformations_batch.delay(owner_id=user.id, data=data.dict(),
+                                                                user_id=user.id, user_role=user.roles.value)
+        response.status_code = status.HTTP_202_ACCEPTED
+        return {'created': 0, 'transformations': [], 'job_id': job_id}
+
+    created, transformations = await repository_transformations.create_transformations_batch(data, user.id,
+                                                                                             user.roles, db)
+    return {'created': created, 'transformations': transformations}
+
+
 @router.post('/filter_by/{photo_id}', 
              response_model=PhotoTransformationModelDb,
              name='Create Photo Transformation From Filter ', 
              status_code=status.HTTP_201_CREATED,
-             dependencies=[Depends(allowed_create)])
+             dependencies=[Depends(allowed_create), Depends(transform_limit)])
 async def create_transformation_from_preset(photo_id: int, 
                                             filter_id: int, 
                                             description: NewDescTransformationModel,
@@ -1,24 +1,27 @@
 import json
 import types
 from datetime import date
-from fastapi import Depends, status, APIRouter, File, UploadFile, Query, HTTPException
+from fastapi import Depends, status, APIRouter, File, UploadFile, Query, HTTPException, Header
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi.responses import Response#, HTMLResponse
 
 from typing import Optional
 from src.repository.photo_transformations import create_transformation, create_transformation_from_preset
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.database.models import User, Role
 from src.repository import photos as repository_photos
 from src.repository import photo_transformations as repository_photo_transformations
 from src.schemas.photos import PhotoResponse#, PhotoQRCodeResponse
 from src.services.auth import auth_service
+from src.services import tasks
 from src.services.photos import upload_photo
 import src.conf.messages as messages
 from src.services.roles import RoleAccess
+from src.services.limiter import UserRateLimit
 #from src.repository import rates as repository_rates
-from src.schemas.photo_transformations import PhotoTransformationModel
+from src.schemas.photo_transformations import PhotoTransformationModel, TransformationModel
     
 
 router = APIRouter(prefix='/photos', tags=['photos'])
@@ -29,11 +32,16 @@ allowed_read = RoleAccess([Role.admin, Role.user])
 allowed_update = RoleAccess([Role.admin, Role.user])
 allowed_delete = RoleAccess([Role.admin, Role.moderator, Role.user])
 
+# budgets per user, see src.conf.constants.RATE_LIMITS
+read_limit = UserRateLimit('read')
+upload_limit = UserRateLimit('upload')
+qrcode_limit = UserRateLimit('qrcode')
+
 
 @router.post('/', name='Create Photo',
              response_model=PhotoResponse, 
              status_code=status.HTTP_201_CREATED,
-             dependencies=[Depends(allowed_create)])
+             dependencies=[Depends(allowed_create), Depends(upload_limit)])
 # accsess - admin, authenticated users
 async def create_photo(photo: UploadFile = File(),
                        description: str | None = None,
@@ -46,7 +54,7 @@ async def create_photo(photo: UploadFile = File(),
                        filter_id: int = None,
                        db: Session = Depends(get_db),
                        current_user: User = Depends(auth_service.get_current_user)):
-    url, public_id = upload_photo(photo)
+    url, public_id = await upload_photo(photo)
     photo = await repository_photos.add_photo(url, public_id, description, tags, db, current_user)
     if has_trans:
         try:
@@ -55,7 +63,7 @@ async def create_photo(photo: UploadFile = File(),
                 transformation = json.loads(transformation)
             if transformation.get("transformation"):
                 transformation_obj = types.SimpleNamespace(**transformation)
-                transformation_obj.transformation = types.SimpleNamespace(**transformation_obj.transformation)
+                transformation_obj.transformation = TransformationModel(**transformation_obj.transformation)
             
                 transformation_obj.photo_id = photo.id
                 url_transf = await create_transformation(transformation_obj,
@@ -84,11 +92,12 @@ async def create_photo(photo: UploadFile = File(),
              name='Generate QRCode By Url',
              response_class=Response,
              status_code=status.HTTP_201_CREATED,
-             dependencies=[Depends(allowed_create)])
+             dependencies=[Depends(allowed_create), Depends(qrcode_limit)])
 # access - admin, authenticated users
 async def generate_qrcode(photo_url: Optional[str]= Query(default=None),
                           photo_id: Optional[int]= Query(default=None),
                           trans_id: Optional[int]= Query(default=None),
+                          if_none_match: Optional[str] = Header(default=None),
                           _: User = Depends(auth_service.get_current_user),
                           db: Session = Depends(get_db)):
     qr_code_url = None
@@ -108,15 +117,16 @@ async def generate_qrcode(photo_url: Optional[str]= Query(default=None),
     if not qr_code_url:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail=messages.NOT_FOUND)
-    qrcode_encode = await repository_photos.generate_qrcode(qr_code_url)
+    qrcode_encode = await repository_photos.generate_qrcode(qr_code_url, if_none_match)
     return qrcode_encode
 
 
 @router.get('/', name="Get Photos By Request ",
             response_model=list[PhotoResponse],
-            dependencies=[Depends(allowed_read)])
+            dependencies=[Depends(allowed_read), Depends(read_limit)])
 # accsess - admin, authenticated users
-async def get_photos(user_id: Optional[int] = Query(default=None),
+async def get_photos(response: Response,
+                     user_id: Optional[int] = Query(default=None),
                      tag_name: Optional[str] = Query(default=None),
                      rate_min: Optional[float] = Query(default=None),
                      rate_max: Optional[float] = Query(default=None),
@@ -124,20 +134,25 @@ async def get_photos(user_id: Optional[int] = Query(default=None),
                      created_at_max: Optional[date] = Query(default=None),
                      limit: int = Query(default=10, ge=1, le=50),
                      offset: int = 0,
+                     cursor: Optional[str] = Query(default=None),
                      cur_user: User = Depends(auth_service.get_current_user),
-                     db: Session = Depends(get_db)):
+                     db: Session | AsyncSession = Depends(get_read_db)):
     photos = await repository_photos.get_photos(user_id, cur_user.id, cur_user.roles, tag_name, rate_min,
                                                 rate_max, created_at_min, created_at_max,
-                                                limit, offset, db)
+                                                limit, offset, db, cursor)
     if not photos:
         raise HTTPException(
             status_code=status.HTTP_404_NOT_FOUND, detail=messages.NOT_FOUND)
+    # opaque keyset cursor for the next page, pass it back as ?cursor=
+    next_cursor = repository_photos.next_cursor(photos, limit)
+    if next_cursor:
+        response.headers['X-Next-Cursor'] = next_cursor
     return photos
 
 
 @router.get('/{photo_id}', name="Get Photos By Id",
             response_model=PhotoResponse,
-            dependencies=[Depends(allowed_read)])
+            dependencies=[Depends(allowed_read), Depends(read_limit)])
 # accsess - admin, authenticated users
 async def get_photo_id(photo_id: int,
                        db: Session = Depends(get_db),
@@ -201,4 +216,5 @@ async def photo_remove(
                                                  db, current_user)
     if photo is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.NOT_FOUND)
+    await tasks.schedule_delete_file(photo.cloud_public_id)
     return photo
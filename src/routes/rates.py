@@ -1,9 +1,10 @@
 from typing import List
 
 from fastapi import Depends, HTTPException, status, Path, APIRouter
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.database.models import User, Role
 from src.conf import messages
 from src.repository import photos as repository_photos
@@ -20,6 +21,7 @@ allowed_read = RoleAccess([Role.admin, Role.moderator, Role.user])
 allowed_web_admin_read = RoleAccess([Role.admin, Role.moderator])
 # allowed_update = RoleAccess([Role.admin, Role.moderator, Role.user])
 allowed_delete = RoleAccess([Role.admin, Role.moderator])
+allowed_rebuild = RoleAccess([Role.admin])
 
 
 @router.post("/", name="Set Rate To Photo", 
@@ -41,12 +43,23 @@ async def create_rate(body: RateModel,
     return rate
 
 
+@router.post("/rebuild", name="Rebuild Photos Rating Aggregates",
+             status_code=status.HTTP_200_OK,
+             dependencies=[Depends(allowed_rebuild)])
+async def rebuild_rating(db: Session = Depends(get_db),
+                         _: User = Depends(auth_service.get_current_user)):
+    # recomputes photos.rate_count/rate_sum/avg_rating from the rates table
+    photos_count = await repository_rates.refresh_photo_rating(db)
+    db.commit()
+    return {'photos_updated': photos_count}
+
+
 @router.get("/{photo_id}",  name="Return Rating By Photo Id",
             response_model=List[RateResponse],
             status_code=status.HTTP_200_OK, 
             dependencies=[Depends(allowed_web_admin_read)])
 async def get_rating_by_photo_id(photo_id: int = Path(ge=1), 
-                                 db: Session = Depends(get_db),
+                                 db: Session | AsyncSession = Depends(get_read_db),
                                  _: User = Depends(auth_service.get_current_user)):
     rates = await repository_rates.get_detail_rating_by_photo(photo_id, db)
     if rates is None:
@@ -1,9 +1,10 @@
 from typing import List
 
 from fastapi import Depends, status, APIRouter, HTTPException
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.database.models import Role
 from src.repository import tags as repository_tags
 from src.services.roles import RoleAccess
@@ -25,7 +26,7 @@ allowed_delete = RoleAccess([Role.admin, Role.moderator])
             response_model=List[TagResponse],
             dependencies=[Depends(allowed_read)],
             status_code=status.HTTP_200_OK)
-async def get_tags(db: Session = Depends(get_db)):
+async def get_tags(db: Session | AsyncSession = Depends(get_read_db)):
     tags = await repository_tags.get_tags(db)
     if tags:
         return tags
@@ -2,9 +2,10 @@ from datetime import datetime, date
 from typing import List
 from fastapi import APIRouter, Depends, status, UploadFile, File, HTTPException, Query, Path
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 
-from src.database.db import get_db
+from src.database.db import get_db, get_read_db
 from src.database.models import User, Role
 from src.repository import users as repository_users
 from src.services.auth import auth_service
@@ -12,6 +13,7 @@ from src.schemas.users import UserDb, UserUpdateModel, UserBanModel
 from src.services.photos import upload_photo
 from src.conf import messages
 from src.services.roles import RoleAccess
+from src.services.limiter import UserRateLimit
 
 router = APIRouter(prefix="/users", tags=["users"])
 
@@ -22,6 +24,9 @@ allowed_update = RoleAccess([Role.admin, Role.moderator, Role.user])
 allowed_delete = RoleAccess([Role.admin, Role.moderator, Role.user])
 allowed_ban = RoleAccess([Role.admin])
 
+# budgets per user, see src.conf.constants.RATE_LIMITS
+upload_limit = UserRateLimit('upload')
+
 
 allowed_read_webadmin = RoleAccess([Role.admin, Role.moderator]) #--> for admin-panel
 
@@ -41,7 +46,7 @@ async def read_users(first_name: str = None,
                      birthday: date = None, 
                      limit: int = Query(default=10, ge=1, le=50), 
                      offset: int = 0, 
-                     db: Session = Depends(get_db), 
+                     db: Session | AsyncSession = Depends(get_read_db), 
                      _: User = Depends(auth_service.get_current_user)):
     
     users = await repository_users.get_users({'first_name': first_name, 
@@ -119,7 +124,7 @@ async def user_edit(body: UserUpdateModel,
 @router.patch('/avatar', 
               name="Update Avatar User",
               response_model=UserDb, 
-              dependencies=[Depends(allowed_update)])
+              dependencies=[Depends(allowed_update), Depends(upload_limit)])
 # accsess - only for admin, moderators and  user-owner
 async def update_avatar_user(file: UploadFile = File(),
                              current_user: User = Depends(auth_service.get_current_user),
@@ -135,7 +140,7 @@ The update_avatar_user function updates the avatar of a user.
 :return: The updated user object
 :doc-author: Trelent
 """
-    url, public_id = upload_photo(file)
+    url, public_id = await upload_photo(file)
     user = await repository_users.update_avatar(current_user.email, url, db)
     if user is None:
         raise HTTPException(status_code=status.HTTP_404_NOT_FOUND, detail=messages.NOT_FOUND)
@@ -1,8 +1,9 @@
 from typing import Optional, Dict, Any, List
 
-from pydantic import BaseModel, Field
+from pydantic import BaseModel, Field, validator
 
 import src.conf.constants as c
+from src.services.image_engine import validate_preset
 
 
 class PhotoFilterModel(BaseModel):
@@ -10,6 +11,8 @@ class PhotoFilterModel(BaseModel):
     description: Optional[str] = Field(max_length=c.MAX_LEN_PHOTO_FILTER_DESC)
     preset: List[Dict[str, Any]]
 
+    _check_preset = validator("preset", allow_reuse=True)(validate_preset)
+
     class Config:
         schema_extra = {
             "example": {
@@ -1,8 +1,9 @@
 from typing import Optional, List, Dict, Any
 
-from pydantic import BaseModel, Field, HttpUrl
+from pydantic import BaseModel, Field, HttpUrl, conlist, validator
 
-from src.conf.constants import MAX_LENGTH_PHOTO_DESCRIPTION
+from src.conf.constants import MAX_BATCH_TRANSFORMATIONS, MAX_LENGTH_PHOTO_DESCRIPTION
+from src.services.image_engine import validate_preset
 
 
 class NewDescTransformationModel(BaseModel):
@@ -12,6 +13,8 @@ class NewDescTransformationModel(BaseModel):
 class TransformationModel(BaseModel):
     preset: List[Dict[str, Any]]
 
+    _check_preset = validator("preset", allow_reuse=True)(validate_preset)
+
     class Config:
         schema_extra = {
             "example": {
@@ -55,3 +58,24 @@ class PhotoTransformationModelDb(BaseModel):
 
     class Config:
         orm_mode = True
+
+
+class BatchTransformationModel(BaseModel):
+    filter_id: int
+    photo_ids: conlist(int, min_items=1, max_items=MAX_BATCH_TRANSFORMATIONS)
+    description: Optional[str] = Field(max_length=MAX_LENGTH_PHOTO_DESCRIPTION)
+
+    class Config:
+        schema_extra = {
+            "example": {
+                "filter_id": 1,
+                "photo_ids": [1, 2, 3],
+                "description": "Album cover"
+            }
+        }
+
+
+class BatchTransformationResponse(BaseModel):
+    created: int
+    transformations: List[PhotoTransformationModelDb]
+    job_id: Optional[str] = None
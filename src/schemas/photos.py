@@ -1,3 +1,4 @@
+from datetime import datetime
 from typing import List, Optional
 
 from pydantic import BaseModel, HttpUrl, Field
@@ -17,6 +18,7 @@ class PhotoResponse(BaseModel):
         default=None, title="The description of the Photo", max_length=constants.MAX_LENGTH_PHOTO_DESCRIPTION)
     tags: Optional[List[TagResponse]]
     rating: float = None
+    created_at: datetime = None
 
     class Config:
         orm_mode = True
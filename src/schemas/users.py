@@ -1,4 +1,5 @@
 from datetime import datetime, date
+from typing import Optional
 import re
 
 from pydantic import BaseModel, Field, EmailStr, EmailError, validator
@@ -69,7 +70,8 @@ class UserUpdateModel(BaseModel):
     # avatar: str = None
     # roles: Role
     birthday: date = None  # '2023-03-29'
-    password: str = Field(min_length=PASSWORD_MIN_LEN, max_length=PASSWORD_MAX_LEN)
+    # None keeps the current password
+    password: Optional[str] = Field(None, min_length=PASSWORD_MIN_LEN, max_length=PASSWORD_MAX_LEN)
 
 
 class UserBanModel(UserDb):
@@ -1,52 +1,105 @@
-from typing import Optional
+import hashlib
+import time
+from typing import NamedTuple, Optional
 from datetime import datetime, timedelta
-import pickle
+from uuid import uuid4
 
 from jose import JWTError, jwt
 from fastapi import HTTPException, status, Depends
 from fastapi.security import OAuth2PasswordBearer
-from passlib.context import CryptContext
-import redis
+from redis.exceptions import RedisError
 from sqlalchemy.orm import Session
 
-from src.database.db import get_db
+from src.database.db import get_db, client_redis
 from src.repository import users as repository_users
 from src.conf.config import settings
 from src.conf import messages
+from src.conf.logger import get_logger
+from src.services import passwords
+from src.services.cache import LRUCache
+from src.services.executor import executor
+from src.services.invalidation import bus
+from src.services.revocation import revocations
+from src.services.user_cache import CachedUser, user_cache_key
+
+logger = get_logger(__name__)
+
+
+class TokenClaims(NamedTuple):
+    email: Optional[str]
+    scope: Optional[str]
+    jti: Optional[str]
+    exp: Optional[float]
 
 
 class Auth:
-    pwd_context = CryptContext(schemes=['bcrypt'], deprecated='auto')
+    pwd_context = passwords.pwd_context
     SECRET_KEY = settings.secret_key
     ALGORITHM = settings.algorithm
     oauth2_scheme = OAuth2PasswordBearer(tokenUrl='/api/auth/login')
-    redis_cache = redis.Redis(host=settings.redis_host, 
-                              port=settings.redis_port, 
-                              password=settings.redis_password,
-                              db=0)
+    # the shared async client, users are cached as CachedUser json
+    redis_cache = client_redis
+    # hot users of this worker, in front of redis, see invalidate_user
+    local_cache = LRUCache(settings.user_cache_local_size, settings.user_cache_local_ttl)
+    # bcrypt work factor of new hashes, see calibrate_password_hash
+    hash_rounds = settings.bcrypt_rounds
+    # digest of a verified token -> TokenClaims, see decode_token
+    token_cache = LRUCache(settings.token_cache_size, settings.token_cache_ttl)
+
+    @property
+    def credentials_exception(self) -> HTTPException:
+        return HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.COULD_NOT_VALIDATE_CREDENTIALS)
 
-    def verify_password(self, plain_password: str, hashed_password: str) -> bool:
+    async def verify_password(self, plain_password: str, hashed_password: str) -> bool:
         """
         The verify_password function takes a plain-text password and hashed password as arguments.
         It then uses the pwd_context object to verify that the plain-text password matches the hashed one.
+        bcrypt is slow on purpose, so the check runs in the cpu executor, not on the event loop.
 
         :param self: Represent the instance of the class
         :param plain_password: str: Pass in the plain text password that is entered by the user
         :param hashed_password: str: Pass in the hashed password from the database
         :return: A boolean value of true or false
         """
-        return self.pwd_context.verify(plain_password, hashed_password)
+        return await executor.run(passwords.verify_password, plain_password, hashed_password)
 
-    def get_password_hash(self, password: str) -> str:
+    async def verify_and_update(self, plain_password: str, hashed_password: str) -> tuple[bool, Optional[str]]:
+        """
+        The verify_and_update function checks the password like verify_password does, and when it matches
+        a hash made with fewer rounds than hash_rounds, also returns the new hash to save in its place.
+
+        :param self: Represent the instance of the class
+        :param plain_password: str: Pass in the plain text password that is entered by the user
+        :param hashed_password: str: Pass in the hashed password from the database
+        :return: Whether the password matches, and the new hash or None
+        """
+        return await executor.run(passwords.verify_and_update, plain_password, hashed_password, self.hash_rounds)
+
+    async def get_password_hash(self, password: str) -> str:
         """
         The get_password_hash function takes a password as input and returns the hash of that password.
-        The hash is generated using the pwd_context object, which is an instance of Flask-Bcrypt Bcrypt class.
+        The hash is generated using the pwd_context object in the cpu executor.
 
         :param self: Represent the instance of the class
         :param password: str: Pass in the password that is to be hashed
         :return: A password hash
         """
-        return self.pwd_context.hash(password)
+        return await executor.run(passwords.hash_password, password, self.hash_rounds)
+
+    async def calibrate_password_hash(self) -> int:
+        """
+        The calibrate_password_hash function sets hash_rounds to the highest bcrypt work factor
+        verifying in settings.bcrypt_target_ms on this machine, bounded by settings.bcrypt_min_rounds
+        and settings.bcrypt_max_rounds. With no target settings.bcrypt_rounds is kept.
+
+        :param self: Represent the instance of the class
+        :return: The work factor
+        """
+        if settings.bcrypt_target_ms > 0:
+            self.hash_rounds = await executor.run(passwords.calibrate, settings.bcrypt_target_ms,
+                                                  settings.bcrypt_min_rounds, settings.bcrypt_max_rounds)
+            logger.info(f'bcrypt calibrated to {self.hash_rounds} rounds for {settings.bcrypt_target_ms} ms')
+        return self.hash_rounds
 
     async def create_access_token(self, data: dict, expires_delta: Optional[float] = None) -> str:
         """
@@ -67,7 +120,8 @@ class Auth:
         else:
             expire = datetime.utcnow() + timedelta(hours=2)
 
-        to_encode.update({'iat': datetime.utcnow(), 'exp': expire, 'scope': 'access_token'})
+        # jti identifies the token in the revocation list
+        to_encode.update({'iat': datetime.utcnow(), 'exp': expire, 'scope': 'access_token', 'jti': uuid4().hex})
         encoded_access_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encoded_access_token
 
@@ -90,7 +144,7 @@ class Auth:
         else:
             expire = datetime.utcnow() + timedelta(days=7)
 
-        to_encode.update({'iat': datetime.utcnow(), 'exp': expire, 'scope': 'refresh_token'})
+        to_encode.update({'iat': datetime.utcnow(), 'exp': expire, 'scope': 'refresh_token', 'jti': uuid4().hex})
         encode_refresh_token = jwt.encode(to_encode, self.SECRET_KEY, algorithm=self.ALGORITHM)
         return encode_refresh_token
 
@@ -114,6 +168,45 @@ class Auth:
         except JWTError:
             raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.COULD_NOT_VALIDATE_CREDENTIALS)
 
+    def decode_token(self, token: str) -> TokenClaims:
+        """
+        The decode_token function verifies the token and returns the claims the app reads.
+        Verified tokens are remembered by their digest until they expire (at most settings.token_cache_ttl),
+        so a hot token skips the signature check and the claims parsing.
+
+        :param self: Represent the instance of the class
+        :param token: str: The encoded jwt
+        :return: The email, scope, jti and expiry of the token
+        :raises JWTError: The token is invalid or expired
+        """
+        digest = hashlib.blake2b(token.encode(), digest_size=16).digest()
+        cached = self.token_cache.get(digest)
+        if cached is not None and (cached.exp is None or cached.exp > time.time()):
+            return cached
+        payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
+        claims = TokenClaims(payload.get('sub'), payload.get('scope'), payload.get('jti'), payload.get('exp'))
+        ttl = settings.token_cache_ttl if claims.exp is None else min(claims.exp - time.time(), settings.token_cache_ttl)
+        if ttl > 0:
+            self.token_cache.set(digest, claims, ttl=ttl)
+        return claims
+
+    def access_claims(self, token: str) -> TokenClaims:
+        """
+        The access_claims function returns the claims of a valid access token,
+        otherwise it raises an HTTPException with the error text.
+
+        :param self: Represent the instance of the class
+        :param token: str: The encoded jwt
+        :return: The claims of the token
+        """
+        try:
+            claims = self.decode_token(token)
+        except JWTError:
+            raise self.credentials_exception
+        if claims.scope != 'access_token' or claims.email is None:
+            raise self.credentials_exception
+        return claims
+
     def verify_access_token(self, token: str = Depends(oauth2_scheme)) -> str:
         """
         The verify_jwt_token function is a dependency for the protected endpoints.
@@ -124,54 +217,90 @@ class Auth:
         :param token: str: Get the token from the authorization header
         :return: The email of the user
         """
+        return self.access_claims(token).email
+
+    async def revoke_access_token(self, token: str) -> str:
+        """
+        The revoke_access_token function puts the token in the revocation list until it expires,
+        get_current_user rejects it from then on.
+
+        :param self: Represent the instance of the class
+        :param token: str: The access token to revoke
+        :return: The email of the user
+        """
+        claims = self.access_claims(token)
+        await revocations.revoke(claims.jti, claims.exp)
+        return claims.email
+
+    async def get_current_user(self, token: str = Depends(oauth2_scheme),
+                               db: Session = Depends(get_db)) -> CachedUser:
+        """
+        The get_current_user function is the dependency resolving the user of the access token.
+        FastAPI caches a dependency per request, so the routes and their RoleAccess dependency
+        share one call: the token is verified and the user loaded once per request.
+        Revoked tokens (logout) and inactive users (ban) are rejected; a token that was never revoked
+        is let through by the local Bloom filter of the revocation list without a redis call.
+
+        :param self: Represent the instance of the class
+        :param token: str: Get the token from the authorization header
+        :param db: Session: Load the user on a cache miss
+        :return: The current user
+        """
+        claims = self.access_claims(token)
+        if await revocations.is_revoked(claims.jti):
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.TOKEN_REVOKED)
+        user = await self.load_user(claims.email, db)
+        if not user.active:
+            raise HTTPException(status_code=status.HTTP_401_UNAUTHORIZED, detail=messages.FORBIDDEN)
+        return user
+
+    async def load_user(self, email: str, db: Session) -> CachedUser:
+        # get user from the local cache, then redis_cache, the database is the fallback when redis is unavailable
+        user = self.local_cache.get(email)
+        if user is not None:
+            return user
         try:
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload['sub']
-                if email is None:
-                    raise self.credentials_exception
-            else:
+            cached = await self.redis_cache.get(user_cache_key(email))
+        except RedisError as err:
+            logger.warning(f'user cache unavailable: {err}')
+            cached = None
+        if cached is not None:
+            user = CachedUser.loads(cached)
+        else:
+            db_user = await repository_users.get_user_by_email(email, db)
+            if db_user is None:
                 raise self.credentials_exception
-        except JWTError as e:
-            raise self.credentials_exception
-        return email
+            user = CachedUser.from_user(db_user)
+            try:
+                # value and expiry in one SET ... EX round trip
+                await self.redis_cache.set(user_cache_key(email), user.dumps(), ex=settings.user_cache_ttl)
+            except RedisError as err:
+                logger.warning(f'user cache unavailable: {err}')
+        self.local_cache.set(email, user)
+        return user
 
-    async def get_current_user(self, token: str = Depends(oauth2_scheme), db: Session = Depends(get_db)):
-        credentials_exception = HTTPException(
-            status_code=status.HTTP_401_UNAUTHORIZED,
-            detail=messages.COULD_NOT_VALIDATE_CREDENTIALS
-        )
+    async def invalidate_user(self, email: Optional[str]) -> None:
+        """
+        The invalidate_user function drops the cached user after it has changed in the database:
+        from redis, and from the local cache of every worker through the invalidation bus.
 
+        :param self: Represent the instance of the class
+        :param email: Optional[str]: The email of the changed user
+        :return: None
+        """
+        if not email:
+            return
         try:
-            # Decode JWT
-            payload = jwt.decode(token, self.SECRET_KEY, algorithms=[self.ALGORITHM])
-            if payload['scope'] == 'access_token':
-                email = payload["sub"]
-                if email is None:
-                    raise credentials_exception
-            else:
-                raise credentials_exception
-            # check token in blacklist
-            # black_list_token = await repository_users.find_blacklisted_token(token, db)
-            # if black_list_token:
-            #     raise credentials_exception
-            
-        except JWTError as e:
-            raise credentials_exception
-        
-        # get user from redis_cache
-        user = self.redis_cache.get(f'user:{email}')
-        if user is None:
-            print("USER POSTGRES")
-            user = await repository_users.get_user_by_email(email, db)
-            if user is None:
-                raise credentials_exception
-            self.redis_cache.set(f'user:{email}', pickle.dumps(user))
-            self.redis_cache.expire(f'user:{email}', 900)
+            await self.redis_cache.delete(user_cache_key(email))
+        except RedisError as err:
+            logger.warning(f'user cache unavailable: {err}')
+        await bus.publish('user', email)
+
+    def evict_local_user(self, email: Optional[str]) -> None:
+        if email is None:
+            self.local_cache.clear()
         else:
-            print("USER CACHE")
-            user = pickle.loads(user)
-        return user
+            self.local_cache.delete(email)
 
 
     def create_email_token(self, data: dict) -> str:
@@ -212,3 +341,4 @@ class Auth:
 
 
 auth_service = Auth()
+bus.subscribe('user', auth_service.evict_local_user)
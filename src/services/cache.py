@@ -0,0 +1,86 @@
+import time
+from collections import OrderedDict
+from typing import Any, Awaitable, Callable, Hashable, Optional
+
+from redis.exceptions import RedisError
+
+from src.conf.logger import get_logger
+
+logger = get_logger(__name__)
+
+_missing = object()
+
+
+class LRUCache:
+    """In-process least recently used cache whose entries expire after ttl seconds, one per worker process."""
+
+    def __init__(self, maxsize: int, ttl: float):
+        self.maxsize = maxsize
+        self.ttl = ttl
+        self.entries: OrderedDict[Hashable, tuple[float, Any]] = OrderedDict()
+
+    def get(self, key: Hashable, default: Any = None) -> Any:
+        entry = self.entries.get(key, _missing)
+        if entry is _missing:
+            return default
+        expires, value = entry
+        if expires <= time.monotonic():
+            del self.entries[key]
+            return default
+        self.entries.move_to_end(key)
+        return value
+
+    def set(self, key: Hashable, value: Any, ttl: float = None) -> None:
+        self.entries[key] = (time.monotonic() + (self.ttl if ttl is None else ttl), value)
+        self.entries.move_to_end(key)
+        while len(self.entries) > self.maxsize:
+            self.entries.popitem(last=False)
+
+    def delete(self, key: Hashable) -> None:
+        self.entries.pop(key, None)
+
+    def clear(self) -> None:
+        self.entries.clear()
+
+    def __len__(self) -> int:
+        return len(self.entries)
+
+
+class TieredCache:
+    """
+    Bytes cache with an LRUCache in front of Redis: hits are served from the process memory,
+    misses go to Redis, which is shared by all the workers. Redis being down only costs the cache.
+    """
+
+    def __init__(self, prefix: str, client, maxsize: int, ttl: int):
+        self.prefix = prefix
+        self.client = client
+        self.ttl = ttl
+        self.local = LRUCache(maxsize, ttl)
+
+    async def get(self, key: str) -> Optional[bytes]:
+        value = self.local.get(key)
+        if value is not None:
+            return value
+        try:
+            value = await self.client.get(f'{self.prefix}:{key}')
+        except RedisError as err:
+            logger.warning(f'{self.prefix} cache unavailable: {err}')
+            return None
+        if value is not None:
+            self.local.set(key, value)
+        return value
+
+    async def set(self, key: str, value: bytes) -> None:
+        self.local.set(key, value)
+        try:
+            await self.client.set(f'{self.prefix}:{key}', value, ex=self.ttl)
+        except RedisError as err:
+            logger.warning(f'{self.prefix} cache unavailable: {err}')
+
+    async def get_or_set(self, key: str, factory: Callable[[], Awaitable[bytes]]) -> bytes:
+        value = await self.get(key)
+        if value is None:
+            value = await factory()
+            await self.set(key, value)
+        return value
@@ -51,6 +51,7 @@ async def send_email(email: EmailStr, username: str, host: str):
         await fm.send_message(message, template_name="email_template.html")
     except ConnectionErrors as err:
         logger.error(err)
+        raise  # the job is retried, see src.services.tasks
 
 
 async def send_reset_password_email(email: EmailStr, username: str, host: str):
@@ -79,3 +80,4 @@ async def send_reset_password_email(email: EmailStr, username: str, host: str):
         await fm.send_message(message, template_name="reset_password_template.html")
     except ConnectionErrors as err:
         logger.error(err)
+        raise  # the job is retried, see src.services.tasks
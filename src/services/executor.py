@@ -0,0 +1,68 @@
+import asyncio
+import multiprocessing
+import os
+import time
+from concurrent.futures import Executor, ProcessPoolExecutor, ThreadPoolExecutor
+from functools import partial
+from typing import Any, Callable, Optional
+
+from src.conf.config import settings
+
+
+class CPUExecutor:
+    """
+    Shared pool for the cpu bound work (bcrypt, QR codes, image rendering), so it never runs on the event loop.
+    With the process pool the function and its arguments must be picklable, i.e. module level functions.
+    """
+
+    def __init__(self, kind: str, workers: int):
+        self.kind = kind
+        self.workers = workers or os.cpu_count() or 1
+        self.pool: Optional[Executor] = None
+        self.in_flight = 0
+        self.max_in_flight = 0
+        self.completed = 0
+        self.total_seconds = 0.0
+
+    def get_pool(self) -> Executor:
+        # created on first use, spawn keeps the children clear of the parent's threads and sockets
+        if self.pool is None:
+            if self.kind == 'process':
+                self.pool = ProcessPoolExecutor(self.workers, mp_context=multiprocessing.get_context('spawn'))
+            else:
+                self.pool = ThreadPoolExecutor(self.workers, thread_name_prefix='cpu')
+        return self.pool
+
+    async def run(self, func: Callable, *args, **kwargs) -> Any:
+        """
+        The run method runs func(*args, **kwargs) in the pool and waits for the result without blocking the loop.
+
+        :param func: Callable: The function to run
+        :return: What the function returns
+        """
+        self.in_flight += 1
+        self.max_in_flight = max(self.max_in_flight, self.in_flight)
+        start = time.perf_counter()
+        try:
+            return await asyncio.get_running_loop().run_in_executor(self.get_pool(), partial(func, *args, **kwargs))
+        finally:
+            self.in_flight -= 1
+            self.completed += 1
+            self.total_seconds += time.perf_counter() - start
+
+    def metrics(self) -> dict:
+        return {'kind': self.kind,
+                'workers': self.workers,
+                'in_flight': self.in_flight,
+                'queued': max(0, self.in_flight - self.workers),
+                'max_in_flight': self.max_in_flight,
+                'completed': self.completed,
+                'avg_ms': round(self.total_seconds / self.completed * 1000, 3) if self.completed else 0}
+
+    def shutdown(self) -> None:
+        if self.pool is not None:
+            self.pool.shutdown(wait=False, cancel_futures=True)
+            self.pool = None
+
+
+executor = CPUExecutor(settings.cpu_executor, settings.cpu_executor_workers)
@@ -0,0 +1,184 @@
+import hashlib
+import json
+import os
+import tempfile
+from pathlib import Path
+from typing import Any, Dict, List
+
+from PIL import Image, ImageChops, ImageDraw, ImageOps
+
+from src.conf.config import settings
+
+# cloudinary gravity -> (x, y) centering used by ImageOps.fit and crop, faces are not detected locally
+GRAVITY = {
+    'center': (0.5, 0.5), 'face': (0.5, 0.5), 'faces': (0.5, 0.5), 'auto': (0.5, 0.5),
+    'north': (0.5, 0.0), 'south': (0.5, 1.0), 'west': (0.0, 0.5), 'east': (1.0, 0.5),
+    'north_west': (0.0, 0.0), 'north_east': (1.0, 0.0), 'south_west': (0.0, 1.0), 'south_east': (1.0, 1.0),
+}
+FORMATS = {'jpg': 'JPEG', 'jpeg': 'JPEG', 'png': 'PNG', 'webp': 'WEBP', 'gif': 'GIF'}
+AUTO_FORMAT = 'webp'
+# the formats accepted for upload and the extension they are stored under
+UPLOAD_FORMATS = {'JPEG': 'jpg', 'PNG': 'png', 'WEBP': 'webp', 'GIF': 'gif'}
+
+
+def canonical_preset(preset: List[Dict[str, Any]]) -> str:
+    return json.dumps(preset, sort_keys=True, separators=(',', ':'), default=str)
+
+
+def preset_hash(preset: List[Dict[str, Any]]) -> str:
+    return hashlib.sha256(canonical_preset(preset).encode()).hexdigest()
+
+
+def image_suffix(path: Path) -> str:
+    """
+    The image_suffix function checks that the file is an image the api serves and returns its extension,
+    detected from the content: the client's file name says nothing about it.
+
+    :param path: Path: The file
+    :return: The extension, without the dot
+    :raises ValueError: The file is not a jpeg, png, webp or gif image
+    """
+    try:
+        with Image.open(path) as img:
+            img.verify()
+            fmt = img.format
+    except Exception as err:
+        raise ValueError('not an image') from err
+    if fmt not in UPLOAD_FORMATS:
+        raise ValueError(f'unsupported image format {fmt}')
+    return UPLOAD_FORMATS[fmt]
+
+
+def is_dimension(value: Any) -> bool:
+    # int pixels, or a float fraction of the current size, never beyond the output cap
+    return isinstance(value, (int, float)) and not isinstance(value, bool) \
+        and 0 < value <= settings.image_max_dimension
+
+
+def validate_preset(preset: List[Dict[str, Any]]) -> List[Dict[str, Any]]:
+    """
+    The validate_preset function checks the values the local engine uses: the formats, the sizes and the radius.
+    The presets come from the users and end up in file names and in the size of the rendered images.
+
+    :param preset: List[Dict[str, Any]]: The transformation preset
+    :return: The preset, unchanged
+    :raises ValueError: The first invalid value
+    """
+    for step in preset:
+        for key in ('fetch_format', 'format'):
+            fmt = step.get(key)
+            if fmt is not None and (not isinstance(fmt, str) or fmt.lower() not in (*FORMATS, 'auto')):
+                raise ValueError(f'{key} must be one of {", ".join((*FORMATS, "auto"))}')
+        for key in ('width', 'height'):
+            if step.get(key) is not None and not is_dimension(step[key]):
+                raise ValueError(f'{key} must be a number from 0 to {settings.image_max_dimension}')
+        radius = step.get('radius')
+        if radius is not None and radius != 'max' \
+                and (not isinstance(radius, int) or isinstance(radius, bool) or radius < 0):
+            raise ValueError('radius must be "max" or a whole number of pixels')
+    return preset
+
+
+def output_format(preset: List[Dict[str, Any]], source_suffix: str) -> str:
+    # the last fetch_format/format wins, like chained cloudinary transformations
+    fmt = source_suffix.lstrip('.').lower()
+    fmt = fmt if fmt in FORMATS else 'png'
+    for step in preset:
+        fmt = str(step.get('fetch_format') or step.get('format') or fmt).lower()
+    fmt = AUTO_FORMAT if fmt == 'auto' else fmt
+    if fmt not in FORMATS:
+        raise ValueError(f'unsupported format {fmt!r}')
+    return fmt
+
+
+def capped(width: int, height: int) -> tuple[int, int]:
+    # the output size keeps its aspect ratio within settings.image_max_dimension
+    scale = min(1.0, settings.image_max_dimension / max(width, height, 1))
+    return max(1, round(width * scale)), max(1, round(height * scale))
+
+
+def resize(img: Image.Image, step: Dict[str, Any]) -> Image.Image:
+    width, height = step.get('width'), step.get('height')
+    if not width and not height:
+        return img
+    crop = step.get('crop', 'scale')
+    centering = GRAVITY.get(step.get('gravity', 'center'), (0.5, 0.5))
+    # width/height as in cloudinary: int pixels or a float fraction of the current size
+    width = int(width * img.width) if isinstance(width, float) and width <= 1 else int(width or 0)
+    height = int(height * img.height) if isinstance(height, float) and height <= 1 else int(height or 0)
+    width, height = min(width, settings.image_max_dimension), min(height, settings.image_max_dimension)
+    if crop == 'scale':
+        width = width or round(img.width * height / img.height)
+        height = height or round(img.height * width / img.width)
+        return img.resize(capped(width, height), Image.LANCZOS)
+    if crop == 'fit':
+        return ImageOps.contain(img, (width or img.width, height or img.height), Image.LANCZOS)
+    if crop == 'limit':
+        # like fit, but never upscales
+        limited = img.copy()
+        limited.thumbnail((width or img.width, height or img.height), Image.LANCZOS)
+        return limited
+    if crop in ('fill', 'thumb'):
+        return ImageOps.fit(img, (width or img.width, height or img.height), Image.LANCZOS, centering=centering)
+    if crop == 'crop':
+        width, height = min(width or img.width, img.width), min(height or img.height, img.height)
+        left = round((img.width - width) * centering[0])
+        top = round((img.height - height) * centering[1])
+        return img.crop((left, top, left + width, top + height))
+    return img
+
+
+def round_corners(img: Image.Image, radius: Any) -> Image.Image:
+    img = img.convert('RGBA')
+    mask = Image.new('L', img.size, 0)
+    draw = ImageDraw.Draw(mask)
+    if radius == 'max':
+        draw.ellipse((0, 0, img.width - 1, img.height - 1), fill=255)
+    else:
+        draw.rounded_rectangle((0, 0, img.width - 1, img.height - 1), radius=int(radius), fill=255)
+    img.putalpha(ImageChops.multiply(img.getchannel('A'), mask))
+    return img
+
+
+def apply_preset(img: Image.Image, preset: List[Dict[str, Any]]) -> Image.Image:
+    """
+    The apply_preset function applies the steps of a cloudinary style preset to the image, in order.
+    Supported keys are width, height, crop (scale, fit, limit, fill, thumb, crop), gravity and radius,
+    anything else is ignored. The values are expected to have passed validate_preset.
+
+    :param img: Image: The source image
+    :param preset: List[Dict[str, Any]]: The preset, e.g. [{'width': 200, 'crop': 'scale'}, {'radius': 'max'}]
+    :return: The transformed image
+    """
+    img = ImageOps.exif_transpose(img)
+    for step in preset:
+        img = resize(img, step)
+        if step.get('radius'):
+            img = round_corners(img, step['radius'])
+    return img
+
+
+def render(source: Path, preset: List[Dict[str, Any]], target: Path) -> Path:
+    """
+    The render function writes the transformed copy of the source image to the target path.
+    The file is written to a temporary name first, so a concurrent reader never sees a partial image.
+
+    :param source: Path: The original image
+    :param preset: List[Dict[str, Any]]: The transformation preset
+    :param target: Path: Where the derivative is stored, its suffix gives the output format
+    :return: The target path
+    """
+    fmt = FORMATS.get(target.suffix.lstrip('.').lower(), 'PNG')
+    validate_preset(preset)
+    with Image.open(source) as img:
+        img = apply_preset(img, preset)
+        if fmt == 'JPEG' and img.mode != 'RGB':
+            # no alpha in jpeg: transparent corners become white, as cloudinary does
+            background = Image.new('RGB', img.size, 'white')
+            background.paste(img, mask=img.convert('RGBA').getchannel('A'))
+            img = background
+        target.parent.mkdir(parents=True, exist_ok=True)
+        with tempfile.NamedTemporaryFile(dir=target.parent, suffix=target.suffix, delete=False) as tmp:
+            img.save(tmp, format=fmt)
+    os.replace(tmp.name, target)
+    return target
@@ -0,0 +1,105 @@
+import asyncio
+import json
+from abc import ABC, abstractmethod
+from collections import defaultdict
+from typing import Callable, Dict, List, Optional
+from uuid import uuid4
+
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.conf.logger import get_logger
+from src.database.db import client_redis
+
+logger = get_logger(__name__)
+
+CHANNEL = 'cache:invalidate'
+
+# called with the key to evict, or None to evict everything (e.g. after missed messages)
+Handler = Callable[[Optional[str]], None]
+
+
+class InvalidationBus(ABC):
+    """
+    Tells every worker process to evict an entry from its local caches.
+    Caches subscribe a handler per topic ('user', ...), writers publish the topic and the key that changed.
+    """
+
+    def __init__(self):
+        self.handlers: Dict[str, List[Handler]] = defaultdict(list)
+
+    def subscribe(self, topic: str, handler: Handler) -> None:
+        self.handlers[topic].append(handler)
+
+    def dispatch(self, topic: str, key: Optional[str]) -> None:
+        for handler in self.handlers.get(topic, ()):
+            try:
+                handler(key)
+            except Exception as err:
+                logger.error(f'invalidation of {topic}:{key} failed: {err!r}')
+
+    def dispatch_all(self) -> None:
+        for topic in list(self.handlers):
+            self.dispatch(topic, None)
+
+    @abstractmethod
+    async def publish(self, topic: str, key: Optional[str]) -> None:
+        """Evicts the key here and in every other worker."""
+
+    async def listen(self) -> None:
+        """Receives the other workers' evictions until cancelled."""
+
+
+class MemoryInvalidationBus(InvalidationBus):
+    """For tests and single process setups: there are no other workers to tell."""
+
+    async def publish(self, topic: str, key: Optional[str]) -> None:
+        self.dispatch(topic, key)
+
+
+class RedisInvalidationBus(InvalidationBus):
+    def __init__(self, client):
+        super().__init__()
+        self.client = client
+        self.origin = uuid4().hex
+
+    async def publish(self, topic: str, key: Optional[str]) -> None:
+        # evicted here at once, the listener skips our own message
+        self.dispatch(topic, key)
+        try:
+            await self.client.publish(CHANNEL, json.dumps({'origin': self.origin, 'topic': topic, 'key': key}))
+        except RedisError as err:
+            logger.warning(f'invalidation bus unavailable, {topic}:{key} expires by ttl: {err}')
+
+    def receive(self, data: str) -> None:
+        message = json.loads(data)
+        if message['origin'] != self.origin:
+            self.dispatch(message['topic'], message['key'])
+
+    async def listen(self) -> None:
+        while True:
+            try:
+                async with self.client.pubsub() as pubsub:
+                    await pubsub.subscribe(CHANNEL)
+                    # whatever was published while we were not subscribed is lost, start clean
+                    self.dispatch_all()
+                    async for message in pubsub.listen():
+                        if message['type'] != 'message':
+                            continue
+                        try:
+                            self.receive(message['data'])
+                        except Exception:
+                            # a bad message must not end the listener, the local caches would go stale
+                            logger.exception(f'invalid invalidation message: {message["data"]!r}')
+            except RedisError as err:
+                logger.warning(f'invalidation bus disconnected: {err}')
+                await asyncio.sleep(settings.invalidation_retry_seconds)
+
+
+def create_bus() -> InvalidationBus:
+    if settings.invalidation_backend == 'memory':
+        return MemoryInvalidationBus()
+    return RedisInvalidationBus(client_redis)
+
+
+bus = create_bus()
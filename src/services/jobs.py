@@ -0,0 +1,286 @@
+import asyncio
+import inspect
+import json
+import math
+import time
+from abc import ABC, abstractmethod
+from dataclasses import asdict, dataclass, field
+from typing import Any, Callable, Dict, Optional
+from uuid import uuid4
+
+from redis.exceptions import RedisError
+from starlette.concurrency import run_in_threadpool
+
+from src.conf.config import settings
+from src.conf.logger import get_logger
+from src.database.db import client_redis
+
+logger = get_logger(__name__)
+
+QUEUED = 'queued'
+RUNNING = 'running'
+DONE = 'done'
+FAILED = 'failed'
+
+
+@dataclass
+class JobRecord:
+    id: str
+    name: str
+    kwargs: Dict[str, Any]
+    owner_id: Optional[int] = None
+    status: str = QUEUED
+    attempts: int = 0
+    max_retries: int = 0
+    result: Any = None
+    error: Optional[str] = None
+    created_at: float = field(default_factory=time.time)
+    finished_at: Optional[float] = None
+
+    def dumps(self) -> str:
+        return json.dumps(asdict(self))
+
+    @classmethod
+    def loads(cls, raw: str) -> 'JobRecord':
+        return cls(**json.loads(raw))
+
+
+class Job:
+    """A task run by the job workers, its arguments and result must be json serializable."""
+
+    def __init__(self, name: str, func: Callable, max_retries: int):
+        self.name = name
+        self.func = func
+        self.max_retries = max_retries
+
+    async def __call__(self, **kwargs):
+        # sync functions are cpu or blocking io bound, keep them off the event loop
+        if inspect.iscoroutinefunction(self.func):
+            return await self.func(**kwargs)
+        return await run_in_threadpool(self.func, **kwargs)
+
+    async def delay(self, owner_id: int = None, countdown: float = 0, **kwargs) -> str:
+        """Queues the job, to run countdown seconds from now if given, and returns its id."""
+        return await queue.enqueue(self.name, kwargs, owner_id, self.max_retries, countdown)
+
+
+registry: Dict[str, Job] = {}
+
+
+def job(name: str, max_retries: int = None) -> Callable[[Callable], Job]:
+    """
+    The job decorator registers the function as a background job under the given name.
+    The function is queued with await func.delay(**kwargs) and run by a worker, see src.services.worker.
+
+    :param name: str: The name the job is queued under
+    :param max_retries: int: How many times a failed job is retried, settings.job_max_retries by default
+    :return: The decorator
+    """
+    def decorator(func: Callable) -> Job:
+        registry[name] = Job(name, func, settings.job_max_retries if max_retries is None else max_retries)
+        return registry[name]
+    return decorator
+
+
+class JobQueue(ABC):
+    """Keeps the job records and the queue of the job ids waiting for a worker."""
+
+    @abstractmethod
+    async def save(self, record: JobRecord) -> None:
+        """Stores the job record."""
+
+    @abstractmethod
+    async def get(self, job_id: str) -> Optional[JobRecord]:
+        """Returns the job record, None if it is unknown or expired."""
+
+    @abstractmethod
+    async def push(self, job_id: str, delay: float = 0) -> None:
+        """Queues the job id, after delay seconds if given."""
+
+    @abstractmethod
+    async def pop(self, timeout: float) -> Optional[str]:
+        """Waits up to timeout seconds for the next job id."""
+
+    async def ack(self, job_id: str) -> None:
+        """Forgets the job id taken by pop, once its run is over."""
+
+    async def heartbeat(self) -> None:
+        """Tells the other workers this one is alive, called every settings.job_heartbeat_seconds."""
+
+    async def enqueue(self, name: str, kwargs: Dict[str, Any], owner_id: int = None, max_retries: int = 0,
+                      delay: float = 0) -> str:
+        record = JobRecord(id=uuid4().hex, name=name, kwargs=kwargs, owner_id=owner_id, max_retries=max_retries)
+        await self.save(record)
+        await self.push(record.id, delay)
+        return record.id
+
+    async def run(self, record: JobRecord) -> JobRecord:
+        """
+        The run method runs the job and stores its outcome.
+        A failed job is queued again with an exponential backoff until its retries are used up.
+
+        :param record: JobRecord: The job to run
+        :return: The updated job record
+        """
+        if record.attempts > record.max_retries:
+            # queued again after its worker was lost, with no retries left
+            record.status, record.error = FAILED, 'worker lost'
+            record.finished_at = time.time()
+            await self.save(record)
+            return record
+        record.status = RUNNING
+        record.attempts += 1
+        await self.save(record)
+        try:
+            if record.name not in registry:
+                raise LookupError(f'unknown job {record.name}')
+            record.result = await registry[record.name](**record.kwargs)
+            record.status, record.error = DONE, None
+        except Exception as err:
+            record.error = repr(err)
+            if record.attempts <= record.max_retries:
+                logger.warning(f'job {record.name} {record.id} failed, retry {record.attempts}: {err!r}')
+                record.status = QUEUED
+                await self.save(record)
+                await self.push(record.id, delay=settings.job_retry_delay * 2 ** (record.attempts - 1))
+                return record
+            logger.error(f'job {record.name} {record.id} failed: {err!r}')
+            record.status = FAILED
+        record.finished_at = time.time()
+        await self.save(record)
+        return record
+
+    async def run_next(self, timeout: float = 1) -> Optional[JobRecord]:
+        job_id = await self.pop(timeout)
+        if not job_id:
+            return None
+        record = await self.get(job_id)
+        if record:
+            record = await self.run(record)
+        # not acknowledged when the run is interrupted, so the job is not lost with the worker
+        await self.ack(job_id)
+        return record
+
+    async def work(self) -> None:
+        """Runs the queued jobs until cancelled, settings.job_worker_concurrency at a time."""
+        async def beat():
+            while True:
+                try:
+                    await self.heartbeat()
+                except RedisError as err:
+                    logger.error(f'job worker heartbeat: {err!r}')
+                await asyncio.sleep(settings.job_heartbeat_seconds)
+
+        async def loop():
+            while True:
+                try:
+                    await self.run_next()
+                except asyncio.CancelledError:
+                    raise
+                except Exception as err:
+                    # a broken queue connection must not stop the worker
+                    logger.error(f'job worker: {err!r}')
+                    await asyncio.sleep(1)
+
+        await asyncio.gather(beat(), *(loop() for _ in range(settings.job_worker_concurrency)))
+
+
+class RedisJobQueue(JobQueue):
+    """
+    Jobs shared by all the api and worker processes: the records are json strings kept for
+    settings.job_result_ttl seconds, the ids wait in a list and the delayed ones in a sorted set by due time.
+    A worker moves the ids it takes to a processing list of its own and removes them once the job is over.
+    The lists of the workers that stopped sending heartbeats are queued again by the others,
+    so a job survives the crash or the redeploy of its worker.
+    """
+    queue_key = 'jobs:queue'
+    delayed_key = 'jobs:delayed'
+    processing_prefix = 'jobs:processing'
+    worker_prefix = 'jobs:worker'
+
+    def __init__(self, client):
+        self.client = client
+        self.worker_id = uuid4().hex
+        self.processing_key = f'{self.processing_prefix}:{self.worker_id}'
+
+    async def save(self, record: JobRecord) -> None:
+        await self.client.set(f'job:{record.id}', record.dumps(), ex=settings.job_result_ttl)
+
+    async def get(self, job_id: str) -> Optional[JobRecord]:
+        raw = await self.client.get(f'job:{job_id}')
+        return JobRecord.loads(raw) if raw else None
+
+    async def push(self, job_id: str, delay: float = 0) -> None:
+        if delay:
+            await self.client.zadd(self.delayed_key, {job_id: time.time() + delay})
+        else:
+            await self.client.lpush(self.queue_key, job_id)
+
+    async def pop(self, timeout: float) -> Optional[str]:
+        for job_id in await self.client.zrangebyscore(self.delayed_key, 0, time.time()):
+            # zrem succeeds in one worker only, so a due job is queued once
+            if await self.client.zrem(self.delayed_key, job_id):
+                await self.client.lpush(self.queue_key, job_id)
+        return await self.client.blmove(self.queue_key, self.processing_key, max(1, int(timeout)), 'RIGHT', 'LEFT')
+
+    async def ack(self, job_id: str) -> None:
+        await self.client.lrem(self.processing_key, 1, job_id)
+
+    async def heartbeat(self) -> None:
+        await self.client.set(f'{self.worker_prefix}:{self.worker_id}', 1,
+                              ex=math.ceil(settings.job_heartbeat_seconds * 3))
+        await self.requeue_lost()
+
+    async def requeue_lost(self) -> int:
+        """
+        The requeue_lost method queues again the jobs of the workers that stopped sending heartbeats.
+
+        :return: The number of jobs queued again
+        """
+        requeued = 0
+        async for key in self.client.scan_iter(match=f'{self.processing_prefix}:*'):
+            worker_id = key.rsplit(':', 1)[1]
+            if worker_id == self.worker_id or await self.client.exists(f'{self.worker_prefix}:{worker_id}'):
+                continue
+            # lmove hands every id to one worker only, however many recover the list at once
+            while await self.client.lmove(key, self.queue_key, 'RIGHT', 'LEFT'):
+                requeued += 1
+        if requeued:
+            logger.warning(f'{requeued} jobs of lost workers queued again')
+        return requeued
+
+
+class MemoryJobQueue(JobQueue):
+    """Jobs kept in the api process and run by its own worker task, for tests and single process setups."""
+
+    def __init__(self):
+        self.records: Dict[str, str] = {}
+        self.pending: asyncio.Queue = asyncio.Queue()
+
+    async def save(self, record: JobRecord) -> None:
+        self.records[record.id] = record.dumps()
+
+    async def get(self, job_id: str) -> Optional[JobRecord]:
+        raw = self.records.get(job_id)
+        return JobRecord.loads(raw) if raw else None
+
+    async def push(self, job_id: str, delay: float = 0) -> None:
+        if delay:
+            asyncio.get_running_loop().call_later(delay, self.pending.put_nowait, job_id)
+        else:
+            self.pending.put_nowait(job_id)
+
+    async def pop(self, timeout: float) -> Optional[str]:
+        try:
+            return await asyncio.wait_for(self.pending.get(), timeout)
+        except asyncio.TimeoutError:
+            return None
+
+
+def create_queue() -> JobQueue:
+    if settings.job_backend == 'memory':
+        return MemoryJobQueue()
+    return RedisJobQueue(client_redis)
+
+
+queue = create_queue()
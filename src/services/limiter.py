@@ -0,0 +1,205 @@
+import asyncio
+import math
+import time
+from collections import OrderedDict
+from typing import Callable, List, Optional, Tuple
+
+from fastapi import Depends, HTTPException, Request, Response, status
+from fastapi_limiter import default_identifier, http_default_callback
+from fastapi_limiter.depends import RateLimiter
+from redis.exceptions import RedisError
+
+from src.conf import messages
+from src.conf.config import settings
+from src.conf.constants import RATE_LIMITS
+from src.conf.logger import get_logger
+from src.database.db import client_redis
+from src.services.auth import auth_service
+from src.services.user_cache import CachedUser
+
+logger = get_logger(__name__)
+
+
+class TokenBucket:
+    __slots__ = ('capacity', 'rate', 'tokens', 'updated', 'taken', 'seen')
+
+    def __init__(self, capacity: float, rate: float, now: float):
+        self.capacity = capacity
+        self.rate = rate
+        self.tokens = capacity
+        self.updated = now
+        # tokens taken here since the last sync, and the cluster-wide total seen then, None before the first
+        self.taken = 0.0
+        self.seen: Optional[float] = None
+
+    def refill(self, now: float) -> None:
+        self.tokens = min(self.capacity, self.tokens + (now - self.updated) * self.rate)
+        self.updated = now
+
+
+class LocalLimiter:
+    """
+    Token buckets in the memory of this worker, one per limiter and client, the least recently used dropped
+    beyond maxsize. A check costs no network call. With a redis client, sync adds up the tokens taken
+    by every worker in redis and takes the others' share from the local buckets, so the limits hold
+    approximately across the cluster, as of the last sync.
+    """
+    prefix = 'ratelimit'
+
+    def __init__(self, maxsize: int, client=None):
+        self.maxsize = maxsize
+        self.client = client
+        self.buckets: 'OrderedDict[str, TokenBucket]' = OrderedDict()
+
+    def acquire(self, key: str, capacity: float, rate: float) -> float:
+        """
+        The acquire function takes a token from the bucket of the key.
+
+        :param key: str: The limiter and the client
+        :param capacity: float: The burst size, the bucket starts full
+        :param rate: float: The tokens added per second
+        :return: 0 when a token was taken, otherwise the seconds until the next one
+        """
+        now = time.monotonic()
+        bucket = self.buckets.get(key)
+        if bucket is None:
+            bucket = self.buckets[key] = TokenBucket(capacity, rate, now)
+            if len(self.buckets) > self.maxsize:
+                self.buckets.popitem(last=False)
+        else:
+            self.buckets.move_to_end(key)
+            bucket.refill(now)
+        if bucket.tokens >= 1:
+            bucket.tokens -= 1
+            bucket.taken += 1
+            return 0
+        return (1 - bucket.tokens) / bucket.rate
+
+    def state(self, key: str) -> Tuple[int, float]:
+        """Returns the whole tokens left in the bucket of the key and the seconds until it is full again."""
+        bucket = self.buckets[key]
+        return int(bucket.tokens), (bucket.capacity - bucket.tokens) / bucket.rate
+
+    def clear(self) -> None:
+        self.buckets.clear()
+
+    async def sync(self) -> None:
+        # the buckets used within their window, the idle ones have refilled anyway
+        now = time.monotonic()
+        active = [(key, bucket) for key, bucket in self.buckets.items()
+                  if now - bucket.updated <= bucket.capacity / bucket.rate]
+        keys = [key for key, _ in active]
+        buckets: List[Tuple[TokenBucket, float]] = [(bucket, bucket.taken) for _, bucket in active]
+        async with self.client.pipeline(transaction=False) as pipe:
+            for key, (bucket, taken) in zip(keys, buckets):
+                pipe.incrbyfloat(f'{self.prefix}:{key}', taken)
+                # kept while in use, long enough to outlive a sync interval and the bucket's own window
+                pipe.expire(f'{self.prefix}:{key}',
+                            math.ceil(max(bucket.capacity / bucket.rate, 2 * settings.rate_limit_sync_seconds)))
+            results = await pipe.execute()
+        now = time.monotonic()
+        for (bucket, taken), total in zip(buckets, results[::2]):
+            total = float(total)
+            # the first sync of a bucket only learns the total, what the others took before is history;
+            # a total below what we saw means the counter expired and started over
+            if bucket.seen is None or total < bucket.seen + taken:
+                others = 0
+            else:
+                others = total - bucket.seen - taken
+            bucket.seen = total
+            bucket.taken -= taken
+            bucket.refill(now)
+            bucket.tokens = max(0.0, bucket.tokens - others)
+
+    async def sync_forever(self) -> None:
+        while True:
+            await asyncio.sleep(settings.rate_limit_sync_seconds)
+            try:
+                await self.sync()
+            except RedisError as err:
+                logger.warning(f'rate limit sync failed: {err}')
+
+
+local_limiter = LocalLimiter(settings.rate_limit_max_keys, client_redis)
+
+
+class LocalRateLimiter:
+    """
+    The dependency limiting a route with the token buckets of local_limiter, a drop-in for
+    fastapi_limiter's RateLimiter that needs no redis: times requests per period, in bursts of up to times.
+    The buckets are named by name, by default by the method and the path template of the route,
+    the same in every worker and every version, so the redis sync adds up the right counters.
+    Give a name when one route has more than one limiter.
+    """
+
+    def __init__(self, times: int = 1, milliseconds: int = 0, seconds: int = 0, minutes: int = 0, hours: int = 0,
+                 identifier: Optional[Callable] = None, callback: Optional[Callable] = None,
+                 name: Optional[str] = None):
+        self.capacity = times
+        self.rate = times * 1000 / (milliseconds + 1000 * seconds + 60000 * minutes + 3600000 * hours)
+        self.identifier = identifier or default_identifier
+        self.callback = callback or http_default_callback
+        self.name = name
+
+    async def __call__(self, request: Request, response: Response):
+        name = self.name or f'{request.method}:{request.scope["route"].path}'
+        key = f'route:{name}:{await self.identifier(request)}'
+        wait = local_limiter.acquire(key, self.capacity, self.rate)
+        if wait:
+            return await self.callback(request, response, math.ceil(wait * 1000))
+
+
+def rate_limiter(times: int = 1, backend: Optional[str] = None, **kwargs):
+    """
+    The rate_limiter function returns the dependency limiting a route to times requests per period,
+    the period given like to fastapi_limiter's RateLimiter (milliseconds=, seconds=, minutes=, hours=).
+
+    :param times: int: The requests allowed per period
+    :param backend: Optional[str]: 'local' for the in-process token buckets, 'redis' for fastapi_limiter,
+        settings.rate_limit_backend by default
+    :return: The dependency
+    """
+    if (backend or settings.rate_limit_backend) == 'redis':
+        kwargs.pop('name', None)  # fastapi_limiter names its keys itself
+        return RateLimiter(times=times, **kwargs)
+    return LocalRateLimiter(times=times, **kwargs)
+
+
+class UserRateLimit:
+    """
+    The dependency giving every user a budget per operation ('read', 'upload', 'transform', 'qrcode'),
+    sized by role in RATE_LIMITS, shared by all the routes of the operation and kept in local_limiter.
+    The workers add up their buckets in redis every settings.rate_limit_sync_seconds, with the sync off
+    each worker process grants the whole budget on its own.
+    The X-RateLimit-* headers are left in request.state for rate_limit_headers_middleware:
+    routes returning a Response of their own would drop the headers of a dependency's response.
+    """
+
+    def __init__(self, operation: str):
+        self.operation = operation
+        self.limits = RATE_LIMITS[operation]
+
+    async def __call__(self, request: Request, user: CachedUser = Depends(auth_service.get_current_user)):
+        times = self.limits[user.roles.value]
+        key = f'user:{self.operation}:{user.id}'
+        wait = local_limiter.acquire(key, times, times / 60)
+        remaining, reset = local_limiter.state(key)
+        headers = {'X-RateLimit-Limit': str(times), 'X-RateLimit-Remaining': str(remaining),
+                   'X-RateLimit-Reset': str(math.ceil(reset))}
+        if wait:
+            raise HTTPException(status_code=status.HTTP_429_TOO_MANY_REQUESTS, detail=messages.TOO_MANY_REQUESTS,
+                                headers={**headers, 'Retry-After': str(math.ceil(wait))})
+        request.state.rate_limit_headers = headers
+
+
+async def rate_limit_headers_middleware(request: Request, call_next):
+    """
+    The rate_limit_headers_middleware function adds the X-RateLimit-* headers of UserRateLimit to the response.
+
+    :param request: Request: Get the request object
+    :param call_next: Call the next middleware in the chain
+    :return: A response object
+    """
+    response = await call_next(request)
+    response.headers.update(getattr(request.state, 'rate_limit_headers', {}))
+    return response
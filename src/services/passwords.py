@@ -0,0 +1,63 @@
+import time
+from functools import lru_cache
+from typing import Optional, Tuple
+
+from passlib.context import CryptContext
+
+from src.conf.config import settings
+
+# kept apart from src.services.auth: the executor's worker processes import only this module.
+# They don't share the calibrated work factor of the app process, so it is passed to every call.
+
+
+@lru_cache(maxsize=None)
+def context(rounds: int) -> CryptContext:
+    # hashes weaker than rounds need an update, stronger ones are kept: workers calibrated
+    # a round apart converge on the stronger hash instead of rehashing back and forth
+    return CryptContext(schemes=['bcrypt'], deprecated='auto',
+                        bcrypt__default_rounds=rounds, bcrypt__min_rounds=rounds)
+
+
+pwd_context = context(settings.bcrypt_rounds)
+
+
+def hash_password(password: str, rounds: int = settings.bcrypt_rounds) -> str:
+    return context(rounds).hash(password)
+
+
+def verify_password(plain_password: str, hashed_password: str) -> bool:
+    return pwd_context.verify(plain_password, hashed_password)
+
+
+def verify_and_update(plain_password: str, hashed_password: str,
+                      rounds: int = settings.bcrypt_rounds) -> Tuple[bool, Optional[str]]:
+    """
+    The verify_and_update function checks the password like verify_password does,
+    and when it matches a hash weaker than rounds, returns the password hashed again with rounds.
+
+    :param plain_password: str: The password entered by the user
+    :param hashed_password: str: The hash from the database
+    :param rounds: int: The current bcrypt work factor
+    :return: Whether the password matches, and the new hash or None
+    """
+    return context(rounds).verify_and_update(plain_password, hashed_password)
+
+
+def calibrate(target_ms: float, min_rounds: int, max_rounds: int) -> int:
+    """
+    The calibrate function returns the highest bcrypt work factor, within [min_rounds, max_rounds],
+    whose hash takes at most target_ms on this machine. Each round doubles the cost,
+    so one hash timed at min_rounds predicts the others.
+
+    :param target_ms: float: The verify latency to aim for, in milliseconds
+    :param min_rounds: int: The lowest work factor allowed, returned even when it is slower than the target
+    :param max_rounds: int: The highest work factor allowed
+    :return: The work factor
+    """
+    start = time.perf_counter()
+    hash_password('calibration', min_rounds)
+    elapsed_ms = (time.perf_counter() - start) * 1000
+    rounds = min_rounds
+    while rounds < max_rounds and elapsed_ms * 2 ** (rounds + 1 - min_rounds) <= target_ms:
+        rounds += 1
+    return rounds
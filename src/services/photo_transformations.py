@@ -1,14 +1,36 @@
-import cloudinary
+from typing import Any, Dict, List, Optional
 
-from src.conf.config import settings
+from redis.exceptions import RedisError
+
+from src.conf.logger import get_logger
 from src.schemas.photo_transformations import TransformationModel
+from src.services.executor import executor
+from src.services.jobs import job
+from src.services.storage import storage
+
+logger = get_logger(__name__)
 
 
 def build_transformed_url(public_id: str, transformation: TransformationModel) -> str:
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
-    return cloudinary.CloudinaryImage(public_id).build_url(transformation=transformation.preset)
+    return storage.transform_url(public_id, transformation.preset)
+
+
+@job('render_derivative')
+async def render_derivative(public_id: str, preset: List[Dict[str, Any]]) -> None:
+    await executor.run(storage.render_derivative, public_id, preset)
+
+
+async def schedule_render(public_id: str, transformation: TransformationModel) -> Optional[str]:
+    # cloudinary renders on the first fetch, only the local storage needs a worker
+    if not storage.renders_derivatives:
+        return None
+    try:
+        return await render_derivative.delay(public_id=public_id, preset=transformation.preset)
+    except RedisError as err:
+        # the transformation is saved already, render it here rather than fail the request
+        logger.warning(f'job queue unavailable, rendering {public_id} in the api: {err}')
+    try:
+        await render_derivative(public_id=public_id, preset=transformation.preset)
+    except Exception:
+        logger.exception(f'rendering {public_id} failed')
+    return None
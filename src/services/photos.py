@@ -1,30 +1,19 @@
-from uuid import uuid4
+from fastapi import HTTPException, UploadFile, status
+from fastapi.concurrency import run_in_threadpool
 
-from fastapi import UploadFile
-import cloudinary
-import cloudinary.uploader
-import cloudinary.api
+from src.conf import messages
+from src.services.storage import storage
 
-from src.conf.config import settings
 
-
-def upload_photo(file: UploadFile) -> tuple[str, str]:
+async def upload_photo(file: UploadFile) -> tuple[str, str]:
     """
-    The upload_avatar function takes in a file and name, uploads the file to cloudinary,
-    and returns the url of that image. The function is asynchronous because it uses await.
+    The upload_photo function stores the file in the configured storage backend in a worker thread,
+    so the event loop keeps serving other requests while the image is transferred.
 
     :param file: UploadFile: Get the file from the request
-    :param name: str: Give the image a unique name
-    :return: The url of the uploaded image
+    :return: The url of the uploaded image and its public_id
     """
-    cloudinary.config(
-        cloud_name=settings.cloudinary_name,
-        api_key=settings.cloudinary_api_key,
-        api_secret=settings.cloudinary_api_secret,
-        secure=True
-    )
-    public_id = uuid4().hex
-    cloudinary.uploader.upload(file.file, public_id=public_id, overwrite=True)
-    image_info = cloudinary.api.resource(public_id)
-    src_url = image_info['secure_url']
-    return src_url, public_id
+    try:
+        return await run_in_threadpool(storage.upload, file)
+    except ValueError:
+        raise HTTPException(status_code=status.HTTP_400_BAD_REQUEST, detail=messages.INVALID_IMAGE)
@@ -0,0 +1,40 @@
+import hashlib
+import io
+
+import qrcode
+
+from src.conf.config import settings
+from src.database.db import client_redis_bytes
+from src.services.cache import TieredCache
+from src.services.executor import executor
+
+# bump when the rendering below changes, it is part of the cache key and of the ETag
+QRCODE_VERSION = 'v1'
+
+qrcode_cache = TieredCache('qrcode', client_redis_bytes, settings.qrcode_cache_size, settings.qrcode_cache_ttl)
+
+
+def qrcode_key(url: str) -> str:
+    # the png is fully determined by the url, so its hash addresses the content
+    return hashlib.sha256(f'{QRCODE_VERSION}:{url}'.encode()).hexdigest()
+
+
+def qrcode_etag(url: str) -> str:
+    return f'"{qrcode_key(url)}"'
+
+
+def render_qrcode(url: str) -> bytes:
+    buffer = io.BytesIO()
+    qrcode.make(url).save(buffer)
+    return buffer.getvalue()
+
+
+async def get_qrcode(url: str) -> bytes:
+    """
+    The get_qrcode function returns the png of the QR code for the url,
+    from the cache when it was rendered before, otherwise rendered in the cpu executor and cached.
+
+    :param url: str: The url encoded in the QR code
+    :return: The png image
+    """
+    return await qrcode_cache.get_or_set(qrcode_key(url), lambda: executor.run(render_qrcode, url))
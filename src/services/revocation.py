@@ -0,0 +1,147 @@
+import asyncio
+import hashlib
+import math
+import time
+from typing import Dict, Optional, Set
+
+from redis.exceptions import RedisError
+
+from src.conf.config import settings
+from src.conf.logger import get_logger
+from src.database.db import client_redis
+from src.services.invalidation import InvalidationBus, bus
+
+logger = get_logger(__name__)
+
+
+class BloomFilter:
+    """Fixed size set of strings with false positives and no false negatives, membership costs `hashes` bit reads."""
+
+    def __init__(self, size: int, hashes: int):
+        self.size = size
+        self.hashes = hashes
+        self.bits = bytearray((size + 7) // 8)
+
+    def positions(self, key: str):
+        # double hashing: k positions from one 128 bit digest
+        digest = hashlib.blake2b(key.encode(), digest_size=16).digest()
+        h1, h2 = int.from_bytes(digest[:8], 'little'), int.from_bytes(digest[8:], 'little') | 1
+        return ((h1 + i * h2) % self.size for i in range(self.hashes))
+
+    def add(self, key: str) -> None:
+        for position in self.positions(key):
+            self.bits[position >> 3] |= 1 << (position & 7)
+
+    def __contains__(self, key: str) -> bool:
+        return all(self.bits[position >> 3] & (1 << (position & 7)) for position in self.positions(key))
+
+
+class RevocationList:
+    """
+    Revoked token ids (jti) live in Redis under revoked:{jti} until the token would have expired anyway.
+    Every worker keeps a Bloom filter of them, so a token that was never revoked is accepted without a Redis call;
+    only the filter's hits, real or false positives, are checked in Redis.
+    The filters learn new revocations through the invalidation bus and are rebuilt from Redis
+    every settings.revocation_sync_seconds, which also forgets the expired ones.
+    """
+    prefix = 'revoked'
+    topic = 'revoked'
+
+    def __init__(self, client, invalidation_bus: InvalidationBus):
+        self.client = client
+        self.bus = invalidation_bus
+        self.bloom = self.new_bloom()
+        self.synced = False
+        self.recent: Set[str] = set()
+        # revoked while redis was unavailable, jti -> exp, stored by the next sync
+        self.pending: Dict[str, float] = {}
+        self.sync_lock = asyncio.Lock()
+        self.sync_task: Optional[asyncio.Task] = None
+        invalidation_bus.subscribe(self.topic, self.on_message)
+
+    @staticmethod
+    def new_bloom() -> BloomFilter:
+        return BloomFilter(settings.revocation_bloom_size, settings.revocation_bloom_hashes)
+
+    def add(self, jti: str) -> None:
+        self.bloom.add(jti)
+        self.recent.add(jti)
+
+    def on_message(self, jti: Optional[str]) -> None:
+        if jti is not None:
+            self.add(jti)
+        else:
+            # the bus has missed messages, reload the filter unless a sync is on its way already
+            self.synced = False
+            if not self.sync_lock.locked() and (self.sync_task is None or self.sync_task.done()):
+                self.sync_task = asyncio.get_running_loop().create_task(self.try_sync())
+
+    async def revoke(self, jti: Optional[str], exp: Optional[float]) -> None:
+        """
+        The revoke method rejects the token from now on, in every worker.
+
+        :param jti: Optional[str]: The id of the token, tokens issued before ids were added can't be revoked
+        :param exp: Optional[float]: The expiry of the token, a unix timestamp
+        :return: None
+        """
+        if not jti or exp is None:
+            return
+        ttl = math.ceil(exp - time.time())
+        if ttl <= 0:
+            # expired already, rejected anyway
+            return
+        try:
+            await self.client.set(f'{self.prefix}:{jti}', 1, ex=ttl)
+        except RedisError as err:
+            # rejected by this worker at once, by the others once redis is back, see sync
+            logger.warning(f'revocation list unavailable, {jti} kept locally: {err}')
+            self.pending[jti] = exp
+        self.add(jti)
+        await self.bus.publish(self.topic, jti)
+
+    async def is_revoked(self, jti: Optional[str]) -> bool:
+        if not jti or (self.synced and jti not in self.bloom):
+            return False
+        # revoked through this worker or the bus since the last sync, redis down or not
+        if jti in self.recent or jti in self.pending:
+            return True
+        try:
+            return bool(await self.client.exists(f'{self.prefix}:{jti}'))
+        except RedisError as err:
+            # a hit of the synced filter fails closed, a worker that could not sync yet fails open
+            logger.warning(f'revocation list unavailable: {err}')
+            return self.synced
+
+    async def store_pending(self) -> None:
+        for jti, exp in list(self.pending.items()):
+            ttl = math.ceil(exp - time.time())
+            if ttl > 0:
+                await self.client.set(f'{self.prefix}:{jti}', 1, ex=ttl)
+            del self.pending[jti]
+
+    async def sync(self) -> None:
+        async with self.sync_lock:
+            await self.store_pending()
+            self.recent = set()
+            bloom = self.new_bloom()
+            async for key in self.client.scan_iter(match=f'{self.prefix}:*', count=1000):
+                bloom.add(key.split(':', 1)[1])
+            # revocations published while scanning may have been missed by the scan
+            for jti in self.recent:
+                bloom.add(jti)
+            self.bloom = bloom
+            self.synced = True
+
+    async def try_sync(self) -> None:
+        try:
+            await self.sync()
+        except RedisError as err:
+            logger.warning(f'revocation list sync failed: {err}')
+
+    async def sync_forever(self) -> None:
+        while True:
+            await self.try_sync()
+            await asyncio.sleep(settings.revocation_sync_seconds)
+
+
+revocations = RevocationList(client_redis, bus)
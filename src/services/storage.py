@@ -0,0 +1,157 @@
+import hashlib
+import json
+import os
+import shutil
+import tempfile
+from abc import ABC, abstractmethod
+from functools import lru_cache
+from pathlib import Path
+from typing import Any, Dict, List, Optional
+from uuid import uuid4
+
+from fastapi import UploadFile
+import cloudinary
+import cloudinary.uploader
+
+from src.conf.config import settings
+from src.services.image_engine import canonical_preset, image_suffix, output_format, preset_hash, render
+
+CHUNK_SIZE = 1024 * 1024
+DERIVED_DIR = 'derived'
+
+
+class StorageBackend(ABC):
+    """Where the original photos live and how their urls are built."""
+    renders_derivatives = False
+
+    @abstractmethod
+    def upload(self, file: UploadFile) -> tuple[str, str]:
+        """Stores the image and returns its url and public_id, ValueError if the file is not an image."""
+
+    @abstractmethod
+    def delete(self, public_id: str, unmodified_since: Optional[float] = None) -> bool:
+        """Removes the stored file, unless it was written again after unmodified_since, and tells if it did."""
+
+    @abstractmethod
+    def url(self, public_id: str) -> str:
+        """Returns the url of the stored file."""
+
+    @abstractmethod
+    def transform_url(self, public_id: str, preset: List[Dict[str, Any]]) -> str:
+        """Returns the url of the file with the transformation preset applied."""
+
+    def render_derivative(self, public_id: str, preset: List[Dict[str, Any]]) -> None:
+        """Stores the transformed copy, for the backends that do not transform on the fly."""
+
+
+@lru_cache(maxsize=settings.transformed_url_cache_size)
+def cloudinary_transformed_url(public_id: str, preset: str) -> str:
+    # preset is the canonical json of the preset, identical presets share one cache entry
+    return cloudinary.CloudinaryImage(public_id).build_url(transformation=json.loads(preset))
+
+
+class CloudinaryStorage(StorageBackend):
+    def __init__(self):
+        # configured once per process, the config is global to the cloudinary package
+        cloudinary.config(
+            cloud_name=settings.cloudinary_name,
+            api_key=settings.cloudinary_api_key,
+            api_secret=settings.cloudinary_api_secret,
+            secure=True
+        )
+
+    def upload(self, file: UploadFile) -> tuple[str, str]:
+        public_id = uuid4().hex
+        image_info = cloudinary.uploader.upload(file.file, public_id=public_id, overwrite=True)
+        # the upload response already carries the url, no need for a second api round trip
+        return image_info['secure_url'], public_id
+
+    def delete(self, public_id: str, unmodified_since: Optional[float] = None) -> bool:
+        # every upload gets a public_id of its own, nothing writes it again
+        cloudinary.uploader.destroy(public_id)
+        return True
+
+    def url(self, public_id: str) -> str:
+        return cloudinary.CloudinaryImage(public_id).build_url()
+
+    def transform_url(self, public_id: str, preset: List[Dict[str, Any]]) -> str:
+        return cloudinary_transformed_url(public_id, canonical_preset(preset))
+
+
+class LocalStorage(StorageBackend):
+    """
+    Keeps the originals on a local disk (or an NFS mount) under their sha256 digest,
+    so the same content is stored once. Transformed copies are rendered by src.services.image_engine
+    into derived/<original>/<preset hash>.<format> and reused from there.
+    The files are served by the static mount in main.py, the derivatives are rendered
+    by the render_derivative job, see src.services.photo_transformations.
+    """
+    renders_derivatives = True
+
+    def __init__(self, root: str, base_url: str):
+        self.root = Path(root)
+        self.base_url = base_url.rstrip('/')
+        self.root.mkdir(parents=True, exist_ok=True)
+
+    def upload(self, file: UploadFile) -> tuple[str, str]:
+        digest = hashlib.sha256()
+        tmp = tempfile.NamedTemporaryFile(dir=self.root, delete=False)
+        try:
+            with tmp:
+                while chunk := file.file.read(CHUNK_SIZE):
+                    digest.update(chunk)
+                    tmp.write(chunk)
+            # served from the api's own origin: images only, named by their detected format
+            public_id = f'{digest.hexdigest()}.{image_suffix(Path(tmp.name))}'
+            os.replace(tmp.name, self.root / public_id)
+        except BaseException:
+            os.unlink(tmp.name)
+            raise
+        return self.url(public_id), public_id
+
+    def delete(self, public_id: str, unmodified_since: Optional[float] = None) -> bool:
+        # content-addressed: every photo uploaded with the same content shares the file,
+        # callers delete it once nothing refers to it, see repository.photos.delete_unreferenced_file.
+        # The file is moved aside first, so an upload of the same content from now on writes a new one,
+        # and the moved file tells whether an upload wrote it again before that
+        path = self.root / public_id
+        doomed = path.with_name(f'.{uuid4().hex}.deleting')
+        try:
+            os.rename(path, doomed)
+        except FileNotFoundError:
+            return False
+        if unmodified_since is not None and doomed.stat().st_mtime > unmodified_since:
+            # its new photo may not be saved yet; the content is the same, putting it back is harmless
+            os.replace(doomed, path)
+            return False
+        doomed.unlink()
+        shutil.rmtree(self.root / DERIVED_DIR / path.stem, ignore_errors=True)
+        return True
+
+    def url(self, public_id: str) -> str:
+        return f'{self.base_url}/{public_id}'
+
+    def derivative_path(self, public_id: str, preset: List[Dict[str, Any]]) -> Path:
+        original = Path(public_id)
+        path = self.root / DERIVED_DIR / original.stem / f'{preset_hash(preset)}.{output_format(preset, original.suffix)}'
+        # the name is built from stored values, never let one of them lead out of the storage root
+        if not path.resolve().is_relative_to(self.root.resolve()):
+            raise ValueError(f'derivative path outside the storage root: {path}')
+        return path
+
+    def transform_url(self, public_id: str, preset: List[Dict[str, Any]]) -> str:
+        return self.url(self.derivative_path(public_id, preset).relative_to(self.root).as_posix())
+
+    def render_derivative(self, public_id: str, preset: List[Dict[str, Any]]) -> None:
+        derivative = self.derivative_path(public_id, preset)
+        if not derivative.exists():
+            render(self.root / public_id, preset, derivative)
+
+
+def create_storage() -> StorageBackend:
+    if settings.storage_backend == 'local':
+        return LocalStorage(settings.local_storage_path, settings.local_storage_url)
+    return CloudinaryStorage()
+
+
+storage = create_storage()
@@ -0,0 +1,84 @@
+import asyncio
+import time
+from typing import Any, Dict, List, Optional, Tuple
+
+from redis.exceptions import RedisError
+from starlette.concurrency import run_in_threadpool
+
+from src.conf.config import settings
+from src.conf.logger import get_logger
+from src.database.db import SessionLocal
+from src.database.models import Role
+from src.repository import photo_transformations as repository_transformations
+from src.repository import photos as repository_photos
+from src.repository.photo_filters import get_filter_preset_by_id
+from src.schemas.photo_transformations import BatchTransformationModel, TransformationModel
+from src.services import email as email_service
+from src.services.jobs import job
+from src.services.photo_transformations import schedule_render
+
+# importing the module registers its render_derivative job as well
+import src.services.photo_transformations  # noqa: F401
+
+logger = get_logger(__name__)
+
+
+@job('send_email')
+async def send_email(email: str, username: str, host: str) -> None:
+    await email_service.send_email(email, username, host)
+
+
+async def _transformations_batch(data: BatchTransformationModel, user_id: int, user_role: Role,
+                                 db) -> Tuple[int, List[int], List[str], list]:
+    created, transformations = await repository_transformations.create_transformations_batch(
+        data, user_id, user_role, db, render=False)
+    photos = await repository_transformations.get_photos_owners([row.photo_id for row in transformations], db)
+    preset = await get_filter_preset_by_id(data.filter_id, db)
+    return created, [row.id for row in transformations], [public_id for _, _, public_id in photos], preset
+
+
+def _run_transformations_batch(data: BatchTransformationModel, user_id: int,
+                               user_role: Role) -> Tuple[int, List[int], List[str], list]:
+    # the sync session blocks, so the batch runs in a thread, on an event loop of its own
+    with SessionLocal() as db:
+        return asyncio.run(_transformations_batch(data, user_id, user_role, db))
+
+
+@job('create_transformations_batch', max_retries=1)
+async def create_transformations_batch(data: Dict[str, Any], user_id: int, user_role: str) -> Dict[str, Any]:
+    created, transformation_ids, public_ids, preset = await run_in_threadpool(
+        _run_transformations_batch, BatchTransformationModel(**data), user_id, Role(user_role))
+    # renders are queued from the worker's loop, the async redis client belongs to it.
+    # Rendering skips the derivatives that exist already, so the photos done before cost little
+    transformation = TransformationModel(preset=preset)
+    for public_id in public_ids:
+        await schedule_render(public_id, transformation)
+    return {'created': created, 'transformation_ids': transformation_ids}
+
+
+def _delete_unreferenced_file(public_id: str, deleted_at: float) -> bool:
+    with SessionLocal() as db:
+        return asyncio.run(repository_photos.delete_unreferenced_file(public_id, db, deleted_at))
+
+
+@job('delete_file')
+async def delete_file(public_id: str, deleted_at: float) -> bool:
+    return await run_in_threadpool(_delete_unreferenced_file, public_id, deleted_at)
+
+
+async def schedule_delete_file(public_id: str) -> Optional[str]:
+    """
+    The schedule_delete_file function queues the removal of the stored file of a deleted photo.
+    The job runs settings.storage_delete_delay seconds later, once the uploads of the same content
+    in flight meanwhile have saved their photos, and checks again that nothing refers to the file.
+    Best effort: the photo is gone already, a file left behind only costs disk space.
+
+    :param public_id: str: The public_id of the file in the storage backend
+    :return: The id of the job, None if it could not be queued
+    """
+    try:
+        return await delete_file.delay(countdown=settings.storage_delete_delay,
+                                       public_id=public_id, deleted_at=time.time())
+    except RedisError as err:
+        logger.warning(f'file {public_id} left in storage, the job queue is unavailable: {err}')
+        return None
@@ -0,0 +1,53 @@
+import json
+from dataclasses import dataclass
+from datetime import date, datetime
+from typing import Optional
+
+from src.database.models import Role, User
+
+# bump when the fields below change, older entries are then simply not found
+USER_CACHE_VERSION = 2
+
+
+def user_cache_key(email: str) -> str:
+    return f'user:v{USER_CACHE_VERSION}:{email}'
+
+
+@dataclass(frozen=True, slots=True)
+class CachedUser:
+    """
+    The fields of the current user the routes read, kept by the user cache in place of the ORM instance.
+    Immutable, so one instance is safely shared by all the requests of a worker.
+    """
+    id: int
+    email: str
+    username: str
+    first_name: Optional[str]
+    roles: Role
+    active: bool
+    confirmed: bool
+    avatar: Optional[str]
+    birthday: Optional[date]
+    created_at: Optional[datetime]
+    updated_at: Optional[datetime]
+
+    @classmethod
+    def from_user(cls, user: User) -> 'CachedUser':
+        return cls(user.id, user.email, user.username, user.first_name, user.roles, user.active, user.confirmed,
+                   user.avatar, user.birthday, user.created_at, user.updated_at)
+
+    def dumps(self) -> str:
+        # a positional json array: no field names, no instance state
+        return json.dumps([self.id, self.email, self.username, self.first_name, self.roles.value, self.active,
+                           self.confirmed, self.avatar, self.birthday and self.birthday.isoformat(),
+                           self.created_at and self.created_at.isoformat(),
+                           self.updated_at and self.updated_at.isoformat()], separators=(',', ':'))
+
+    @classmethod
+    def loads(cls, raw: str) -> 'CachedUser':
+        (id_, email, username, first_name, roles, active, confirmed, avatar,
+         birthday, created_at, updated_at) = json.loads(raw)
+        return cls(id_, email, username, first_name, Role(roles), active, confirmed, avatar,
+                   birthday and date.fromisoformat(birthday),
+                   created_at and datetime.fromisoformat(created_at),
+                   updated_at and datetime.fromisoformat(updated_at))
@@ -0,0 +1,22 @@
+"""
+Job worker, run as many of them as needed next to the api:
+
+    python -m src.services.worker
+
+Each process runs settings.job_worker_concurrency jobs at a time from the Redis queue.
+"""
+import asyncio
+
+import src.services.tasks  # noqa: F401  registers the jobs
+from src.conf.logger import get_logger
+from src.services.jobs import queue
+
+logger = get_logger(__name__)
+
+
+if __name__ == '__main__':
+    logger.info('job worker started')
+    try:
+        asyncio.run(queue.work())
+    except KeyboardInterrupt:
+        logger.info('job worker stopped')
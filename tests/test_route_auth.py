@@ -1,5 +1,5 @@
 # from jose import jwt
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
 from src.database.models import User
 from src.conf import messages
@@ -7,7 +7,7 @@ from src.services.auth import auth_service
 
 
 def test_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
+    mock_send_email = MagicMock(delay=AsyncMock())
     monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
     response = client.post("/api/auth/signup", json=user)
     assert response.status_code == 201, response.text
@@ -17,7 +17,7 @@ def test_create_user(client, user, monkeypatch):
 
 
 def test_repeat_create_user(client, user, monkeypatch):
-    mock_send_email = MagicMock()
+    mock_send_email = MagicMock(delay=AsyncMock())
     monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
     response = client.post("/api/auth/signup", json=user)
     assert response.status_code == 409, response.text
@@ -34,7 +34,7 @@ def test_login_user_not_confirmed_email(client, user):
 
 
 def test_request_email_user_not_verified(client, user, session, monkeypatch):
-    mock_send_email = MagicMock()
+    mock_send_email = MagicMock(delay=AsyncMock())
     monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
     current_user: User = session.query(User).filter(
         User.email == user.get('email')).first()
@@ -57,7 +57,7 @@ def test_confirmed_email_user_none(client, user, session):
     
 
 def test_confirmed_email_user_verified(client, user, session, monkeypatch):
-    mock_send_email = MagicMock()
+    mock_send_email = MagicMock(delay=AsyncMock())
     monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
     current_user: User = session.query(User).filter(User.email == user.get("email")).first()
     current_user.confirmed = False
@@ -113,7 +113,7 @@ def test_login_user_with_wrong_email(client, user, session):
 
 
 def test_request_email_user_confirmed(client, user, session, monkeypatch):
-    mock_send_email = MagicMock()
+    mock_send_email = MagicMock(delay=AsyncMock())
     monkeypatch.setattr("src.routes.auth.send_email", mock_send_email)
     current_user: User = session.query(User).filter(
         User.email == user.get('email')).first()
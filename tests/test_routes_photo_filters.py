@@ -1,4 +1,4 @@
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
 import pytest
 
@@ -33,9 +33,9 @@ def get_current_user(user, session):
 
 @pytest.fixture()
 def token(client, session, user, monkeypatch):
-    monkeypatch.setattr("src.routes.auth.send_email", MagicMock())
-    monkeypatch.setattr("src.services.auth.auth_service.redis_cache.get", MagicMock(return_value=None))
-    monkeypatch.setattr("src.services.auth.auth_service.redis_cache.set", MagicMock())
+    monkeypatch.setattr("src.routes.auth.send_email", MagicMock(delay=AsyncMock()))
+    monkeypatch.setattr("src.services.auth.auth_service.redis_cache.get", AsyncMock(return_value=None))
+    monkeypatch.setattr("src.services.auth.auth_service.redis_cache.set", AsyncMock())
 
     client.post("api/auth/signup", json=user)
     current_user = get_current_user(user, session)
@@ -0,0 +1,80 @@
+import unittest
+from unittest.mock import MagicMock, patch
+
+from sqlalchemy import create_engine, text
+from sqlalchemy.exc import OperationalError
+from sqlalchemy.orm import Session
+from starlette.requests import Request
+
+from src.database import db as database
+from src.database.db import TimedQueuePool, pool_metrics, mark_recent_write, wrote_recently, get_read_db
+
+
+def make_request(token: str = None) -> Request:
+    headers = [(b'authorization', f'Bearer {token}'.encode())] if token else []
+    return Request({'type': 'http', 'headers': headers})
+
+
+class TestPoolMetrics(unittest.TestCase):
+    def setUp(self):
+        self.engine = create_engine('sqlite://', poolclass=TimedQueuePool, pool_size=2, max_overflow=1)
+
+    def tearDown(self):
+        self.engine.dispose()
+
+    def test_pool_metrics_idle(self):
+        result = pool_metrics(self.engine)
+        self.assertEqual(result['checked_out'], 0)
+        self.assertEqual(result['wait_count'], 0)
+        self.assertEqual(result['wait_avg_ms'], 0)
+
+    def test_pool_metrics_checked_out(self):
+        with self.engine.connect() as connection:
+            connection.execute(text('SELECT 1'))
+            result = pool_metrics(self.engine)
+            self.assertEqual(result['size'], 2)
+            self.assertEqual(result['checked_out'], 1)
+            self.assertEqual(result['wait_count'], 1)
+        self.assertEqual(pool_metrics(self.engine)['checked_out'], 0)
+
+
+class TestReadDb(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        database.recent_writers.clear()
+        database.replica_down_until = 0.0
+        self.primary = MagicMock(spec=Session)
+        self.replica = MagicMock(spec=Session)
+
+    async def read_session(self, request: Request):
+        with patch.object(database, 'SessionLocal', MagicMock(return_value=self.primary)), \
+                patch.object(database, 'ReadSessionLocal', MagicMock(return_value=self.replica)):
+            generator = get_read_db(request)
+            db = await generator.__anext__()
+            await generator.aclose()
+        return db
+
+    def test_wrote_recently(self):
+        mark_recent_write(make_request('writer'))
+        self.assertTrue(wrote_recently(make_request('writer')))
+        self.assertFalse(wrote_recently(make_request('reader')))
+        self.assertFalse(wrote_recently(make_request()))
+
+    async def test_read_db_uses_replica(self):
+        db = await self.read_session(make_request('reader'))
+        self.assertIs(db, self.replica)
+
+    async def test_read_db_after_own_write_uses_primary(self):
+        mark_recent_write(make_request('writer'))
+        db = await self.read_session(make_request('writer'))
+        self.assertIs(db, self.primary)
+
+    async def test_read_db_replica_down_falls_back(self):
+        self.replica.connection.side_effect = OperationalError('SELECT 1', {}, Exception('down'))
+        db = await self.read_session(make_request('reader'))
+        self.assertIs(db, self.primary)
+        self.replica.close.assert_called_once()
+        self.assertGreater(database.replica_down_until, 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
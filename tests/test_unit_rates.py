@@ -1,6 +1,7 @@
 import unittest
 from unittest.mock import MagicMock
 
+from sqlalchemy.dialects import postgresql
 from sqlalchemy.orm import Session
 
 from src.database.models import Rate, User, Photo
@@ -10,10 +11,17 @@ from src.repository.rates import (
     get_rate_photo_by_user,
     get_rating_by_photo_id,
     get_detail_rating_by_photo,
-    remove_rating
+    remove_rating,
+    refresh_photo_rating
 )
 
 
+def written_values(update_mock) -> dict:
+    values = update_mock.call_args.args[0]
+    return {key: str(value.compile(dialect=postgresql.dialect(), compile_kwargs={'literal_binds': True}))
+            for key, value in values.items()}
+
+
 class TestRate(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         self.session = MagicMock(spec=Session)
@@ -26,6 +34,13 @@ class TestRate(unittest.IsolatedAsyncioTestCase):
         result = await add_rate(body=body, user=self.user, db=self.session)
         self.assertEqual(result.photo_id, body.photo_id)
         self.assertEqual(result.rate, body.rate)
+        self.session.query().filter().update.assert_called_once()
+        values = written_values(self.session.query().filter().update)
+        self.assertEqual(values['rate_count'], 'photos.rate_count + 1')
+        self.assertEqual(values['rate_sum'], 'photos.rate_sum + 4')
+        self.assertEqual(values['avg_rating'],
+                         'CASE WHEN (photos.rate_count + 1 > 0) '
+                         'THEN CAST(photos.rate_sum + 4 AS FLOAT) / CAST((photos.rate_count + 1) AS NUMERIC) END')
 
     async def test_get_rate_photo_by_user(self):
         rate = Rate(photo_id=1, user_id=1, rate=5)
@@ -42,12 +57,30 @@ class TestRate(unittest.IsolatedAsyncioTestCase):
 
     async def test_get_detail_rating_by_photo(self):
         rates = [Rate(), Rate(), Rate(), Rate(), Rate()]
-        self.session.query().filter().all.return_value = rates
+        self.session.execute().scalars().all.return_value = rates
         result = await get_detail_rating_by_photo(1, self.session)
         self.assertEqual(result, rates)
 
     #
     async def test_remove_rating(self):
+        self.session.query().filter().scalar.return_value = 3
         self.session.query().filter().delete.return_value = 1
         result = await remove_rating(1, 1, self.session)
         self.assertEqual(result, 1)
+        values = written_values(self.session.query().filter().update)
+        self.assertEqual(values['rate_count'], 'photos.rate_count + -1')
+        self.assertEqual(values['rate_sum'], 'photos.rate_sum + -3')
+        self.assertEqual(values['avg_rating'],
+                         'CASE WHEN (photos.rate_count + -1 > 0) '
+                         'THEN CAST(photos.rate_sum + -3 AS FLOAT) / CAST((photos.rate_count + -1) AS NUMERIC) END')
+
+    async def test_remove_rating_not_found(self):
+        self.session.query().filter().delete.return_value = 0
+        result = await remove_rating(1, 1, self.session)
+        self.assertEqual(result, 0)
+        self.session.query().filter().update.assert_not_called()
+
+    async def test_refresh_photo_rating_all_photos(self):
+        self.session.query().update.return_value = 3
+        result = await refresh_photo_rating(self.session)
+        self.assertEqual(result, 3)
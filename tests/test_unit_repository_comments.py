@@ -35,7 +35,7 @@ class TestComment(unittest.IsolatedAsyncioTestCase):
 
     async def test_get_comments_by_photo(self):
         comments = [Comment(), Comment(), Comment()]
-        self.session.query().filter().all.return_value = comments
+        self.session.execute().scalars().all.return_value = comments
         result = await get_comments_by_photo(1, self.session)
         self.assertEqual(result, comments)
 
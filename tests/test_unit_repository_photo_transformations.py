@@ -3,11 +3,13 @@ from unittest.mock import MagicMock, patch
 
 from fastapi import HTTPException
 
+from sqlalchemy.exc import IntegrityError
 from sqlalchemy.orm import Session
 from sqlalchemy.orm.exc import NoResultFound
 
 from src.database.models import PhotoTransformation, Role
-from src.schemas.photo_transformations import PhotoTransformationModel, NewDescTransformationModel, TransformationModel
+from src.schemas.photo_transformations import (
+    PhotoTransformationModel, NewDescTransformationModel, TransformationModel, BatchTransformationModel)
 
 from src.repository.photo_transformations import (
     get_transformation_by_id,
@@ -18,8 +20,12 @@ from src.repository.photo_transformations import (
     create_transformation_from_preset,
     create_transformation,
     change_description,
-    remove_transformation
+    remove_transformation,
+    save_transformation,
+    create_transformations_batch,
+    get_filter_transformation
 )
+from src.services.image_engine import preset_hash
 
 
 class TestContactsRepository(unittest.IsolatedAsyncioTestCase):
@@ -140,6 +146,12 @@ class TestContactsRepository(unittest.IsolatedAsyncioTestCase):
                                                          user_role=Role.user, db=self.session)
         self.assertTrue(hasattr(result, 'id'))
 
+    @patch('src.repository.photo_transformations.get_filter_preset_by_id', return_value=[{"fetch_format": "svg"}])
+    async def test_get_filter_transformation_invalid(self, _):
+        with self.assertRaises(HTTPException) as context:
+            await get_filter_transformation(1, self.session)
+        self.assertEqual(context.exception.status_code, 400)
+
     @patch('src.repository.photo_transformations.advanced_rights_check', return_value=None)
     @patch('src.repository.photo_transformations.get_photo_public_id', return_value="public_id")
     @patch('src.repository.photo_transformations.build_transformed_url', return_value="transformed_url")
@@ -182,6 +194,77 @@ class TestContactsRepository(unittest.IsolatedAsyncioTestCase):
                                         db=self.session)
         self.assertTrue(context.exception)
 
+    @patch('src.repository.photo_transformations.get_transformation_by_preset', return_value=None)
+    @patch('src.repository.photo_transformations.get_photo_public_id', return_value="public_id")
+    @patch('src.repository.photo_transformations.build_transformed_url', return_value="transformed_url")
+    async def test_save_transformation_new(self, *_):
+        result = await save_transformation(photo_id=1, transformation=self.transformation_model,
+                                           description='description', db=self.session)
+        self.assertEqual(result.preset_hash, preset_hash(self.preset))
+        self.assertEqual(result.transformed_url, "transformed_url")
+        self.session.add.assert_called_once_with(result)
+
+    @patch('src.repository.photo_transformations.get_photo_public_id')
+    @patch('src.repository.photo_transformations.build_transformed_url')
+    async def test_save_transformation_existing(self, build_mock, public_id_mock):
+        existing = PhotoTransformation(id=5, photo_id=1, preset_hash=preset_hash(self.preset))
+        self.session.query().filter_by().first.return_value = existing
+        result = await save_transformation(photo_id=1, transformation=self.transformation_model,
+                                           description='description', db=self.session)
+        self.assertIs(result, existing)
+        build_mock.assert_not_called()
+        public_id_mock.assert_not_called()
+        self.session.add.assert_not_called()
+
+    @patch('src.repository.photo_transformations.get_photos_owners',
+           return_value=[(1, 1, 'public_1'), (2, 1, 'public_2'), (3, 1, 'public_3')])
+    @patch('src.repository.photo_transformations.get_filter_preset_by_id', return_value=[{"radius": "max"}])
+    @patch('src.repository.photo_transformations.build_transformed_url', return_value="transformed_url")
+    @patch('src.repository.photo_transformations.get_transformations_by_preset')
+    async def test_create_transformations_batch(self, by_preset_mock, build_mock, *_):
+        by_preset_mock.side_effect = [[PhotoTransformation(photo_id=2)], self.transformations]
+        data = BatchTransformationModel(filter_id=1, photo_ids=[1, 2, 3, 1], description='description')
+        created, result = await create_transformations_batch(data, user_id=1, user_role=Role.user, db=self.session)
+        self.assertEqual(created, 2)
+        self.assertEqual(result, self.transformations)
+        self.assertEqual(build_mock.call_count, 2)
+        added = self.session.add_all.call_args.args[0]
+        self.assertEqual([row.photo_id for row in added], [1, 3])
+        self.session.commit.assert_called_once()
+
+    @patch('src.repository.photo_transformations.schedule_render')
+    @patch('src.repository.photo_transformations.get_photo_public_id', return_value="public_id")
+    @patch('src.repository.photo_transformations.get_photos_owners',
+           return_value=[(1, 1, 'public_1'), (2, 1, 'public_2'), (3, 1, 'public_3')])
+    @patch('src.repository.photo_transformations.get_filter_preset_by_id', return_value=[{"radius": "max"}])
+    @patch('src.repository.photo_transformations.build_transformed_url', return_value="transformed_url")
+    @patch('src.repository.photo_transformations.get_transformations_by_preset')
+    async def test_create_transformations_batch_concurrent(self, by_preset_mock, *_):
+        by_preset_mock.side_effect = [[], self.transformations]
+        conflict = IntegrityError('INSERT', {}, Exception('duplicate key'))
+        # the batch conflicts, then photo 2 turns out to be inserted by the other request
+        self.session.commit.side_effect = [conflict, None, conflict, None]
+        data = BatchTransformationModel(filter_id=1, photo_ids=[1, 2, 3])
+        created, result = await create_transformations_batch(data, user_id=1, user_role=Role.user, db=self.session)
+        self.assertEqual(created, 2)
+        self.assertEqual(result, self.transformations)
+
+    @patch('src.repository.photo_transformations.get_photos_owners',
+           return_value=[(1, 1, 'public_1'), (2, 2, 'public_2')])
+    async def test_create_transformations_batch_forbidden(self, _):
+        data = BatchTransformationModel(filter_id=1, photo_ids=[1, 2])
+        with self.assertRaises(HTTPException) as context:
+            await create_transformations_batch(data, user_id=1, user_role=Role.user, db=self.session)
+        self.assertEqual(context.exception.status_code, 403)
+        self.session.add_all.assert_not_called()
+
+    @patch('src.repository.photo_transformations.get_photos_owners', return_value=[(1, 1, 'public_1')])
+    async def test_create_transformations_batch_not_found(self, _):
+        data = BatchTransformationModel(filter_id=1, photo_ids=[1, 2])
+        with self.assertRaises(HTTPException) as context:
+            await create_transformations_batch(data, user_id=1, user_role=Role.user, db=self.session)
+        self.assertEqual(context.exception.status_code, 404)
+
     @patch('src.repository.photo_transformations.get_transformation_by_id', return_value=PhotoTransformation())
     @patch('src.repository.photo_transformations.advanced_rights_check', return_value=None)
     async def test_change_description(self, *_):
@@ -1,22 +1,32 @@
 import base64
 import io
 import unittest
+from datetime import date, datetime
+from fastapi import HTTPException
 from fastapi.responses import Response
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock, patch
 from sqlalchemy.orm import Session
 from src.database.models import Photo, User, Role
 from src.schemas.photos import PhotoResponse
 from src.repository import tags as repository_tags
 import qrcode as qrcode
+from src.services.qr_codes import qrcode_etag
 from src.repository.photos import (
     add_photo,
     get_photos,
     get_photo_by_id,
     #get_photo_by_id_oper,
     delete_photo,
+    delete_unreferenced_file,
     generate_qrcode,
     update_tags_descriptions_for_photo,
     untach_tag,
+    foto_response_create,
+    encode_cursor,
+    decode_cursor,
+    next_cursor,
+    filter_for_photo_query,
+    PhotoFilteringOptions,
 )
 
 
@@ -41,6 +51,19 @@ class TestPhotos(unittest.IsolatedAsyncioTestCase):
                                     user=self.user)
         self.assertEqual(result, photo)
 
+    @patch('src.repository.photos.storage')
+    async def test_delete_unreferenced_file(self, storage_mock):
+        self.session.query().filter().first.return_value = None
+        self.assertTrue(await delete_unreferenced_file(self.photo_test.cloud_public_id, self.session))
+        storage_mock.delete.assert_called_once_with(self.photo_test.cloud_public_id, None)
+
+    @patch('src.repository.photos.storage')
+    async def test_delete_shared_file_kept(self, storage_mock):
+        # another photo with the same content still uses the file
+        self.session.query().filter().first.return_value = (2,)
+        self.assertFalse(await delete_unreferenced_file(self.photo_test.cloud_public_id, self.session))
+        storage_mock.delete.assert_not_called()
+
     async def test_delete_photo_not_found(self):
         self.session.query().filter().first.return_value = None
         result = await delete_photo(photo_id=self.photo_test.id, db=self.session, user=self.user)
@@ -134,10 +157,22 @@ class TestPhotos(unittest.IsolatedAsyncioTestCase):
         buffer = io.BytesIO()
         img.save(buffer)
         #qr_base64 = base64.b64encode(buffer.getvalue()).decode('utf-8')
-        result = await generate_qrcode(photo_url=self.photo_test.url_photo)
+        with patch('src.services.qr_codes.qrcode_cache.client', AsyncMock(get=AsyncMock(return_value=None))):
+            result = await generate_qrcode(photo_url=self.photo_test.url_photo)
         self.assertIsInstance(result, Response)
+        self.assertEqual(result.body, buffer.getvalue())
+        self.assertEqual(result.headers['etag'], qrcode_etag(self.photo_test.url_photo))
+        self.assertIn('max-age', result.headers['cache-control'])
         #self.assertEqual(result["qrcode_encode"], qr_base64)
 
+    @patch('src.repository.photos.get_qrcode')
+    async def test_generate_qrcode_not_modified(self, get_qrcode_mock):
+        etag = qrcode_etag(self.photo_test.url_photo)
+        result = await generate_qrcode(photo_url=self.photo_test.url_photo, if_none_match=f'"other", {etag}')
+        self.assertEqual(result.status_code, 304)
+        self.assertEqual(result.headers['etag'], etag)
+        get_qrcode_mock.assert_not_called()
+
 
     async def test_untach_tag(self):
         photo = Photo(
@@ -171,9 +206,10 @@ class TestPhotos(unittest.IsolatedAsyncioTestCase):
             self.photo_test.id,
             self.photo_test.url_photo,
             self.photo_test.description,
+            None,
             None
         )]
-        self.session.query().outerjoin().group_by().limit().offset().all.return_value = photos
+        self.session.execute().all.side_effect = [photos, []]
         result = await get_photos(user_id=None,
                                   cur_user_id=None,
                                   cur_user_role=Role.user,
@@ -192,6 +228,61 @@ class TestPhotos(unittest.IsolatedAsyncioTestCase):
         self.assertEqual(result[0].description, self.photo_test.description)
         self.assertIsNone(result[0].rating)
 
+    async def test_foto_response_create_batches_tags(self):
+        photos = [(1, self.photo_test.url_photo, 'first', 4.0, None),
+                  (2, self.photo_test.url_photo, 'second', None, None)]
+        self.session.execute().all.return_value = [(1, 10, '#sky'), (1, 11, '#sea')]
+        self.session.execute.reset_mock()
+        result = await foto_response_create(photos, self.session)
+        self.session.execute.assert_called_once()
+        self.assertEqual([tag.tag_name for tag in result[0].tags], ['#sky', '#sea'])
+        self.assertEqual(result[1].tags, [])
+
+    async def test_cursor_round_trip(self):
+        created_at = datetime(2023, 5, 20, 12, 43, 27)
+        self.assertEqual(decode_cursor(encode_cursor(created_at, 7)), (created_at, 7))
+        self.assertEqual(decode_cursor(encode_cursor(None, 3)), (None, 3))
+
+    async def test_decode_cursor_invalid(self):
+        with self.assertRaises(HTTPException) as context:
+            decode_cursor('not-a-cursor')
+        self.assertEqual(context.exception.status_code, 400)
+
+    async def test_next_cursor(self):
+        page = [PhotoResponse(id=5, url_photo=self.photo_test.url_photo, created_at=datetime(2023, 5, 20)),
+                PhotoResponse(id=4, url_photo=self.photo_test.url_photo, created_at=datetime(2023, 5, 19))]
+        self.assertEqual(decode_cursor(next_cursor(page, limit=2)), (datetime(2023, 5, 19), 4))
+        self.assertIsNone(next_cursor(page, limit=10))
+
+    async def test_get_photos_with_cursor(self):
+        photos = [(3, self.photo_test.url_photo, self.photo_test.description, None, None)]
+        self.session.execute().all.side_effect = [photos, []]
+        self.session.execute.reset_mock()
+        result = await get_photos(user_id=None,
+                                  cur_user_id=None,
+                                  cur_user_role=Role.user,
+                                  tag_name=None,
+                                  rate_min=None,
+                                  rate_max=None,
+                                  created_at_min=None,
+                                  created_at_max=None,
+                                  limit=10,
+                                  offset=20,
+                                  db=self.session,
+                                  cursor=encode_cursor(datetime(2023, 5, 20), 4))
+        self.assertEqual(result[0].id, 3)
+        statement = self.session.execute.call_args_list[0].args[0]
+        self.assertIn('photos.id <', str(statement))
+        self.assertNotIn('OFFSET', str(statement))
+
+    async def test_filter_for_photo_query_created_at_range(self):
+        query = Session().query(Photo.id)
+        options = PhotoFilteringOptions(user_id=None, created_at_min=date(2023, 5, 1), created_at_max=date(2023, 5, 31))
+        result = await filter_for_photo_query(query, options)
+        params = result.statement.compile().params
+        self.assertNotIn('DATE(', str(result.statement))
+        self.assertEqual(sorted(params.values()), [datetime(2023, 5, 1), datetime(2023, 6, 1)])
+
 
 if __name__ == '__main__':
     unittest.main()
@@ -1,6 +1,7 @@
 import unittest
-from unittest.mock import MagicMock
+from unittest.mock import AsyncMock, MagicMock
 
+from sqlalchemy.ext.asyncio import AsyncSession
 from sqlalchemy.orm import Session
 from fastapi.exceptions import HTTPException
 
@@ -23,10 +24,19 @@ class TestTag(unittest.IsolatedAsyncioTestCase):
 
     async def test_get_tags(self):
         tags = [Tag(), Tag(), Tag()]
-        self.session.query().all.return_value = tags
+        self.session.execute().scalars().all.return_value = tags
         result = await get_tags(db=self.session)
         self.assertEqual(result, tags)
 
+    async def test_get_tags_async_session(self):
+        tags = [Tag(), Tag()]
+        session = AsyncMock(spec=AsyncSession)
+        session.execute.return_value = MagicMock()
+        session.execute.return_value.scalars().all.return_value = tags
+        result = await get_tags(db=session)
+        self.assertEqual(result, tags)
+        session.execute.assert_awaited_once()
+
     def test_handler_tags(self):
         result = handler_tags("test1")
         self.assertEqual(result, ["#test1"])
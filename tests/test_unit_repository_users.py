@@ -1,5 +1,5 @@
 import unittest
-from unittest.mock import MagicMock, AsyncMock
+from unittest.mock import MagicMock, AsyncMock, patch
 
 from sqlalchemy.orm import Session
 
@@ -12,10 +12,13 @@ from src.schemas.users import UserModel, UserUpdateModel
 class TestUser(unittest.IsolatedAsyncioTestCase):
     def setUp(self):
         self.session = MagicMock(spec=Session)
+        patcher = patch.object(auth_service, 'invalidate_user', AsyncMock())
+        self.invalidate_user = patcher.start()
+        self.addCleanup(patcher.stop)
 
     async def test_get_users(self):
         users = [User(), User(), User()]
-        self.session.query().filter().limit().offset().all.return_value = users
+        self.session.execute().scalars().all.return_value = users
         result = await repository_users.get_users(dict_values={"first_name": "a"}, limit=0, offset=0, db=self.session)
         self.assertIsInstance(result, list)
         self.assertEqual(result, users)
@@ -64,6 +67,7 @@ class TestUser(unittest.IsolatedAsyncioTestCase):
         result = await repository_users.update_avatar(email=email, url=url, db=self.session)
         self.assertEqual(result.id, user.id)
         self.assertEqual(result.avatar, url)
+        self.invalidate_user.assert_awaited_once_with(email)
 
     async def test_quantity_photo_by_users(self):
         user = User()
@@ -87,6 +91,17 @@ class TestUser(unittest.IsolatedAsyncioTestCase):
         result = await repository_users.update_user(body=body, user_id=user.id, user=user, db=self.session)
         self.assertEqual(result, user)
 
+    async def test_update_user_keeps_password(self):
+        body = UserUpdateModel(first_name="first_name", username="username", email="email")
+        user = User(id=1)
+        self.session.query().filter().first.return_value = user
+        self.session.query().filter().update.return_value = 1
+        with patch.object(auth_service, 'get_password_hash', AsyncMock()) as hash_mock:
+            result = await repository_users.update_user(body=body, user_id=user.id, user=user, db=self.session)
+        self.assertEqual(result, user)
+        hash_mock.assert_not_called()
+        self.assertNotIn('password', self.session.query().filter().update.call_args.args[0])
+
     async def test_update_user_None(self):
         body = UserUpdateModel(
             first_name="first_name",
@@ -103,22 +118,25 @@ class TestUser(unittest.IsolatedAsyncioTestCase):
     async def test_block_token(self):
         token = "token"
         user = User(id=1, refresh_token=token)
-        repository_users.auth.auth_service.verify_access_token = MagicMock()
-        # repository_users.auth.auth_service.get_exp_by_access_token = MagicMock(return_value=1)
-        repository_users.client_redis = AsyncMock()
-        auth_service.redis_cache = AsyncMock()
+        for patcher in (patch.object(auth_service, 'revoke_access_token', AsyncMock()),
+                        patch.object(auth_service, 'redis_cache', AsyncMock())):
+            patcher.start()
+            self.addCleanup(patcher.stop)
         self.session.query().filter().first.return_value = user
         result = await repository_users.block_token(token=token, db=self.session)
+        auth_service.revoke_access_token.assert_awaited_once_with(token)
         self.assertIsNone(user.refresh_token)
         self.assertIsNone(result)
 
     async def test_ban_user(self):
         user = User(id=1, refresh_token="token", active=True)
-        # repository_users.client_redis = MagicMock()
-        auth_service.redis_cache = AsyncMock()
+        patcher = patch.object(auth_service, 'redis_cache', AsyncMock())
+        patcher.start()
+        self.addCleanup(patcher.stop)
         self.session.query().filter_by().first.return_value = user
         result = await repository_users.ban_user(user_id=user.id, db=self.session)
         self.assertEqual(result.id, user.id)
         self.assertFalse(user.active)
         self.assertEqual(result, user)
         self.assertIsNone(user.refresh_token)
+        self.invalidate_user.assert_awaited_once()
@@ -0,0 +1,206 @@
+import time
+import unittest
+from datetime import date, datetime
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import Depends, FastAPI, HTTPException
+from fastapi.testclient import TestClient
+from jose import JWTError, jwt
+from redis.exceptions import ConnectionError
+from sqlalchemy.orm import Session
+
+from src.conf import messages
+from src.conf.config import settings
+from src.database.db import get_db
+from src.database.models import Role, User
+from src.services.auth import auth_service
+from src.services.invalidation import MemoryInvalidationBus
+from src.services.revocation import RevocationList
+from src.services.roles import RoleAccess
+from src.services.user_cache import CachedUser, user_cache_key
+
+
+def patch_revocations(test: unittest.TestCase) -> RevocationList:
+    revocations = RevocationList(AsyncMock(), MemoryInvalidationBus())
+    revocations.synced = True
+    patcher = patch('src.services.auth.revocations', revocations)
+    patcher.start()
+    test.addCleanup(patcher.stop)
+    return revocations
+
+
+class TestGetCurrentUser(unittest.IsolatedAsyncioTestCase):
+    async def asyncSetUp(self):
+        self.session = MagicMock(spec=Session)
+        self.user = User(id=1, email='user@example.com', username='username', roles=Role.user, active=True,
+                         confirmed=True)
+        self.token = await auth_service.create_access_token(data={'sub': self.user.email})
+        self.redis = AsyncMock()
+        patcher = patch.object(auth_service, 'redis_cache', self.redis)
+        patcher.start()
+        self.addCleanup(patcher.stop)
+        auth_service.local_cache.clear()
+        self.addCleanup(auth_service.local_cache.clear)
+        patcher = patch('src.services.auth.bus', MemoryInvalidationBus())
+        patcher.start().subscribe('user', auth_service.evict_local_user)
+        self.addCleanup(patcher.stop)
+        self.revocations = patch_revocations(self)
+
+    @patch('src.services.auth.repository_users.get_user_by_email')
+    async def test_cache_miss(self, get_user_mock):
+        self.redis.get.return_value = None
+        get_user_mock.return_value = self.user
+        result = await auth_service.get_current_user(self.token, self.session)
+        self.assertEqual(result, CachedUser.from_user(self.user))
+        self.redis.set.assert_awaited_once()
+        self.assertEqual(self.redis.set.call_args.kwargs, {'ex': settings.user_cache_ttl})
+        self.redis.expire.assert_not_called()
+
+    @patch('src.services.auth.repository_users.get_user_by_email')
+    async def test_cache_hit(self, get_user_mock):
+        self.redis.get.return_value = CachedUser.from_user(self.user).dumps()
+        result = await auth_service.get_current_user(self.token, self.session)
+        self.assertEqual(result, CachedUser.from_user(self.user))
+        self.redis.get.assert_awaited_once_with(user_cache_key(self.user.email))
+        get_user_mock.assert_not_called()
+
+    @patch('src.services.auth.repository_users.get_user_by_email')
+    async def test_redis_down(self, get_user_mock):
+        self.redis.get.side_effect = ConnectionError
+        self.redis.set.side_effect = ConnectionError
+        get_user_mock.return_value = self.user
+        result = await auth_service.get_current_user(self.token, self.session)
+        self.assertEqual(result.id, self.user.id)
+
+    @patch('src.services.auth.repository_users.get_user_by_email')
+    async def test_local_hit(self, get_user_mock):
+        self.redis.get.return_value = None
+        get_user_mock.return_value = self.user
+        await auth_service.get_current_user(self.token, self.session)
+        result = await auth_service.get_current_user(self.token, self.session)
+        self.assertIs(result, await auth_service.get_current_user(self.token, self.session))
+        self.redis.get.assert_awaited_once()
+        get_user_mock.assert_awaited_once()
+
+    @patch('src.services.auth.repository_users.get_user_by_email')
+    async def test_invalidate_user(self, get_user_mock):
+        self.redis.get.return_value = None
+        get_user_mock.return_value = self.user
+        await auth_service.get_current_user(self.token, self.session)
+        await auth_service.invalidate_user(self.user.email)
+        self.redis.delete.assert_awaited_once_with(user_cache_key(self.user.email))
+        await auth_service.get_current_user(self.token, self.session)
+        self.assertEqual(get_user_mock.await_count, 2)
+
+    @patch('src.services.auth.repository_users.get_user_by_email', return_value=None)
+    async def test_unknown_user(self, _):
+        self.redis.get.return_value = None
+        with self.assertRaises(HTTPException) as context:
+            await auth_service.get_current_user(self.token, self.session)
+        self.assertEqual(context.exception.status_code, 401)
+
+
+    @patch('src.services.auth.repository_users.get_user_by_email')
+    async def test_revoked_token(self, get_user_mock):
+        self.redis.get.return_value = None
+        get_user_mock.return_value = self.user
+        await auth_service.get_current_user(self.token, self.session)
+        self.revocations.client.exists.assert_not_called()
+        await auth_service.revoke_access_token(self.token)
+        self.revocations.client.exists.return_value = 1
+        with self.assertRaises(HTTPException) as context:
+            await auth_service.get_current_user(self.token, self.session)
+        self.assertEqual(context.exception.detail, messages.TOKEN_REVOKED)
+        other_token = await auth_service.create_access_token(data={'sub': self.user.email})
+        self.assertEqual((await auth_service.get_current_user(other_token, self.session)).id, self.user.id)
+
+    @patch('src.services.auth.repository_users.get_user_by_email')
+    async def test_inactive_user(self, get_user_mock):
+        self.redis.get.return_value = None
+        self.user.active = False
+        get_user_mock.return_value = self.user
+        with self.assertRaises(HTTPException) as context:
+            await auth_service.get_current_user(self.token, self.session)
+        self.assertEqual(context.exception.status_code, 401)
+        self.assertEqual(context.exception.detail, messages.FORBIDDEN)
+
+
+class TestDecodeToken(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        auth_service.token_cache.clear()
+        self.addCleanup(auth_service.token_cache.clear)
+
+    async def test_verified_once(self):
+        token = await auth_service.create_access_token(data={'sub': 'user@example.com'})
+        with patch('src.services.auth.jwt.decode', wraps=jwt.decode) as decode_mock:
+            self.assertEqual(auth_service.verify_access_token(token), 'user@example.com')
+            self.assertEqual(auth_service.verify_access_token(token), 'user@example.com')
+        decode_mock.assert_called_once()
+
+    async def test_expired_entry_is_verified_again(self):
+        token = await auth_service.create_access_token(data={'sub': 'user@example.com'}, expires_delta=60)
+        auth_service.decode_token(token)
+        with patch('src.services.auth.time.time', return_value=time.time() + 120), \
+                patch('src.services.auth.jwt.decode', side_effect=JWTError) as decode_mock:
+            with self.assertRaises(JWTError):
+                auth_service.decode_token(token)
+        decode_mock.assert_called_once()
+
+    async def test_invalid_token_not_cached(self):
+        with self.assertRaises(HTTPException):
+            auth_service.verify_access_token('not a token')
+        self.assertEqual(len(auth_service.token_cache), 0)
+
+    async def test_unique_jti(self):
+        first = await auth_service.create_access_token(data={'sub': 'user@example.com'})
+        second = await auth_service.create_access_token(data={'sub': 'user@example.com'})
+        self.assertNotEqual(auth_service.decode_token(first).jti, auth_service.decode_token(second).jti)
+
+    async def test_refresh_token_rejected(self):
+        token = await auth_service.create_refresh_token(data={'sub': 'user@example.com'})
+        with self.assertRaises(HTTPException) as context:
+            auth_service.verify_access_token(token)
+        self.assertEqual(context.exception.status_code, 401)
+
+
+class TestCurrentUserPerRequest(unittest.IsolatedAsyncioTestCase):
+    @patch('src.services.auth.repository_users.get_user_by_email')
+    async def test_resolved_once(self, get_user_mock):
+        get_user_mock.return_value = User(id=1, email='user@example.com', username='username', roles=Role.user,
+                                          active=True, confirmed=True)
+        app = FastAPI()
+        app.dependency_overrides[get_db] = lambda: MagicMock(spec=Session)
+
+        @app.get('/', dependencies=[Depends(RoleAccess([Role.user]))])
+        async def route(user: User = Depends(auth_service.get_current_user)):
+            return {'id': user.id}
+
+        token = await auth_service.create_access_token(data={'sub': 'user@example.com'})
+        auth_service.local_cache.clear()
+        self.addCleanup(auth_service.local_cache.clear)
+        patch_revocations(self)
+        with patch.object(auth_service, 'redis_cache', AsyncMock(get=AsyncMock(return_value=None))), \
+                patch.object(auth_service, 'access_claims', wraps=auth_service.access_claims) as verify:
+            response = TestClient(app).get('/', headers={'Authorization': f'Bearer {token}'})
+        self.assertEqual(response.json(), {'id': 1})
+        verify.assert_called_once()
+        get_user_mock.assert_awaited_once()
+
+
+class TestCachedUser(unittest.TestCase):
+    def test_round_trip(self):
+        user = User(id=1, email='user@example.com', username='username', first_name='First', roles=Role.admin,
+                    active=True, confirmed=False, avatar=None, birthday=date(2000, 1, 2),
+                    created_at=datetime(2023, 5, 1, 10, 30), updated_at=None)
+        cached = CachedUser.from_user(user)
+        self.assertEqual(CachedUser.loads(cached.dumps()), cached)
+        self.assertIs(CachedUser.loads(cached.dumps()).roles, Role.admin)
+
+    def test_immutable(self):
+        cached = CachedUser(1, 'e', 'u', None, Role.user, True, True, None, None, None, None)
+        with self.assertRaises(AttributeError):
+            cached.roles = Role.admin
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,83 @@
+import unittest
+from unittest.mock import AsyncMock, patch
+
+from redis.exceptions import ConnectionError
+
+from src.services.cache import LRUCache, TieredCache
+from src.services.executor import CPUExecutor
+from src.services.qr_codes import get_qrcode, qrcode_key, render_qrcode
+
+
+class TestLRUCache(unittest.TestCase):
+    def test_evicts_least_recently_used(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.set('b', 2)
+        cache.get('a')
+        cache.set('c', 3)
+        self.assertEqual((cache.get('a'), cache.get('b'), cache.get('c')), (1, None, 3))
+        self.assertEqual(len(cache), 2)
+
+    @patch('src.services.cache.time.monotonic')
+    def test_expires(self, monotonic_mock):
+        monotonic_mock.return_value = 100
+        cache = LRUCache(maxsize=2, ttl=10)
+        cache.set('a', 1)
+        monotonic_mock.return_value = 110
+        self.assertEqual(cache.get('a', 'missing'), 'missing')
+        self.assertEqual(len(cache), 0)
+
+    def test_delete(self):
+        cache = LRUCache(maxsize=2, ttl=60)
+        cache.set('a', 1)
+        cache.delete('a')
+        cache.delete('a')
+        self.assertIsNone(cache.get('a'))
+
+
+class TestTieredCache(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = AsyncMock()
+        self.cache = TieredCache('test', self.client, maxsize=8, ttl=60)
+
+    async def test_redis_hit_is_kept_locally(self):
+        self.client.get.return_value = b'png'
+        self.assertEqual(await self.cache.get('key'), b'png')
+        self.assertEqual(await self.cache.get('key'), b'png')
+        self.client.get.assert_awaited_once_with('test:key')
+
+    async def test_get_or_set(self):
+        self.client.get.return_value = None
+        factory = AsyncMock(return_value=b'png')
+        self.assertEqual(await self.cache.get_or_set('key', factory), b'png')
+        self.assertEqual(await self.cache.get_or_set('key', factory), b'png')
+        factory.assert_awaited_once()
+        self.client.set.assert_awaited_once_with('test:key', b'png', ex=60)
+
+    async def test_redis_down(self):
+        self.client.get.side_effect = ConnectionError
+        self.client.set.side_effect = ConnectionError
+        self.assertEqual(await self.cache.get_or_set('key', AsyncMock(return_value=b'png')), b'png')
+        self.assertEqual(await self.cache.get('key'), b'png')
+
+
+class TestQRCodes(unittest.IsolatedAsyncioTestCase):
+    def test_render(self):
+        self.assertTrue(render_qrcode('https://example.com/photo.png').startswith(b'\x89PNG'))
+
+    def test_key_depends_on_url(self):
+        self.assertEqual(qrcode_key('https://a'), qrcode_key('https://a'))
+        self.assertNotEqual(qrcode_key('https://a'), qrcode_key('https://b'))
+
+    @patch('src.services.qr_codes.executor', CPUExecutor('thread', 1))
+    @patch('src.services.qr_codes.render_qrcode', return_value=b'png')
+    async def test_get_qrcode_cached(self, render_mock):
+        cache = TieredCache('qrcode', AsyncMock(get=AsyncMock(return_value=None)), maxsize=8, ttl=60)
+        with patch('src.services.qr_codes.qrcode_cache', cache):
+            await get_qrcode('https://example.com')
+            self.assertEqual(await get_qrcode('https://example.com'), b'png')
+        render_mock.assert_called_once_with('https://example.com')
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,41 @@
+import asyncio
+import unittest
+
+from src.services.executor import CPUExecutor
+from src.services.passwords import hash_password, verify_password
+
+
+def slow_square(x: int) -> int:
+    return x * x
+
+
+class TestCPUExecutor(unittest.IsolatedAsyncioTestCase):
+    def tearDown(self):
+        self.executor.shutdown()
+
+    async def test_thread_pool(self):
+        self.executor = CPUExecutor('thread', 2)
+        results = await asyncio.gather(*(self.executor.run(slow_square, x) for x in range(5)))
+        self.assertEqual(results, [0, 1, 4, 9, 16])
+        metrics = self.executor.metrics()
+        self.assertEqual((metrics['in_flight'], metrics['completed'], metrics['max_in_flight']), (0, 5, 5))
+
+    async def test_process_pool(self):
+        self.executor = CPUExecutor('process', 1)
+        hashed = await self.executor.run(hash_password, 'password')
+        self.assertTrue(await self.executor.run(verify_password, 'password', hashed))
+        self.assertFalse(await self.executor.run(verify_password, 'wrong', hashed))
+
+    async def test_default_size(self):
+        self.executor = CPUExecutor('thread', 0)
+        self.assertGreaterEqual(self.executor.metrics()['workers'], 1)
+
+    async def test_error_is_raised(self):
+        self.executor = CPUExecutor('thread', 1)
+        with self.assertRaises(ZeroDivisionError):
+            await self.executor.run(divmod, 1, 0)
+        self.assertEqual(self.executor.metrics()['in_flight'], 0)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import unittest
+from unittest.mock import patch
+
+from PIL import Image
+from pydantic import ValidationError
+
+from src.schemas.photo_filters import PhotoFilterModel
+from src.schemas.photo_transformations import TransformationModel
+from src.services.image_engine import apply_preset, output_format, preset_hash, validate_preset
+
+
+class TestImageEngine(unittest.TestCase):
+    def setUp(self):
+        self.img = Image.new('RGB', (800, 600), 'red')
+
+    def test_preset_hash_canonical(self):
+        self.assertEqual(preset_hash([{'width': 200, 'crop': 'scale'}]),
+                         preset_hash([{'crop': 'scale', 'width': 200}]))
+        self.assertNotEqual(preset_hash([{'width': 200}]), preset_hash([{'width': 201}]))
+
+    def test_output_format(self):
+        self.assertEqual(output_format([{'width': 200}], '.jpg'), 'jpg')
+        self.assertEqual(output_format([{'fetch_format': 'auto'}], '.jpg'), 'webp')
+        self.assertEqual(output_format([{'format': 'png'}], ''), 'png')
+        self.assertEqual(output_format([{'width': 200}], '.html'), 'png')
+        with self.assertRaises(ValueError):
+            output_format([{'fetch_format': 'png/../../../../escaped'}], '.jpg')
+
+    def test_validate_preset(self):
+        preset = [{'width': 0.5, 'height': 400, 'crop': 'fill'}, {'radius': 'max'}, {'radius': 20},
+                  {'fetch_format': 'AUTO'}, {'format': 'jpg'}, {'effect': 'sepia'}]
+        self.assertEqual(validate_preset(preset), preset)
+        for step in ({'fetch_format': 'png/../../../../escaped'}, {'format': 'html'}, {'fetch_format': 1},
+                     {'width': 100000}, {'height': 0}, {'width': '200'}, {'width': True},
+                     {'radius': '20:30'}, {'radius': -1}, {'radius': 2.5}):
+            with self.subTest(step=step), self.assertRaises(ValueError):
+                validate_preset([step])
+
+    def test_bad_presets_rejected_by_schemas(self):
+        bad = [{'width': 100000, 'height': 100000, 'crop': 'scale'}]
+        with self.assertRaises(ValidationError):
+            TransformationModel(preset=bad)
+        with self.assertRaises(ValidationError):
+            PhotoFilterModel(name='filter', preset=bad)
+
+    @patch('src.services.image_engine.settings.image_max_dimension', 1000)
+    def test_output_size_capped(self):
+        tall = Image.new('RGB', (10, 400), 'red')
+        self.assertEqual(apply_preset(tall, [{'width': 100, 'crop': 'scale'}]).size, (25, 1000))
+        self.assertEqual(apply_preset(self.img, [{'width': 5000, 'height': 5000, 'crop': 'fill'}]).size,
+                         (1000, 1000))
+
+    def test_scale(self):
+        result = apply_preset(self.img, [{'width': 200, 'crop': 'scale'}])
+        self.assertEqual(result.size, (200, 150))
+
+    def test_crop_and_fill(self):
+        self.assertEqual(apply_preset(self.img, [{'width': 400, 'height': 400, 'crop': 'crop'}]).size, (400, 400))
+        self.assertEqual(apply_preset(self.img, [{'width': 100, 'height': 50, 'crop': 'fill'}]).size, (100, 50))
+
+    def test_fit_and_limit(self):
+        self.assertEqual(apply_preset(self.img, [{'width': 1600, 'height': 1600, 'crop': 'fit'}]).size, (1600, 1200))
+        self.assertEqual(apply_preset(self.img, [{'width': 1600, 'height': 1600, 'crop': 'limit'}]).size, (800, 600))
+
+    def test_radius_max(self):
+        result = apply_preset(self.img, [{'width': 200, 'height': 200, 'crop': 'fill'}, {'radius': 'max'}])
+        self.assertEqual(result.mode, 'RGBA')
+        self.assertEqual(result.getpixel((0, 0))[3], 0)
+        self.assertEqual(result.getpixel((100, 100))[3], 255)
+
+    def test_unknown_keys_ignored(self):
+        result = apply_preset(self.img, [{'effect': 'sepia'}])
+        self.assertEqual(result.size, self.img.size)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,77 @@
+import asyncio
+import json
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+
+from redis.exceptions import ConnectionError
+
+from src.services.invalidation import CHANNEL, MemoryInvalidationBus, RedisInvalidationBus
+
+
+class TestMemoryInvalidationBus(unittest.IsolatedAsyncioTestCase):
+    async def test_publish(self):
+        bus = MemoryInvalidationBus()
+        handler = MagicMock()
+        bus.subscribe('user', handler)
+        await bus.publish('user', 'user@example.com')
+        await bus.publish('tag', 'other')
+        handler.assert_called_once_with('user@example.com')
+
+    async def test_failing_handler_does_not_stop_others(self):
+        bus = MemoryInvalidationBus()
+        handler = MagicMock()
+        bus.subscribe('user', MagicMock(side_effect=KeyError))
+        bus.subscribe('user', handler)
+        await bus.publish('user', 'user@example.com')
+        handler.assert_called_once_with('user@example.com')
+
+
+class TestRedisInvalidationBus(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = AsyncMock()
+        self.bus = RedisInvalidationBus(self.client)
+        self.handler = MagicMock()
+        self.bus.subscribe('user', self.handler)
+
+    async def test_publish(self):
+        await self.bus.publish('user', 'user@example.com')
+        self.handler.assert_called_once_with('user@example.com')
+        channel, data = self.client.publish.call_args.args
+        self.assertEqual(channel, CHANNEL)
+        self.assertEqual(json.loads(data), {'origin': self.bus.origin, 'topic': 'user', 'key': 'user@example.com'})
+
+    async def test_publish_redis_down(self):
+        self.client.publish.side_effect = ConnectionError
+        await self.bus.publish('user', 'user@example.com')
+        self.handler.assert_called_once_with('user@example.com')
+
+    def test_receive_from_other_worker(self):
+        self.bus.receive(json.dumps({'origin': 'other', 'topic': 'user', 'key': 'user@example.com'}))
+        self.handler.assert_called_once_with('user@example.com')
+
+    def test_receive_own_message(self):
+        self.bus.receive(json.dumps({'origin': self.bus.origin, 'topic': 'user', 'key': 'user@example.com'}))
+        self.handler.assert_not_called()
+
+    def test_dispatch_all(self):
+        self.bus.dispatch_all()
+        self.handler.assert_called_once_with(None)
+
+    async def test_bad_message_does_not_stop_listener(self):
+        async def listen():
+            yield {'type': 'subscribe', 'data': 1}
+            yield {'type': 'message', 'data': 'not json'}
+            yield {'type': 'message', 'data': json.dumps({'origin': 'other'})}
+            yield {'type': 'message', 'data': json.dumps({'origin': 'other', 'topic': 'user', 'key': 'a@b.com'})}
+            raise asyncio.CancelledError
+
+        pubsub = MagicMock(subscribe=AsyncMock(), listen=listen)
+        self.client.pubsub = MagicMock()
+        self.client.pubsub.return_value.__aenter__.return_value = pubsub
+        with self.assertLogs('src.services.invalidation', 'ERROR'), self.assertRaises(asyncio.CancelledError):
+            await self.bus.listen()
+        self.assertEqual([call.args[0] for call in self.handler.call_args_list], [None, 'a@b.com'])
+
+
+if __name__ == '__main__':
+    unittest.main()
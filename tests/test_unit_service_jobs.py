@@ -0,0 +1,236 @@
+import asyncio
+import threading
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from redis.exceptions import ConnectionError as RedisConnectionError
+
+from fastapi import BackgroundTasks
+
+from src.database.models import PhotoTransformation
+from src.routes.auth import queue_confirmation_email
+from src.services import tasks
+from src.services.jobs import DONE, FAILED, QUEUED, JobRecord, MemoryJobQueue, RedisJobQueue, job, registry
+from src.services.photo_transformations import schedule_render
+from src.schemas.photo_transformations import TransformationModel
+
+
+async def scan(*keys):
+    for key in keys:
+        yield key
+
+
+@job('test_add')
+async def add(a: int, b: int) -> int:
+    return a + b
+
+
+@job('test_multiply')
+def multiply(a: int, b: int) -> int:
+    return a * b
+
+
+@job('test_broken', max_retries=2)
+def broken() -> None:
+    raise ConnectionError('smtp is down')
+
+
+class TestMemoryJobQueue(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.queue = MemoryJobQueue()
+
+    async def test_run_async_job(self):
+        job_id = await self.queue.enqueue('test_add', {'a': 2, 'b': 3}, owner_id=1)
+        self.assertEqual((await self.queue.get(job_id)).status, QUEUED)
+        record = await self.queue.run_next(timeout=0.1)
+        self.assertEqual(record.id, job_id)
+        stored = await self.queue.get(job_id)
+        self.assertEqual((stored.status, stored.result, stored.owner_id, stored.attempts), (DONE, 5, 1, 1))
+        self.assertIsNotNone(stored.finished_at)
+
+    async def test_run_sync_job(self):
+        job_id = await self.queue.enqueue('test_multiply', {'a': 2, 'b': 3})
+        await self.queue.run_next(timeout=0.1)
+        self.assertEqual((await self.queue.get(job_id)).result, 6)
+
+    @patch('src.services.jobs.settings.job_retry_delay', 0)
+    async def test_retries_then_fails(self):
+        job_id = await self.queue.enqueue('test_broken', {}, max_retries=registry['test_broken'].max_retries)
+        for _ in range(2):
+            record = await self.queue.run_next(timeout=0.1)
+            self.assertEqual(record.status, QUEUED)
+        record = await self.queue.run_next(timeout=0.1)
+        self.assertEqual((record.status, record.attempts), (FAILED, 3))
+        self.assertIn('smtp is down', (await self.queue.get(job_id)).error)
+        self.assertIsNone(await self.queue.run_next(timeout=0.1))
+
+    async def test_unknown_job(self):
+        job_id = await self.queue.enqueue('test_missing', {})
+        await self.queue.run_next(timeout=0.1)
+        self.assertEqual((await self.queue.get(job_id)).status, FAILED)
+
+    async def test_delay(self):
+        with patch('src.services.jobs.queue', self.queue):
+            job_id = await add.delay(owner_id=7, a=1, b=1)
+        record = await self.queue.get(job_id)
+        self.assertEqual((record.name, record.kwargs, record.owner_id), ('test_add', {'a': 1, 'b': 1}, 7))
+
+    async def test_countdown(self):
+        with patch('src.services.jobs.queue', self.queue):
+            await add.delay(countdown=0.05, a=1, b=1)
+        self.assertIsNone(await self.queue.run_next(timeout=0.01))
+        self.assertEqual((await self.queue.run_next(timeout=1)).result, 2)
+
+    async def test_pop_timeout(self):
+        self.assertIsNone(await self.queue.pop(timeout=0.01))
+
+
+class TestRedisJobQueue(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.client = AsyncMock()
+        self.queue = RedisJobQueue(self.client)
+
+    async def test_save_and_get(self):
+        record = JobRecord(id='abc', name='test_add', kwargs={'a': 1, 'b': 2})
+        await self.queue.save(record)
+        key, raw = self.client.set.call_args.args
+        self.assertEqual(key, 'job:abc')
+        self.client.get.return_value = raw
+        self.assertEqual(await self.queue.get('abc'), record)
+
+    async def test_push_delayed(self):
+        await self.queue.push('abc', delay=10)
+        self.client.zadd.assert_awaited_once()
+        self.client.lpush.assert_not_awaited()
+
+    async def test_pop_promotes_due_retries(self):
+        self.client.zrangebyscore.return_value = ['late']
+        self.client.zrem.return_value = 1
+        self.client.blmove.return_value = 'late'
+        self.assertEqual(await self.queue.pop(timeout=1), 'late')
+        self.client.lpush.assert_awaited_once_with('jobs:queue', 'late')
+
+    async def test_pop_empty(self):
+        self.client.zrangebyscore.return_value = []
+        self.client.blmove.return_value = None
+        self.assertIsNone(await self.queue.pop(timeout=1))
+
+    async def test_taken_until_acknowledged(self):
+        self.client.zrangebyscore.return_value = []
+        self.client.blmove.return_value = 'abc'
+        self.client.get.return_value = JobRecord(id='abc', name='test_add', kwargs={'a': 1, 'b': 2}).dumps()
+        record = await self.queue.run_next()
+        self.assertEqual((record.status, record.result), (DONE, 3))
+        self.client.blmove.assert_awaited_once_with('jobs:queue', self.queue.processing_key, 1, 'RIGHT', 'LEFT')
+        self.client.lrem.assert_awaited_once_with(self.queue.processing_key, 1, 'abc')
+
+    async def test_interrupted_job_not_acknowledged(self):
+        self.client.zrangebyscore.return_value = []
+        self.client.blmove.return_value = 'abc'
+        self.client.get.return_value = JobRecord(id='abc', name='test_add', kwargs={'a': 1, 'b': 2}).dumps()
+        with patch.object(self.queue, 'run', AsyncMock(side_effect=asyncio.CancelledError)), \
+                self.assertRaises(asyncio.CancelledError):
+            await self.queue.run_next()
+        self.client.lrem.assert_not_awaited()
+
+    async def test_lost_jobs_requeued(self):
+        self.client.scan_iter = MagicMock(return_value=scan(self.queue.processing_key, 'jobs:processing:alive',
+                                                            'jobs:processing:lost'))
+        self.client.exists.side_effect = lambda key: key == 'jobs:worker:alive'
+        self.client.lmove.side_effect = ['a', 'b', None]
+        with self.assertLogs('src.services.jobs', 'WARNING'):
+            await self.queue.heartbeat()
+        self.assertEqual(self.client.set.call_args.args, (f'jobs:worker:{self.queue.worker_id}', 1))
+        self.assertEqual({call.args[0] for call in self.client.lmove.await_args_list}, {'jobs:processing:lost'})
+        self.assertEqual(self.client.lmove.await_count, 3)
+
+    async def test_lost_job_without_retries_failed(self):
+        record = JobRecord(id='abc', name='test_add', kwargs={'a': 1, 'b': 2}, status='running', attempts=1)
+        record = await self.queue.run(record)
+        self.assertEqual((record.status, record.error, record.result), (FAILED, 'worker lost', None))
+
+
+class TestScheduleRender(unittest.IsolatedAsyncioTestCase):
+    transformation = TransformationModel(preset=[{'radius': 'max'}])
+
+    @patch('src.services.photo_transformations.render_derivative')
+    @patch('src.services.photo_transformations.storage', MagicMock(renders_derivatives=False))
+    async def test_not_needed(self, render_mock):
+        self.assertIsNone(await schedule_render('abc', self.transformation))
+        render_mock.delay.assert_not_called()
+
+    @patch('src.services.photo_transformations.render_derivative', MagicMock(delay=AsyncMock(return_value='id')))
+    @patch('src.services.photo_transformations.storage', MagicMock(renders_derivatives=True))
+    async def test_queued(self):
+        self.assertEqual(await schedule_render('abc', self.transformation), 'id')
+
+    @patch('src.services.photo_transformations.render_derivative', new_callable=AsyncMock)
+    @patch('src.services.photo_transformations.storage', MagicMock(renders_derivatives=True))
+    async def test_rendered_inline_without_queue(self, render_mock):
+        render_mock.delay = AsyncMock(side_effect=RedisConnectionError)
+        with self.assertLogs('src.services.photo_transformations', 'WARNING'):
+            self.assertIsNone(await schedule_render('abc', TransformationModel(preset=[{'radius': 'max'}])))
+        render_mock.assert_awaited_once_with(public_id='abc', preset=[{'radius': 'max'}])
+
+
+class TestConfirmationEmail(unittest.IsolatedAsyncioTestCase):
+    @patch('src.routes.auth.send_email', MagicMock(delay=AsyncMock(return_value='id')))
+    async def test_queued(self):
+        background_tasks = BackgroundTasks()
+        await queue_confirmation_email(background_tasks, 'user@example.com', 'user', 'http://host/')
+        self.assertEqual(background_tasks.tasks, [])
+
+    @patch('src.routes.auth.send_email', MagicMock(delay=AsyncMock(side_effect=RedisConnectionError)))
+    async def test_sent_from_the_api_without_queue(self):
+        background_tasks = BackgroundTasks()
+        with self.assertLogs('src.routes.auth', 'WARNING'):
+            await queue_confirmation_email(background_tasks, 'user@example.com', 'user', 'http://host/')
+        self.assertEqual(background_tasks.tasks[0].args, ('user@example.com', 'user', 'http://host/'))
+
+
+class TestTransformationsBatchJob(unittest.IsolatedAsyncioTestCase):
+    @patch('src.services.tasks.schedule_render', new_callable=AsyncMock)
+    @patch('src.services.tasks.get_filter_preset_by_id', new_callable=AsyncMock)
+    @patch('src.services.tasks.repository_transformations')
+    @patch('src.services.tasks.SessionLocal')
+    async def test_database_work_off_the_loop(self, _, repository_mock, preset_mock, render_mock):
+        threads = []
+
+        async def create_batch(*args, **kwargs):
+            threads.append(threading.current_thread())
+            return 1, [PhotoTransformation(id=10, photo_id=1), PhotoTransformation(id=11, photo_id=2)]
+
+        repository_mock.create_transformations_batch.side_effect = create_batch
+        repository_mock.get_photos_owners = AsyncMock(return_value=[(1, 1, 'a'), (2, 1, 'b')])
+        preset_mock.return_value = [{'width': 100}]
+        result = await tasks.create_transformations_batch(data={'filter_id': 1, 'photo_ids': [1, 2]},
+                                                          user_id=1, user_role='user')
+        self.assertEqual(result, {'created': 1, 'transformation_ids': [10, 11]})
+        self.assertIsNot(threads[0], threading.current_thread())
+        self.assertFalse(repository_mock.create_transformations_batch.call_args.kwargs['render'])
+        self.assertEqual([call.args[0] for call in render_mock.await_args_list], ['a', 'b'])
+
+
+class TestDeleteFileJob(unittest.IsolatedAsyncioTestCase):
+    @patch('src.services.tasks.delete_file', MagicMock(delay=AsyncMock(return_value='id')))
+    @patch('src.services.tasks.settings.storage_delete_delay', 600)
+    async def test_scheduled_later(self):
+        self.assertEqual(await tasks.schedule_delete_file('abc.png'), 'id')
+        kwargs = tasks.delete_file.delay.call_args.kwargs
+        self.assertEqual((kwargs['countdown'], kwargs['public_id']), (600, 'abc.png'))
+
+    @patch('src.services.tasks.delete_file', MagicMock(delay=AsyncMock(side_effect=RedisConnectionError)))
+    async def test_queue_down(self):
+        with self.assertLogs('src.services.tasks', 'WARNING'):
+            self.assertIsNone(await tasks.schedule_delete_file('abc.png'))
+
+    @patch('src.services.tasks.repository_photos')
+    @patch('src.services.tasks.SessionLocal')
+    async def test_checked_again_in_the_job(self, _, repository_mock):
+        repository_mock.delete_unreferenced_file = AsyncMock(return_value=True)
+        self.assertTrue(await tasks.delete_file(public_id='abc.png', deleted_at=100.0))
+        self.assertEqual(repository_mock.delete_unreferenced_file.call_args.args[::2], ('abc.png', 100.0))
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,176 @@
+import unittest
+from unittest.mock import AsyncMock, MagicMock, patch
+
+from fastapi import Depends, FastAPI, Response
+from fastapi.testclient import TestClient
+from fastapi_limiter.depends import RateLimiter
+
+from src.conf.constants import RATE_LIMITS
+from src.database.models import Role
+from src.services.auth import auth_service
+from src.services.limiter import (LocalLimiter, LocalRateLimiter, UserRateLimit, local_limiter, rate_limiter,
+                                  rate_limit_headers_middleware)
+from src.services.user_cache import CachedUser
+
+
+class TestLocalLimiter(unittest.TestCase):
+    def setUp(self):
+        self.limiter = LocalLimiter(2)
+        patcher = patch('src.services.limiter.time.monotonic', return_value=100.0)
+        self.clock = patcher.start()
+        self.addCleanup(patcher.stop)
+
+    def test_burst_then_wait(self):
+        self.assertEqual(self.limiter.acquire('key', 2, 1), 0)
+        self.assertEqual(self.limiter.acquire('key', 2, 1), 0)
+        self.assertAlmostEqual(self.limiter.acquire('key', 2, 1), 1)
+        self.clock.return_value = 100.5
+        self.assertAlmostEqual(self.limiter.acquire('key', 2, 1), 0.5)
+        self.clock.return_value = 101
+        self.assertEqual(self.limiter.acquire('key', 2, 1), 0)
+
+    def test_keys_are_independent(self):
+        self.assertEqual(self.limiter.acquire('a', 1, 1), 0)
+        self.assertEqual(self.limiter.acquire('b', 1, 1), 0)
+        self.assertGreater(self.limiter.acquire('a', 1, 1), 0)
+
+    def test_refill_capped(self):
+        self.limiter.acquire('key', 2, 1)
+        self.clock.return_value = 1000
+        self.limiter.acquire('key', 2, 1)
+        self.assertEqual(self.limiter.buckets['key'].tokens, 1)
+
+    def test_least_recently_used_dropped(self):
+        for key in ('a', 'b', 'a', 'c'):
+            self.limiter.acquire(key, 1, 1)
+        self.assertEqual(list(self.limiter.buckets), ['a', 'c'])
+
+
+class TestLimiterSync(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.pipe = MagicMock()
+        self.pipe.execute = AsyncMock()
+        client = MagicMock()
+        client.pipeline.return_value.__aenter__.return_value = self.pipe
+        self.limiter = LocalLimiter(10, client)
+
+    async def test_others_consumption_deducted(self):
+        for _ in range(3):
+            self.limiter.acquire('key', 10, 0.001)
+        # the first sync only learns the total, the 20 tokens taken before are history
+        self.pipe.execute.return_value = [23.0, True]
+        await self.limiter.sync()
+        self.pipe.incrbyfloat.assert_called_once_with('ratelimit:key', 3)
+        bucket = self.limiter.buckets['key']
+        self.assertAlmostEqual(bucket.tokens, 7, places=2)
+        self.assertEqual((bucket.taken, bucket.seen), (0, 23.0))
+
+        # then the other workers took 4 tokens
+        self.limiter.acquire('key', 10, 0.001)
+        self.pipe.execute.return_value = [28.0, True]
+        await self.limiter.sync()
+        self.assertAlmostEqual(bucket.tokens, 2, places=2)
+
+    async def test_idle_buckets_not_synced(self):
+        with patch('src.services.limiter.time.monotonic', return_value=0):
+            self.limiter.acquire('idle', 10, 1)
+        with patch('src.services.limiter.time.monotonic', return_value=100):
+            self.limiter.acquire('active', 10, 1)
+            self.pipe.execute.return_value = [1.0, True]
+            await self.limiter.sync()
+        self.pipe.incrbyfloat.assert_called_once_with('ratelimit:active', 1)
+
+    async def test_expired_counter_restarts(self):
+        self.limiter.acquire('key', 10, 0.001)
+        self.limiter.buckets['key'].seen = 50.0
+        self.pipe.execute.return_value = [1.0, True]
+        await self.limiter.sync()
+        bucket = self.limiter.buckets['key']
+        self.assertAlmostEqual(bucket.tokens, 9, places=2)
+        self.assertEqual(bucket.seen, 1.0)
+
+
+class TestLocalRateLimiter(unittest.TestCase):
+    def test_route(self):
+        local_limiter.clear()
+        self.addCleanup(local_limiter.clear)
+        app = FastAPI()
+
+        @app.get('/', dependencies=[Depends(LocalRateLimiter(times=2, minutes=1))])
+        async def route():
+            return {}
+
+        client = TestClient(app)
+        self.assertEqual([client.get('/').status_code for _ in range(3)], [200, 200, 429])
+        self.assertEqual(client.get('/').headers['Retry-After'], '30')
+        # named by the route, not by the order the limiters were created in
+        self.assertEqual(list(local_limiter.buckets), ['route:GET:/:testclient:/'])
+
+    def test_named(self):
+        local_limiter.clear()
+        self.addCleanup(local_limiter.clear)
+        app = FastAPI()
+
+        @app.get('/items/{item_id}', dependencies=[Depends(LocalRateLimiter(times=1, minutes=1)),
+                                                   Depends(LocalRateLimiter(times=5, minutes=1, name='burst'))])
+        async def route(item_id: int):
+            return {}
+
+        client = TestClient(app)
+        self.assertEqual(client.get('/items/1').status_code, 200)
+        self.assertEqual(sorted(local_limiter.buckets),
+                         ['route:GET:/items/{item_id}:testclient:/items/1', 'route:burst:testclient:/items/1'])
+
+    def test_backend_per_route(self):
+        self.assertIsInstance(rate_limiter(times=2, seconds=1, backend='redis'), RateLimiter)
+        self.assertIsInstance(rate_limiter(times=2, seconds=1, backend='local'), LocalRateLimiter)
+        with patch('src.services.limiter.settings.rate_limit_backend', 'redis'):
+            self.assertIsInstance(rate_limiter(times=2, seconds=1), RateLimiter)
+
+
+class TestUserRateLimit(unittest.TestCase):
+    def setUp(self):
+        local_limiter.clear()
+        self.addCleanup(local_limiter.clear)
+        self.user = CachedUser(1, 'user@example.com', 'username', None, Role.user, True, True, None, None, None, None)
+        app = FastAPI()
+        app.middleware('http')(rate_limit_headers_middleware)
+        app.dependency_overrides[auth_service.get_current_user] = lambda: self.user
+
+        @app.post('/upload', dependencies=[Depends(UserRateLimit('upload'))])
+        async def upload():
+            return {}
+
+        @app.get('/read', dependencies=[Depends(UserRateLimit('read'))])
+        async def read():
+            return Response(b'raw')
+
+        self.client = TestClient(app)
+
+    def test_headers(self):
+        response = self.client.get('/read')
+        self.assertEqual(response.content, b'raw')
+        self.assertEqual(response.headers['X-RateLimit-Limit'], str(RATE_LIMITS['read']['user']))
+        self.assertEqual(response.headers['X-RateLimit-Remaining'], str(RATE_LIMITS['read']['user'] - 1))
+        self.assertEqual(response.headers['X-RateLimit-Reset'], '1')
+
+    def test_budget_per_operation_and_user(self):
+        times = RATE_LIMITS['upload']['user']
+        statuses = [self.client.post('/upload').status_code for _ in range(times + 1)]
+        self.assertEqual(statuses, [200] * times + [429])
+        response = self.client.post('/upload')
+        self.assertEqual(response.headers['X-RateLimit-Remaining'], '0')
+        self.assertIn('Retry-After', response.headers)
+        # other operations and other users keep their budgets
+        self.assertEqual(self.client.get('/read').status_code, 200)
+        self.user = CachedUser(2, 'other@example.com', 'other', None, Role.user, True, True, None, None, None, None)
+        self.assertEqual(self.client.post('/upload').status_code, 200)
+
+    def test_tier_by_role(self):
+        self.user = CachedUser(3, 'admin@example.com', 'admin', None, Role.admin, True, True, None, None, None, None)
+        response = self.client.post('/upload')
+        self.assertEqual(response.headers['X-RateLimit-Limit'], str(RATE_LIMITS['upload']['admin']))
+
+
+if __name__ == '__main__':
+    unittest.main()
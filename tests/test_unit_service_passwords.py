@@ -0,0 +1,67 @@
+import unittest
+from unittest.mock import patch
+
+from src.services import passwords
+from src.services.auth import auth_service
+from src.services.executor import CPUExecutor
+
+
+def rounds_of(hashed: str) -> int:
+    return int(hashed.split('$')[2])
+
+
+class TestPasswords(unittest.TestCase):
+    def test_hash_rounds(self):
+        self.assertEqual(rounds_of(passwords.hash_password('password', 4)), 4)
+
+    def test_weaker_hash_updated(self):
+        hashed = passwords.hash_password('password', 4)
+        verified, new_hash = passwords.verify_and_update('password', hashed, 5)
+        self.assertTrue(verified)
+        self.assertEqual(rounds_of(new_hash), 5)
+        self.assertTrue(passwords.verify_password('password', new_hash))
+
+    def test_current_or_stronger_hash_kept(self):
+        hashed = passwords.hash_password('password', 5)
+        self.assertEqual(passwords.verify_and_update('password', hashed, 5), (True, None))
+        self.assertEqual(passwords.verify_and_update('password', hashed, 4), (True, None))
+
+    def test_wrong_password_not_updated(self):
+        hashed = passwords.hash_password('password', 4)
+        self.assertEqual(passwords.verify_and_update('wrong', hashed, 5), (False, None))
+
+    def test_calibrate(self):
+        with patch('src.services.passwords.time.perf_counter', side_effect=[0, 0.010]):
+            self.assertEqual(passwords.calibrate(100, 4, 14), 7)
+        with patch('src.services.passwords.time.perf_counter', side_effect=[0, 0.010]):
+            self.assertEqual(passwords.calibrate(100, 4, 6), 6)
+        with patch('src.services.passwords.time.perf_counter', side_effect=[0, 1]):
+            self.assertEqual(passwords.calibrate(100, 4, 14), 4)
+
+
+class TestAuthPasswords(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        for patcher in (patch('src.services.auth.executor', CPUExecutor('thread', 1)),
+                        patch.object(auth_service, 'hash_rounds', 5)):
+            patcher.start()
+            self.addCleanup(patcher.stop)
+
+    async def test_hash_uses_hash_rounds(self):
+        self.assertEqual(rounds_of(await auth_service.get_password_hash('password')), 5)
+
+    async def test_verify_and_update(self):
+        verified, new_hash = await auth_service.verify_and_update('password', passwords.hash_password('password', 4))
+        self.assertTrue(verified)
+        self.assertEqual(rounds_of(new_hash), 5)
+
+    async def test_calibrate_password_hash(self):
+        with patch('src.services.auth.settings.bcrypt_target_ms', 0):
+            self.assertEqual(await auth_service.calibrate_password_hash(), 5)
+        with patch('src.services.auth.settings.bcrypt_target_ms', 1000), \
+                patch('src.services.auth.passwords.calibrate', return_value=11):
+            self.assertEqual(await auth_service.calibrate_password_hash(), 11)
+        self.assertEqual(auth_service.hash_rounds, 11)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,36 @@
+import io
+import unittest
+from unittest.mock import MagicMock, patch
+
+from fastapi import HTTPException
+
+from src.services.photos import upload_photo
+
+
+class TestUploadPhoto(unittest.IsolatedAsyncioTestCase):
+    @patch('src.services.storage.cloudinary.uploader.upload')
+    async def test_upload_photo(self, upload_mock):
+        upload_mock.return_value = {'secure_url': 'https://res.cloudinary.com/demo/image/upload/v1/photo.jpg'}
+        file = MagicMock(file=io.BytesIO(b'image'))
+        url, public_id = await upload_photo(file)
+        self.assertEqual(url, 'https://res.cloudinary.com/demo/image/upload/v1/photo.jpg')
+        self.assertEqual(upload_mock.call_args.kwargs['public_id'], public_id)
+
+    @patch('cloudinary.api.resource')
+    @patch('src.services.storage.cloudinary.uploader.upload')
+    async def test_upload_photo_single_round_trip(self, upload_mock, resource_mock):
+        upload_mock.return_value = {'secure_url': 'https://res.cloudinary.com/demo/image/upload/v1/photo.jpg'}
+        await upload_photo(MagicMock(file=io.BytesIO(b'image')))
+        upload_mock.assert_called_once()
+        resource_mock.assert_not_called()
+
+    @patch('src.services.photos.storage')
+    async def test_not_an_image(self, storage_mock):
+        storage_mock.upload.side_effect = ValueError('not an image')
+        with self.assertRaises(HTTPException) as context:
+            await upload_photo(MagicMock(file=io.BytesIO(b'<svg/>'), filename='x.svg'))
+        self.assertEqual(context.exception.status_code, 400)
+
+
+if __name__ == '__main__':
+    unittest.main()
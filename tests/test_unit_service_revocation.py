@@ -0,0 +1,142 @@
+import asyncio
+import time
+import unittest
+from unittest.mock import AsyncMock, MagicMock
+from uuid import uuid4
+
+from redis.exceptions import ConnectionError
+
+from src.services.invalidation import MemoryInvalidationBus
+from src.services.revocation import BloomFilter, RevocationList
+
+
+async def scan(*keys):
+    for key in keys:
+        yield key
+
+
+class TestBloomFilter(unittest.TestCase):
+    def test_no_false_negatives(self):
+        bloom = BloomFilter(1 << 16, 7)
+        keys = [uuid4().hex for _ in range(1000)]
+        for key in keys:
+            bloom.add(key)
+        self.assertTrue(all(key in bloom for key in keys))
+
+    def test_false_positive_rate(self):
+        bloom = BloomFilter(1 << 16, 7)
+        for _ in range(1000):
+            bloom.add(uuid4().hex)
+        false_positives = sum(uuid4().hex in bloom for _ in range(10000))
+        self.assertLess(false_positives, 50)
+
+
+class TestRevocationList(unittest.IsolatedAsyncioTestCase):
+    def setUp(self):
+        self.redis = AsyncMock()
+        self.bus = MemoryInvalidationBus()
+        self.revocations = RevocationList(self.redis, self.bus)
+        self.revocations.synced = True
+
+    async def test_not_revoked_without_redis(self):
+        self.assertFalse(await self.revocations.is_revoked(uuid4().hex))
+        self.assertFalse(await self.revocations.is_revoked(None))
+        self.redis.exists.assert_not_called()
+
+    async def test_revoke(self):
+        await self.revocations.revoke('jti', time.time() + 60)
+        key, value = self.redis.set.call_args.args
+        self.assertEqual((key, value), ('revoked:jti', 1))
+        self.assertTrue(55 <= self.redis.set.call_args.kwargs['ex'] <= 60)
+        self.assertIn('jti', self.revocations.bloom)
+        self.assertTrue(await self.revocations.is_revoked('jti'))
+        self.redis.exists.assert_not_called()
+        # once a sync has cleared the recent ones, a filter hit is confirmed in redis
+        self.revocations.recent = set()
+        self.redis.exists.return_value = 1
+        self.assertTrue(await self.revocations.is_revoked('jti'))
+        self.redis.exists.assert_awaited_once_with('revoked:jti')
+
+    async def test_expired_token_not_stored(self):
+        await self.revocations.revoke('jti', time.time() - 1)
+        await self.revocations.revoke(None, time.time() + 60)
+        self.redis.set.assert_not_called()
+
+    async def test_false_positive_checked_in_redis(self):
+        self.revocations.bloom.add('jti')
+        self.redis.exists.return_value = 0
+        self.assertFalse(await self.revocations.is_revoked('jti'))
+
+    async def test_redis_down(self):
+        self.revocations.bloom.add('jti')
+        self.redis.exists.side_effect = ConnectionError
+        self.assertTrue(await self.revocations.is_revoked('jti'))
+        self.revocations.synced = False
+        self.assertFalse(await self.revocations.is_revoked('jti'))
+
+    async def test_unsynced_checks_redis(self):
+        self.revocations.synced = False
+        self.redis.exists.return_value = 1
+        self.assertTrue(await self.revocations.is_revoked('jti'))
+
+    async def test_sync(self):
+        self.revocations.bloom.add('expired')
+        self.revocations.synced = False
+        self.redis.scan_iter = MagicMock(return_value=scan('revoked:a', 'revoked:b'))
+        await self.revocations.sync()
+        self.assertTrue(self.revocations.synced)
+        self.assertIn('a', self.revocations.bloom)
+        self.assertIn('b', self.revocations.bloom)
+        self.assertNotIn('expired', self.revocations.bloom)
+
+    async def test_revoked_elsewhere(self):
+        self.bus.dispatch('revoked', 'jti')
+        self.assertIn('jti', self.revocations.bloom)
+        self.assertTrue(await self.revocations.is_revoked('jti'))
+        self.redis.exists.assert_not_called()
+
+    async def test_resync_after_missed_messages(self):
+        self.redis.scan_iter = MagicMock(return_value=scan('revoked:a'))
+        self.bus.dispatch_all()
+        self.assertFalse(self.revocations.synced)
+        await asyncio.wait_for(self.revocations.sync_task, 1)
+        self.assertTrue(self.revocations.synced)
+        self.assertIn('a', self.revocations.bloom)
+
+    async def test_revoke_redis_down(self):
+        self.redis.set.side_effect = ConnectionError
+        self.redis.exists.side_effect = ConnectionError
+        self.revocations.synced = False
+        exp = time.time() + 60
+        await self.revocations.revoke('jti', exp)
+        self.assertIn('jti', self.revocations.bloom)
+        self.assertEqual(self.revocations.pending, {'jti': exp})
+        # rejected by this worker at once, before any sync
+        self.assertTrue(await self.revocations.is_revoked('jti'))
+        self.assertFalse(await self.revocations.is_revoked('other'))
+        # stored once redis is back
+        self.redis.set.side_effect = None
+        self.redis.scan_iter = MagicMock(return_value=scan('revoked:jti'))
+        await self.revocations.sync()
+        self.assertEqual(self.redis.set.call_args.args, ('revoked:jti', 1))
+        self.assertEqual(self.revocations.pending, {})
+
+    async def test_single_resync_at_a_time(self):
+        self.redis.scan_iter = MagicMock(side_effect=lambda **_: scan('revoked:a'))
+        self.bus.dispatch_all()
+        task = self.revocations.sync_task
+        self.bus.dispatch_all()
+        self.assertIs(self.revocations.sync_task, task)
+        await asyncio.wait_for(task, 1)
+        self.redis.scan_iter.assert_called_once()
+
+    async def test_resync_failure_logged(self):
+        self.redis.scan_iter = MagicMock(side_effect=ConnectionError)
+        self.bus.dispatch_all()
+        with self.assertLogs('src.services.revocation', 'WARNING'):
+            await asyncio.wait_for(self.revocations.sync_task, 1)
+        self.assertFalse(self.revocations.synced)
+
+
+if __name__ == '__main__':
+    unittest.main()
@@ -0,0 +1,125 @@
+import io
+import os
+import tempfile
+import unittest
+from pathlib import Path
+from unittest.mock import MagicMock, patch
+
+from PIL import Image
+
+from src.services.image_engine import preset_hash
+from src.services.storage import CloudinaryStorage, LocalStorage, cloudinary_transformed_url
+
+
+def image_file(fmt: str) -> io.BytesIO:
+    image = io.BytesIO()
+    Image.new('RGB', (300, 200), 'red').save(image, format=fmt)
+    image.seek(0)
+    return image
+
+
+class TestLocalStorage(unittest.TestCase):
+    def setUp(self):
+        self.tmp = tempfile.TemporaryDirectory()
+        self.storage = LocalStorage(self.tmp.name, 'http://localhost:8000/media/')
+
+    def tearDown(self):
+        self.tmp.cleanup()
+
+    def test_upload(self):
+        url, public_id = self.storage.upload(MagicMock(file=image_file('PNG'), filename='photo.JPG'))
+        # named by the detected format, not by the client's file name
+        self.assertTrue(public_id.endswith('.png'))
+        self.assertEqual(url, f'http://localhost:8000/media/{public_id}')
+        self.assertEqual((Path(self.tmp.name) / public_id).read_bytes(), image_file('PNG').getvalue())
+
+    def test_upload_not_an_image(self):
+        for content, filename in ((b'<script>alert(1)</script>', 'x.html'),
+                                  (b'<svg xmlns="http://www.w3.org/2000/svg"/>', 'x.svg'),
+                                  (image_file('BMP').getvalue(), 'x.bmp')):
+            with self.subTest(filename=filename), self.assertRaises(ValueError):
+                self.storage.upload(MagicMock(file=io.BytesIO(content), filename=filename))
+        self.assertEqual(list(Path(self.tmp.name).iterdir()), [])
+
+    def test_upload_same_content_stored_once(self):
+        _, first = self.storage.upload(MagicMock(file=image_file('JPEG'), filename='a.png'))
+        _, second = self.storage.upload(MagicMock(file=image_file('JPEG'), filename='b.gif'))
+        self.assertEqual(first, second)
+        self.assertTrue(first.endswith('.jpg'))
+        self.assertEqual(len(list(Path(self.tmp.name).iterdir())), 1)
+
+    def test_delete(self):
+        _, public_id = self.storage.upload(MagicMock(file=image_file('PNG'), filename='a.png'))
+        derived = Path(self.tmp.name) / 'derived' / Path(public_id).stem
+        derived.mkdir(parents=True)
+        (derived / 'preset.png').write_bytes(b'derived')
+        self.assertTrue(self.storage.delete(public_id))
+        self.assertFalse(self.storage.delete(public_id))
+        self.assertEqual(list(Path(self.tmp.name).iterdir()), [Path(self.tmp.name) / 'derived'])
+        self.assertFalse(derived.exists())
+
+    def test_delete_skips_file_uploaded_again(self):
+        _, public_id = self.storage.upload(MagicMock(file=image_file('PNG'), filename='a.png'))
+        path = Path(self.tmp.name) / public_id
+        os.utime(path, (1000, 1000))
+        # uploaded again after the photo was deleted
+        self.assertFalse(self.storage.delete(public_id, unmodified_since=500))
+        self.assertEqual(list(Path(self.tmp.name).iterdir()), [path])
+        self.assertTrue(self.storage.delete(public_id, unmodified_since=1000))
+        self.assertFalse(path.exists())
+
+    def test_failed_upload_leaves_no_file(self):
+        file = MagicMock(filename='a.png')
+        file.file.read.side_effect = [b'ima', OSError]
+        with self.assertRaises(OSError):
+            self.storage.upload(file)
+        self.assertEqual(list(Path(self.tmp.name).iterdir()), [])
+
+    def test_transform_url(self):
+        _, public_id = self.storage.upload(MagicMock(file=image_file('JPEG'), filename='photo.jpg'))
+        preset = [{'width': 100, 'crop': 'scale'}, {'fetch_format': 'png'}]
+        url = self.storage.transform_url(public_id, preset)
+        derivative = f'derived/{public_id[:-4]}/{preset_hash(preset)}.png'
+        self.assertEqual(url, f'http://localhost:8000/media/{derivative}')
+        self.assertFalse((Path(self.tmp.name) / derivative).exists())
+        self.storage.render_derivative(public_id, preset)
+        with Image.open(Path(self.tmp.name) / derivative) as result:
+            self.assertEqual(result.size, (100, 67))
+
+    @patch('src.services.storage.render')
+    def test_render_derivative_cached(self, render_mock):
+        preset = [{'radius': 'max'}]
+        derivative = self.storage.derivative_path('abc.png', preset)
+        derivative.parent.mkdir(parents=True)
+        derivative.write_bytes(b'rendered')
+        self.storage.render_derivative('abc.png', preset)
+        render_mock.assert_not_called()
+
+    @patch('src.services.storage.render')
+    def test_derivative_stays_under_root(self, render_mock):
+        with self.assertRaises(ValueError):
+            self.storage.render_derivative('abc.png', [{'fetch_format': 'png/../../../../escaped'}])
+        render_mock.assert_not_called()
+        self.assertEqual(list(Path(self.tmp.name).iterdir()), [])
+
+
+class TestCloudinaryStorage(unittest.TestCase):
+    def setUp(self):
+        cloudinary_transformed_url.cache_clear()
+        self.storage = CloudinaryStorage()
+
+    def test_transform_url(self):
+        url = self.storage.transform_url('abc', [{'width': 200, 'crop': 'scale'}, {'radius': 'max'}])
+        self.assertTrue(url.endswith('/image/upload/c_scale,w_200/r_max/abc'))
+
+    @patch('src.services.storage.cloudinary.CloudinaryImage')
+    def test_transform_url_memoized(self, image_mock):
+        image_mock.return_value.build_url.return_value = 'https://res.cloudinary.com/name/image/upload/r_max/abc'
+        self.storage.transform_url('abc', [{'radius': 'max', 'crop': 'scale'}])
+        url = self.storage.transform_url('abc', [{'crop': 'scale', 'radius': 'max'}])
+        self.assertEqual(url, 'https://res.cloudinary.com/name/image/upload/r_max/abc')
+        image_mock.assert_called_once_with('abc')
+
+
+if __name__ == '__main__':
+    unittest.main()